@@ -1,20 +1,46 @@
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Depends, Request, Query
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
 import logging
 import uuid
-import os
 import json
-from typing import List, Optional
+import zipfile
+import asyncio
+import base64
+import mimetypes
+from datetime import date, datetime
+from collections import Counter
+from typing import List, Optional, Tuple, Union
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, or_, and_, type_coerce, String, text
 from pydantic import BaseModel
 
-from app.models.document_schemas import UploadResponse
-from app.utils.file_utils import save_upload_file, UPLOAD_DIR
-from app.db.database import get_db
-from app.db.models import ExtractionJobs
-from app.services.document_processor import schedule_document_processing
+from app.models.document_schemas import UploadResponse, BatchUploadResponse, RecentDocumentPage, DocumentSearchResponse
+from app.utils.file_utils import (
+    save_upload_file, UPLOAD_DIR, MAX_BATCH_FILES, UploadTooLargeError, count_batch_documents, save_batch_files
+)
+from app.db.database import IS_SQLITE, get_db
+from app.db.models import ExtractionJobs, DocumentFields
+from app.services.field_index import (
+    sync_document_fields, clear_document_fields, fts_available, fts_query, name_tokens,
+    normalize_name, normalize_number, FTS_TABLE
+)
+from app.services.document_processor import (
+    schedule_document_processing, scheduler, lookup_cached_result, PIPELINE_MODES, REPROCESS_MODES
+)
+from app.services.artifacts import manifest_path
+from app.services.job_queue import QueueFullError
+from app.services.job_leases import lease_new_job
+from app.services.metrics import record_error, time_stage
+from app.services.previews import ensure_rendition, rendition_fingerprint, rendition_media_type
+from app.services.retention import remove_job_files
+from app.services.result_cache import result_cache
+from app.services.result_export import (
+    export_stream, export_checkpoint, format_checkpoint, parse_checkpoint, parquet_available,
+    EXPORT_FORMATS, EXPORT_MEDIA_TYPES, EXPORT_STATUSES
+)
+from app.services.events import broker, job_event, format_sse, TERMINAL_STATUSES
 
 router = APIRouter()
 
@@ -24,23 +50,50 @@ logger = logging.getLogger(__name__)
 class UpdateExtractedFieldsRequest(BaseModel):
     extracted_fields_json: dict
 
+def _queue_full_exception(retry_after: int) -> HTTPException:
+    logger.warning(f"Upload rejected, processing queue is full (retry after {retry_after}s)")
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy processing other documents. Please retry shortly.",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def _apply_cached_result(job: ExtractionJobs, cached_result: dict):
+    """Complete a job from a cached extraction result"""
+    job.document_type = cached_result.get("document_type", {}).get("doc_type", "unknown")
+    job.extracted_fields_json = json.dumps(cached_result)
+    job.status = "completed"
+
+def _validate_pipeline_mode(pipeline_mode: Optional[str]):
+    if pipeline_mode is not None and pipeline_mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid pipeline mode. Expected one of: {', '.join(PIPELINE_MODES)}")
+
 @router.post("/upload", response_model=UploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
     original_file_name: str = Form(...),
     document_id: str = Form(...),  # Accept UUID from frontend
-    db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    pipeline_mode: Optional[str] = Form(None),  # "two_step" or "single_call", defaults to PIPELINE_MODE
+    db: Session = Depends(get_db)
 ):
     """
     Receives an uploaded file, its original filename, and a UUID.
     Saves the file as <uuid>.<extension>.
     Also creates an entry in the ExtractionJobs table and schedules processing with LLM.
+    Rejects the upload with 503 and a Retry-After header when the processing queue is full.
     """
     if not file.filename:
         logger.error("Upload attempt with no filename.")
         raise HTTPException(status_code=400, detail="No filename provided with the file.")
 
+    _validate_pipeline_mode(pipeline_mode)
+
+    # Fail fast before touching the disk if the processing queue has no room
+    try:
+        scheduler.check_capacity()
+    except QueueFullError as e:
+        raise _queue_full_exception(e.retry_after)
+
     try:
         # Use the UUID provided by the frontend
         generated_uuid = document_id
@@ -53,8 +106,10 @@ async def upload_document(
             raise HTTPException(status_code=400, detail="Invalid UUID format")
         
         # Save file to `backend/uploads`
-        saved_path = save_upload_file(upload_file=file, uuid=generated_uuid)
-        logger.info(f"File saved: {saved_path} | Original name: {original_file_name} | UUID: {generated_uuid}")
+        with time_stage("upload_write"):
+            saved = await save_upload_file(upload_file=file, uuid=generated_uuid)
+        saved_path = saved.path
+        logger.info(f"File saved: {saved_path} ({saved.size} bytes) | Original name: {original_file_name} | UUID: {generated_uuid}")
         
         # Get file extension to determine file type
         _, extension = Path(file.filename).suffix.split('.', 1) if '.' in Path(file.filename).suffix else ('', Path(file.filename).suffix[1:])
@@ -67,14 +122,40 @@ async def upload_document(
             original_filename=original_file_name,
             stored_filename=saved_path.name,
             upload_path=str(saved_path),
-            status="processing"
+            content_hash=saved.sha256,
+            file_size=saved.size,
+            status="processing",
+            pipeline_mode=pipeline_mode
         )
         
+        # An identical document was extracted before: complete the job without calling the LLM
+        _, cached_result = await run_in_threadpool(lookup_cached_result, saved_path, pipeline_mode, saved.sha256)
+        if cached_result is not None:
+            logger.info(f"Result cache hit for UUID: {generated_uuid}")
+            _apply_cached_result(extraction_job, cached_result)
+        else:
+            lease_new_job(extraction_job)
+        
         db.add(extraction_job)
+        if cached_result is not None:
+            # The job row has to exist before the fields row that references it
+            db.flush()
+            sync_document_fields(db, extraction_job.id, cached_result)
         db.commit()
         
         # Schedule the document for processing with LLM in the background
-        schedule_document_processing(generated_uuid, background_tasks, db)
+        try:
+            if cached_result is None:
+                schedule_document_processing(generated_uuid)
+        except QueueFullError as e:
+            # The queue filled up while the file was being saved
+            extraction_job.status = "error"
+            extraction_job.extracted_fields_json = json.dumps({"error": "Processing queue is full"})
+            db.commit()
+            await broker.publish(job_event(extraction_job))
+            raise _queue_full_exception(e.retry_after)
+        
+        await broker.publish(job_event(extraction_job))
         
         return {
             "message": "File uploaded successfully",
@@ -82,13 +163,379 @@ async def upload_document(
             "filename": saved_path.name,  # This is <uuid>.<extension>
             "original_filename": original_file_name
         }
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        logger.warning(f"Upload rejected for {file.filename}: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
     except IOError as e:
         logger.error(f"Could not save file {file.filename}: {e}")
         raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
     except Exception as e:
+        record_error("upload", e)
         logger.error(f"An unexpected error occurred during file upload: {file.filename}, error: {e}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
+@router.post("/batch", response_model=BatchUploadResponse)
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    pipeline_mode: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Receives several files and/or ZIP archives of documents in one request.
+    Every document is saved under a server-generated UUID, all ExtractionJobs
+    rows are inserted in a single transaction and queued for processing.
+    Returns a batch id that can be polled at /batch/{batch_id}.
+    """
+    _validate_pipeline_mode(pipeline_mode)
+
+    try:
+        document_count = await run_in_threadpool(count_batch_documents, files)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="One of the uploaded archives is not a valid ZIP file.")
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if document_count == 0:
+        raise HTTPException(status_code=400, detail="No supported documents found in the upload.")
+    if document_count > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Batch contains {document_count} documents, the limit is {MAX_BATCH_FILES}.")
+
+    # Reject the whole batch up front rather than queueing part of it
+    try:
+        scheduler.check_capacity(document_count)
+    except QueueFullError as e:
+        raise _queue_full_exception(e.retry_after)
+
+    try:
+        with time_stage("upload_write"):
+            saved, skipped = await run_in_threadpool(save_batch_files, files)
+        cached_results = await run_in_threadpool(
+            lambda: [
+                lookup_cached_result(entry["upload"].path, pipeline_mode, entry["upload"].sha256)[1]
+                for entry in saved
+            ]
+        )
+
+        batch_id = str(uuid.uuid4())
+        jobs = []
+        for entry, cached_result in zip(saved, cached_results):
+            job = ExtractionJobs(
+                id=entry["uuid"],
+                file_type=entry["file_type"],
+                original_filename=entry["original_filename"],
+                stored_filename=entry["upload"].path.name,
+                upload_path=str(entry["upload"].path),
+                content_hash=entry["upload"].sha256,
+                file_size=entry["upload"].size,
+                status="processing",
+                pipeline_mode=pipeline_mode,
+                batch_id=batch_id
+            )
+            if cached_result is not None:
+                _apply_cached_result(job, cached_result)
+            else:
+                lease_new_job(job)
+            jobs.append(job)
+
+        # One transaction for the whole batch
+        db.add_all(jobs)
+        # Job rows first, then the fields rows that reference them
+        db.flush()
+        for job, cached_result in zip(jobs, cached_results):
+            if cached_result is not None:
+                sync_document_fields(db, job.id, cached_result)
+        db.commit()
+        logger.info(f"Batch {batch_id} created with {len(jobs)} documents ({len(skipped)} skipped)")
+
+        rejected = False
+        for job in jobs:
+            if job.status != "processing":
+                continue
+            try:
+                schedule_document_processing(job.id)
+            except QueueFullError:
+                job.status = "error"
+                job.extracted_fields_json = json.dumps({"error": "Processing queue is full"})
+                rejected = True
+        if rejected:
+            db.commit()
+        for job in jobs:
+            await broker.publish(job_event(job))
+
+        return {
+            "message": f"{len(jobs)} documents uploaded successfully",
+            "batch_id": batch_id,
+            "jobs": [
+                {
+                    "uuid": job.id,
+                    "filename": job.stored_filename,
+                    "original_filename": job.original_filename,
+                    "status": job.status
+                }
+                for job in jobs
+            ],
+            "skipped": skipped
+        }
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IOError as e:
+        logger.error(f"Could not save batch files: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
+    except Exception as e:
+        db.rollback()
+        record_error("batch_upload", e)
+        logger.error(f"An unexpected error occurred during batch upload: {e}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
+@router.get("/batch/{batch_id}", response_model=dict)
+async def get_batch_status(
+    batch_id: str,
+    db: Session = Depends(get_db)
+):
+    """Get the aggregate status of a batch upload and the status of each of its jobs"""
+    jobs = db.query(
+        ExtractionJobs.id,
+        ExtractionJobs.original_filename,
+        ExtractionJobs.status,
+        ExtractionJobs.document_type
+    ).filter(ExtractionJobs.batch_id == batch_id).all()
+    if not jobs:
+        raise HTTPException(status_code=404, detail=f"Batch with ID {batch_id} not found")
+
+    counts = Counter(job.status for job in jobs)
+    return {
+        "batch_id": batch_id,
+        "status": "processing" if counts.get("processing") else "completed",
+        "total": len(jobs),
+        "counts": dict(counts),
+        "jobs": [
+            {
+                "id": job.id,
+                "original_filename": job.original_filename,
+                "status": job.status,
+                "document_type": job.document_type
+            }
+            for job in jobs
+        ]
+    }
+
+# Interval between keep-alive comments on idle event streams
+SSE_KEEPALIVE_SECONDS = 15
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _summary_event(event: dict) -> dict:
+    """Drop the extracted fields from job events sent to list subscribers"""
+    return {key: value for key, value in event.items() if key != "extracted_fields"}
+
+async def _event_stream(request: Request, queue: asyncio.Queue, initial_events: List[dict], job_id: Optional[str] = None):
+    """
+    Yield server-sent events from a subscriber queue until the client goes away.
+    Streams for a single job end once the job reaches a terminal status.
+    """
+    for event in initial_events:
+        yield format_sse(event)
+        if job_id is not None and event.get("status") in TERMINAL_STATUSES:
+            return
+    while not await request.is_disconnected():
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+            continue
+        if job_id is None:
+            if event.get("type") == "partial":
+                # Fields streamed in before the result is saved only matter to the job's own view
+                continue
+            yield format_sse(_summary_event(event) if event.get("type") == "job" else event)
+            continue
+        yield format_sse(event)
+        if event.get("type") in ("cleared", "deleted") or event.get("status") in TERMINAL_STATUSES:
+            return
+
+@router.get("/events/recent")
+async def stream_recent_document_events(request: Request):
+    """Server-sent events for every job created, updated, deleted or cleared, without extracted fields"""
+    async def stream():
+        async with broker.subscribe() as queue:
+            async for chunk in _event_stream(request, queue, []):
+                yield chunk
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/{job_id}/events")
+async def stream_document_events(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Server-sent events for one job: its current state first, then every status
+    transition, with "partial" events carrying fields extracted so far when
+    LLM_STREAMING is on. The stream closes after the job completes or fails.
+    """
+    # Subscribe before reading the snapshot so no transition falls in between
+    queue = broker.open_subscription(job_id)
+    job = db.query(ExtractionJobs).filter(ExtractionJobs.id == job_id).first()
+    if not job:
+        broker.close_subscription(queue, job_id)
+        raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
+    snapshot = job_event(job)
+    # Release the connection now rather than holding it for the life of the stream
+    db.close()
+
+    async def stream():
+        try:
+            async for chunk in _event_stream(request, queue, [snapshot], job_id):
+                yield chunk
+        finally:
+            broker.close_subscription(queue, job_id)
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# Result limits for field search
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+
+@router.get("/search", response_model=DocumentSearchResponse)
+async def search_documents(
+    document_number: Optional[str] = Query(None, description="Passport, license, card or document number"),
+    name: Optional[str] = Query(None, description="Name words, matched as prefixes in any order"),
+    first_name: Optional[str] = Query(None),
+    last_name: Optional[str] = Query(None),
+    date_of_birth: Optional[date] = Query(None),
+    expires_from: Optional[date] = Query(None, description="Earliest expiry date, inclusive"),
+    expires_to: Optional[date] = Query(None, description="Latest expiry date, inclusive"),
+    document_type: Optional[str] = Query(None, description="passport, ead, driver_license or other"),
+    country: Optional[str] = Query(None),
+    state: Optional[str] = Query(None),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """
+    Search completed jobs by their normalized key fields.
+    Filters are combined with AND and answered from the indexed document_fields
+    table; values are normalized the same way as the stored fields.
+    """
+    query = db.query(
+        DocumentFields,
+        ExtractionJobs.original_filename,
+        ExtractionJobs.status,
+        ExtractionJobs.created_at
+    ).join(ExtractionJobs, ExtractionJobs.id == DocumentFields.job_id)
+    filtered = False
+    
+    if document_number:
+        query = query.filter(DocumentFields.document_number == normalize_number(document_number))
+        filtered = True
+    if first_name:
+        query = query.filter(DocumentFields.first_name == normalize_name(first_name))
+        filtered = True
+    if last_name:
+        query = query.filter(DocumentFields.last_name == normalize_name(last_name))
+        filtered = True
+    if name:
+        tokens = name_tokens(name)
+        if not tokens:
+            raise HTTPException(status_code=400, detail="Name must contain letters or digits")
+        if fts_available(db):
+            query = query.filter(text(
+                f"(document_fields.rowid, document_fields.job_id) IN "
+                f"(SELECT rowid, job_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :name_query)"
+            ).bindparams(name_query=fts_query(tokens)))
+        else:
+            # Without FTS every word has to be a complete first or last name
+            for token in tokens:
+                query = query.filter(or_(DocumentFields.first_name == token, DocumentFields.last_name == token))
+        filtered = True
+    if date_of_birth:
+        query = query.filter(DocumentFields.date_of_birth == date_of_birth)
+        filtered = True
+    if expires_from:
+        query = query.filter(DocumentFields.expiry_date >= expires_from)
+        filtered = True
+    if expires_to:
+        query = query.filter(DocumentFields.expiry_date <= expires_to)
+        filtered = True
+    if document_type:
+        query = query.filter(DocumentFields.document_type == document_type.lower())
+        filtered = True
+    if country:
+        query = query.filter(DocumentFields.country == normalize_name(country))
+        filtered = True
+    if state:
+        query = query.filter(DocumentFields.state == normalize_name(state))
+        filtered = True
+    if not filtered:
+        raise HTTPException(status_code=400, detail="At least one search filter is required")
+    
+    if expires_from or expires_to:
+        query = query.order_by(DocumentFields.expiry_date, DocumentFields.job_id)
+    else:
+        query = query.order_by(desc(ExtractionJobs.created_at), desc(ExtractionJobs.id))
+    
+    items = []
+    for fields, original_filename, status, created_at in query.limit(limit).all():
+        items.append({
+            "id": fields.job_id,
+            "original_filename": original_filename,
+            "status": status,
+            "created_at": created_at.isoformat() if created_at else None,
+            "document_type": fields.document_type,
+            "first_name": fields.first_name,
+            "last_name": fields.last_name,
+            "date_of_birth": fields.date_of_birth.isoformat() if fields.date_of_birth else None,
+            "document_number": fields.document_number,
+            "issue_date": fields.issue_date.isoformat() if fields.issue_date else None,
+            "expiry_date": fields.expiry_date.isoformat() if fields.expiry_date else None,
+            "country": fields.country,
+            "state": fields.state
+        })
+    return {"items": items}
+
+@router.get("/export")
+async def export_documents(
+    export_format: str = Query("ndjson", alias="format", description="ndjson, csv or parquet"),
+    status: List[str] = Query(["completed"], description="Job statuses to include"),
+    created_from: Optional[datetime] = Query(None, description="Earliest creation time (UTC), inclusive"),
+    created_to: Optional[datetime] = Query(None, description="Latest creation time (UTC), exclusive"),
+    since: Optional[str] = Query(None, description="X-Export-Checkpoint of a previous export; only jobs changed after it are included")
+):
+    """
+    Stream jobs with their key fields and flattened attributes.
+    Rows are read through a database cursor and encoded as they are sent, so
+    the export size is not limited by memory. The X-Export-Checkpoint response
+    header is the `since` value that makes the next export incremental.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Expected one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires the pyarrow package on the server")
+    invalid = [value for value in status if value not in EXPORT_STATUSES]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Expected any of: {', '.join(EXPORT_STATUSES)}")
+    try:
+        since_at = parse_checkpoint(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid checkpoint")
+    
+    checkpoint = export_checkpoint()
+    chunks = export_stream(
+        export_format,
+        statuses=status,
+        created_from=parse_checkpoint(created_from) if created_from else None,
+        created_to=parse_checkpoint(created_to) if created_to else None,
+        since=since_at,
+        until=checkpoint,
+    )
+    filename = f"documents-{checkpoint.strftime('%Y%m%dT%H%M%S')}.{export_format}"
+    # The generator is blocking; Starlette advances it in the thread pool
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[export_format], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Export-Checkpoint": format_checkpoint(checkpoint),
+    })
+
 @router.get("/{job_id}", response_model=dict)
 async def get_document_status(
     job_id: str, 
@@ -102,36 +549,97 @@ async def get_document_status(
     return {
         "id": job.id,
         "status": job.status,
+        "error_code": job.error_code,
         "document_type": job.document_type,
         "file_type": job.file_type,
         "original_filename": job.original_filename,
         "extracted_fields": job.extracted_fields_json
     }
 
-@router.get("/{job_id}/content")
-async def get_document_content(
-    job_id: str,
-    db: Session = Depends(get_db)
-):
-    """Get the actual document file content by job ID"""
+# Uploads never change once written, so clients may reuse them without asking;
+# "private" keeps shared proxies from storing personal documents
+DOCUMENT_CACHE_CONTROL = "private, max-age=86400, immutable"
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match names the current ETag (weak comparison, as RFC 9110 requires for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def _cached_file_response(request: Request, path: Path, etag: str, media_type: Optional[str], filename: Optional[str] = None) -> Response:
+    """
+    Serve a file with a strong ETag and Cache-Control; a matching If-None-Match
+    gets an empty 304 and Range requests are answered with 206 by FileResponse.
+    """
+    headers = {"ETag": etag, "Cache-Control": DOCUMENT_CACHE_CONTROL}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(
+        path=path,
+        media_type=media_type,
+        filename=filename,
+        headers=headers,
+        content_disposition_type="inline"
+    )
+
+def _content_tag(job: ExtractionJobs, path: Path) -> str:
+    """Content hash of the upload, or its size and mtime for jobs stored before hashing"""
+    if job.content_hash:
+        return job.content_hash
+    stat = path.stat()
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def _get_job_file(db: Session, job_id: str) -> Tuple[ExtractionJobs, Path]:
     job = db.query(ExtractionJobs).filter(ExtractionJobs.id == job_id).first()
     if not job:
         raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
-    
-    # Construct path to the file
     file_path = Path(job.upload_path)
-    
-    # Check if file exists
-    if not os.path.exists(file_path):
+    if not file_path.exists():
         raise HTTPException(status_code=404, detail=f"Document file not found on server")
-    
-    # Determine content type based on file extension
-    filename = job.original_filename
-    return FileResponse(
-        path=file_path, 
-        filename=filename,
-        media_type=None  # Let FastAPI infer the media type
-    )
+    return job, file_path
+
+@router.get("/{job_id}/content")
+async def get_document_content(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Get the actual document file content by job ID (supports If-None-Match and Range)"""
+    job, file_path = _get_job_file(db, job_id)
+    media_type, _ = mimetypes.guess_type(job.original_filename or file_path.name)
+    etag = f'"{_content_tag(job, file_path)}"'
+    return _cached_file_response(request, file_path, etag, media_type, job.original_filename)
+
+async def _rendition_response(request: Request, db: Session, job_id: str, rendition: str) -> Response:
+    job, file_path = _get_job_file(db, job_id)
+    etag = f'"{_content_tag(job, file_path)}-{rendition_fingerprint(rendition)}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": DOCUMENT_CACHE_CONTROL})
+    # Normally written during processing; produced here for older or cached jobs
+    path = await run_in_threadpool(ensure_rendition, file_path, rendition)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No preview available for this document")
+    return _cached_file_response(request, path, etag, rendition_media_type())
+
+@router.get("/{job_id}/preview")
+async def get_document_preview(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Downscaled image of the first page, for display"""
+    return await _rendition_response(request, db, job_id, "preview")
+
+@router.get("/{job_id}/thumbnail")
+async def get_document_thumbnail(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Small image of the first page, for document lists"""
+    return await _rendition_response(request, db, job_id, "thumbnail")
 
 @router.put("/{job_id}", response_model=dict)
 async def update_extracted_fields(
@@ -145,9 +653,12 @@ async def update_extracted_fields(
         raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
     
     try:
-        # Update the extracted fields JSON
+        # Update the extracted fields JSON and the search index in one transaction
         job.extracted_fields_json = json.dumps(request.extracted_fields_json)
+        if job.status == "completed":
+            sync_document_fields(db, job.id, request.extracted_fields_json)
         db.commit()
+        await broker.publish(job_event(job))
         
         return {
             "id": job.id,
@@ -158,39 +669,145 @@ async def update_extracted_fields(
         logger.error(f"Error updating extracted fields: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to update extracted fields: {str(e)}")
 
-@router.get("/recent/list", response_model=List[dict])
+@router.post("/{job_id}/reprocess", response_model=dict)
+async def reprocess_document(
+    job_id: str,
+    mode: str = Query("auto", description="auto, extract (with the stored identification), identify or full"),
+    db: Session = Depends(get_db)
+):
+    """
+    Run extraction again for an existing job. Stages whose inputs are unchanged
+    reuse the job's stored artifacts, so a retry after a transient failure or a
+    prompt change only repeats the LLM calls that are needed. The previous
+    result stays readable until the new one is saved.
+    """
+    if mode not in REPROCESS_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid reprocess mode. Expected one of: {', '.join(REPROCESS_MODES)}")
+    job = db.query(ExtractionJobs).filter(ExtractionJobs.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
+    if job.status == "processing":
+        raise HTTPException(status_code=409, detail="The document is already being processed")
+    if not Path(job.upload_path).exists() and (mode == "full" or not manifest_path(job_id).exists()):
+        raise HTTPException(status_code=410, detail="The uploaded file is no longer available")
+    try:
+        scheduler.check_capacity()
+    except QueueFullError as e:
+        raise _queue_full_exception(e.retry_after)
+
+    previous_status, previous_error_code = job.status, job.error_code
+    job.status = "processing"
+    job.error_code = None
+    job.reprocess_mode = mode
+    lease_new_job(job)
+    db.commit()
+    try:
+        schedule_document_processing(job.id)
+    except QueueFullError as e:
+        # The queue filled up in the meantime; the previous result is still there
+        job.status = previous_status
+        job.error_code = previous_error_code
+        job.reprocess_mode = None
+        job.lease_owner = None
+        job.lease_expires_at = None
+        db.commit()
+        await broker.publish(job_event(job))
+        raise _queue_full_exception(e.retry_after)
+    await broker.publish(job_event(job))
+    logger.info(f"Reprocessing scheduled for job ID {job_id} ({mode})")
+    return {"id": job.id, "status": job.status, "mode": mode}
+
+# Page size limits for the recent documents listing
+RECENT_PAGE_SIZE = 50
+RECENT_MAX_PAGE_SIZE = 200
+
+def _encode_cursor(created_at: Union[str, datetime], job_id: str) -> str:
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, job_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[Union[str, datetime], str]:
+    """(created_at as stored on SQLite, as a datetime elsewhere; job id)"""
+    try:
+        created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(created_at, str) or not isinstance(job_id, str):
+            raise ValueError("malformed cursor")
+        if not IS_SQLITE:
+            created_at = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, job_id
+
+@router.get("/recent/list", response_model=RecentDocumentPage)
 async def get_recent_documents(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(RECENT_PAGE_SIZE, ge=1, le=RECENT_MAX_PAGE_SIZE),
+    status: Optional[str] = Query(None),
+    document_type: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
-    """Get a list of all document extraction jobs"""
-    recent_jobs = db.query(ExtractionJobs)\
-        .order_by(desc(ExtractionJobs.created_at))\
-        .all()
+    """
+    Get a page of document extraction jobs, newest first.
+    Uses keyset pagination on (created_at, id) and selects only the listed
+    columns, so response time does not grow with the size of the table.
+    """
+    # On SQLite the cursor compares the timestamp exactly as stored: rows written
+    # by CURRENT_TIMESTAMP and by Python carry different text formats. Other
+    # databases store a typed timestamp, which is compared as one.
+    created_at_raw = type_coerce(ExtractionJobs.created_at, String) if IS_SQLITE else ExtractionJobs.created_at
+    query = db.query(
+        ExtractionJobs.id,
+        ExtractionJobs.original_filename,
+        ExtractionJobs.document_type,
+        ExtractionJobs.status,
+        ExtractionJobs.created_at,
+        created_at_raw.label("created_at_raw")
+    )
+    if status:
+        query = query.filter(ExtractionJobs.status == status)
+    if document_type:
+        query = query.filter(ExtractionJobs.document_type == document_type)
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            created_at_raw < cursor_created_at,
+            and_(created_at_raw == cursor_created_at, ExtractionJobs.id < cursor_id)
+        ))
     
-    result = []
-    for job in recent_jobs:
-        # Parse the extracted_fields_json if it exists
-        document_type = job.document_type or "Unknown"
-        
-        result.append({
-            "id": job.id,
-            "original_filename": job.original_filename,
-            "document_type": document_type,
-            "status": job.status,
-            "created_at": job.created_at.isoformat() if job.created_at else None
-        })
+    # Fetch one extra row to know whether another page follows
+    rows = query.order_by(desc(ExtractionJobs.created_at), desc(ExtractionJobs.id)).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
-    return result
+    items = [
+        {
+            "id": row.id,
+            "original_filename": row.original_filename,
+            "document_type": row.document_type or "Unknown",
+            "status": row.status,
+            "created_at": row.created_at.isoformat() if row.created_at else None
+        }
+        for row in rows
+    ]
+    next_cursor = _encode_cursor(rows[-1].created_at_raw, rows[-1].id) if has_more and rows[-1].created_at_raw else None
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.delete("/clear_all", status_code=204)
 async def clear_all_extraction_jobs(db: Session = Depends(get_db)):
-    """Deletes all extraction jobs from the database."""
+    """Deletes all extraction jobs from the database, along with their uploads, previews and cached results."""
     try:
+        upload_paths = [upload_path for upload_path, in db.query(ExtractionJobs.upload_path)]
+        clear_document_fields(db)
         num_deleted = db.query(ExtractionJobs).delete()
         db.commit()
-        logger.info(f"Successfully deleted {num_deleted} extraction jobs.")
-        return # Return 204 No Content on success
     except Exception as e:
         db.rollback()
         logger.error(f"Error deleting all extraction jobs: {e}")
-        raise HTTPException(status_code=500, detail="Failed to delete all extraction jobs.") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to delete all extraction jobs.")
+    # Files go after the commit; any left behind by a crash are collected by the retention sweeper
+    await run_in_threadpool(remove_job_files, upload_paths)
+    await run_in_threadpool(result_cache.clear)
+    await broker.publish({"type": "cleared"})
+    logger.info(f"Successfully deleted {num_deleted} extraction jobs and their files.")
+    return # Return 204 No Content on success 
\ No newline at end of file
@@ -0,0 +1,45 @@
+import json
+import logging
+from typing import Dict
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject oversized request bodies before they are read.
+    Uses the Content-Length header, so uploads over the limit for their path
+    are refused with 413 without spooling the body to disk first. Bodies sent
+    without a Content-Length are still capped while the file is saved.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] in ("POST", "PUT"):
+            limit = self.limits.get(scope["path"].rstrip("/"))
+            if limit is not None:
+                headers = dict(scope["headers"])
+                content_length = headers.get(b"content-length")
+                if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+                    logger.warning(f"Rejected {scope['path']} request of {int(content_length)} bytes (limit {limit})")
+                    await self._reject(send, limit)
+                    return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Request exceeds the {limit // (1024 * 1024)} MB upload limit"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Index, ForeignKey
 from sqlalchemy.sql import func
 import uuid
 from sqlalchemy.dialects.sqlite import JSON
@@ -14,11 +14,66 @@ class ExtractionJobs(Base):
     original_filename = Column(String, nullable=False)
     stored_filename = Column(String, nullable=False, unique=True)
     upload_path = Column(String, nullable=False)
+    content_hash = Column(String, nullable=True)  # SHA-256 of the uploaded bytes
+    file_size = Column(Integer, nullable=True)  # Bytes
     status = Column(String, nullable=False, default="processing")
     document_type = Column(String, nullable=True)
+    pipeline_mode = Column(String, nullable=True)  # None means the deployment default
+    batch_id = Column(String, nullable=True, index=True)  # Set for jobs created by a batch upload
     extracted_fields_json = Column(Text, nullable=True)  # Using Text as SQLite has limited JSON support
+    error_code = Column(String, nullable=True)  # Why a failed job failed, e.g. "image_blurry" from the quality gate
+    # Processing lease: the worker holding it must renew it before it expires,
+    # otherwise the job is claimed again by another worker (see app/services/job_leases.py)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=True, default=0)  # Processing attempts started
+    # Set by POST /api/documents/{job_id}/reprocess until the job has been processed again
+    # (one of REPROCESS_MODES in app/services/document_processor.py)
+    reprocess_mode = Column(String, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    # Newest-first listing, optionally filtered by status or document type.
+    # `id` breaks ties between rows created within the same second.
+    __table_args__ = (
+        Index("ix_extraction_jobs_created_at_id", "created_at", "id"),
+        Index("ix_extraction_jobs_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_extraction_jobs_document_type_created_at_id", "document_type", "created_at", "id"),
+        # Claiming unleased or expired jobs, and relaying changes made by other processes
+        Index("ix_extraction_jobs_status_lease_expires_at", "status", "lease_expires_at"),
+        Index("ix_extraction_jobs_updated_at", "updated_at"),
+    )
+
+    def __repr__(self):
+        return f"<ExtractionJob(id={self.id}, status={self.status})>"
+
+class DocumentFields(Base):
+    """
+    Normalized key fields of a completed job, kept in sync with
+    extracted_fields_json so that searches hit indexes instead of parsing JSON.
+    Names are case-folded without accents, document numbers are upper-case
+    alphanumerics and dates are ISO dates.
+    """
+    __tablename__ = "document_fields"
+
+    job_id = Column(String, ForeignKey("extraction_jobs.id", ondelete="CASCADE"), primary_key=True)
+    document_type = Column(String, nullable=True)  # passport, ead, driver_license or other
+    first_name = Column(String, nullable=True)
+    last_name = Column(String, nullable=True)
+    full_name = Column(String, nullable=True)
+    date_of_birth = Column(Date, nullable=True, index=True)
+    document_number = Column(String, nullable=True, index=True)
+    issue_date = Column(Date, nullable=True)
+    expiry_date = Column(Date, nullable=True, index=True)
+    country = Column(String, nullable=True)
+    state = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_document_fields_last_name_first_name", "last_name", "first_name"),
+        Index("ix_document_fields_first_name", "first_name"),
+        Index("ix_document_fields_document_type_expiry_date", "document_type", "expiry_date"),
+        Index("ix_document_fields_country_state", "country", "state"),
+    )
+
     def __repr__(self):
-        return f"<ExtractionJob(id={self.id}, status={self.status})>" 
\ No newline at end of file
+        return f"<DocumentFields(job_id={self.job_id}, document_number={self.document_number})>"
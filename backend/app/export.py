@@ -0,0 +1,105 @@
+"""
+Export extraction results straight from the database.
+
+Writes jobs with their key fields and flattened attributes as NDJSON, CSV or
+Parquet, like GET /api/documents/export but without going through the API:
+
+    python -m app.export --format csv --output results.csv
+    python -m app.export --output nightly.ndjson --checkpoint-file .export-checkpoint
+
+With --checkpoint-file only jobs changed since the previous run are written,
+and the file is advanced once the output is complete, so a failed run is
+simply repeated by the next one. Consumers should upsert rows by id.
+"""
+import os
+import sys
+import argparse
+import logging
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file before app modules read their configuration
+load_dotenv()
+
+from app.services.result_export import (
+    EXPORT_FORMATS, EXPORT_STATUSES, export_checkpoint, export_stream, format_checkpoint, parse_checkpoint,
+    parquet_available,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _read_checkpoint(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    return path.read_text().strip() or None
+
+
+def _write_atomically(path: Path, data: str):
+    partial = path.with_name(path.name + ".part")
+    partial.write_text(data)
+    os.replace(partial, path)
+
+
+def run_export(args: argparse.Namespace) -> int:
+    since = args.since
+    if since is None and args.checkpoint_file is not None:
+        since = _read_checkpoint(args.checkpoint_file)
+    checkpoint = export_checkpoint()
+    chunks = export_stream(
+        args.format,
+        statuses=args.status or ["completed"],
+        created_from=parse_checkpoint(args.created_from) if args.created_from else None,
+        created_to=parse_checkpoint(args.created_to) if args.created_to else None,
+        since=parse_checkpoint(since) if since else None,
+        until=checkpoint,
+    )
+
+    if args.output is None:
+        out = sys.stdout.buffer
+        for chunk in chunks:
+            out.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        out.flush()
+    else:
+        # Written next to the target and renamed, so readers never see a partial export
+        partial = args.output.with_name(args.output.name + ".part")
+        with open(partial, "wb") as out:
+            for chunk in chunks:
+                out.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        os.replace(partial, args.output)
+
+    if args.checkpoint_file is not None:
+        _write_atomically(args.checkpoint_file, format_checkpoint(checkpoint) + "\n")
+    logger.info(f"Export complete, checkpoint {format_checkpoint(checkpoint)}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export extraction results as NDJSON, CSV or Parquet")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--output", type=Path, help="Output file (default: standard output)")
+    parser.add_argument("--status", action="append", choices=EXPORT_STATUSES,
+                        help="Job status to include; repeatable (default: completed)")
+    parser.add_argument("--created-from", help="Earliest creation time (UTC ISO timestamp), inclusive")
+    parser.add_argument("--created-to", help="Latest creation time (UTC ISO timestamp), exclusive")
+    parser.add_argument("--since", help="Checkpoint of a previous export; only jobs changed after it are written")
+    parser.add_argument("--checkpoint-file", type=Path,
+                        help="Read --since from this file and store the new checkpoint there after a complete export")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if args.format == "parquet" and not parquet_available():
+        parser.error("Parquet export requires the pyarrow package")
+    for value in (args.created_from, args.created_to, args.since):
+        if value is not None:
+            try:
+                parse_checkpoint(value)
+            except ValueError:
+                parser.error(f"Invalid timestamp: {value}")
+    return run_export(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import logging
@@ -7,12 +8,29 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 
+# Load environment variables from .env file before app modules read their configuration
+load_dotenv()
+
 from app.api.endpoints import documents
-from app.db.database import engine
+from app.api.middleware import RequestSizeLimitMiddleware
+from app.db.database import ensure_schema
 from app.db import models
-
-# Load environment variables from .env file
-load_dotenv()
+from app.services.field_index import ensure_search_index, backfill_document_fields
+from app.services.document_processor import scheduler
+from app.services import llm_client
+from app.services.result_cache import result_cache
+from app.services.rate_limiter import rate_limiter
+from app.services.model_router import model_router
+from app.services.preclassifier import preclassifier_stats
+from app.services.quality_gate import quality_gate_stats
+from app.services.structured_output import structured_output_stats
+from app.services.retention import retention_sweeper
+from app.services.events import broker, JobEventRelay
+from app.services.job_leases import (
+    JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RECOVERY_INTERVAL, JOB_RUNNER, WORKER_ID, LeaseKeeper, job_backlog
+)
+from app.services.metrics import registry, register_gauge, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.utils.file_utils import MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,16 +39,39 @@ logger = logging.getLogger(__name__)
 # Define paths
 UPLOAD_DIR = Path("./uploads")
 
+lease_keeper = LeaseKeeper(scheduler, JOB_RECOVERY_INTERVAL, scheduler.free_slots)
+job_event_relay = JobEventRelay(broker)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
-    # Create database tables
-    models.Base.metadata.create_all(bind=engine)
+    # Create database tables and add columns introduced since they were created
+    ensure_schema()
+    ensure_search_index()
+    backfill_document_fields()
     logger.info("Database tables created.")
+    llm_client.init_client()
+    if JOB_RUNNER == "worker":
+        # Standalone workers process the jobs; relay their results to event subscribers
+        job_event_relay.start()
+        logger.info("Jobs are processed by standalone workers (JOB_RUNNER=worker)")
+    else:
+        await scheduler.start()
+        # Also takes over jobs abandoned by a crashed or restarted API process
+        await lease_keeper.start()
+    retention_sweeper.start()
     logger.info("Application startup complete.")
     # You can add other startup logic here, e.g., DB connection test
     yield
     # Shutdown logic
+    await retention_sweeper.stop()
+    await job_event_relay.stop()
+    lease_keeper.claiming = False
+    await scheduler.stop()
+    # Jobs this process did not finish become claimable right away
+    await lease_keeper.stop()
+    await llm_client.close_client()
+    result_cache.close()
     logger.info("Application shutdown complete.")
 
 app = FastAPI(
@@ -47,7 +88,18 @@ app.add_middleware(
     allow_origins=["*"],  # Or ["*"] for all origins
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Export-Checkpoint"]
+)
+
+# Refuse oversized uploads before their bodies are read
+# (single uploads get headroom for the multipart envelope and form fields)
+app.add_middleware(
+    RequestSizeLimitMiddleware,
+    limits={
+        "/api/documents/upload": MAX_UPLOAD_BYTES + 64 * 1024,
+        "/api/documents/batch": MAX_BATCH_UPLOAD_BYTES,
+    }
 )
 
 # Include routers
@@ -57,5 +109,39 @@ app.include_router(documents.router, prefix="/api/documents", tags=["documents"]
 async def health_check():
     return {"status": "healthy"}
 
+# Gauges are read from the live objects when /metrics is scraped
+register_gauge("docparser_queue_depth", "Jobs waiting in the processing queue", lambda: scheduler.stats()["queued"])
+register_gauge("docparser_queue_capacity", "Maximum number of queued jobs", lambda: scheduler.max_queue_size)
+register_gauge("docparser_jobs_in_flight", "Jobs currently being processed", lambda: scheduler.stats()["in_flight"])
+register_gauge("docparser_event_subscribers", "Open job event streams", broker.subscriber_count)
+register_gauge("docparser_llm_concurrency_limit", "Current adaptive limit on concurrent LLM requests", lambda: rate_limiter.limit)
+register_gauge("docparser_llm_requests_waiting", "LLM requests waiting for rate limit capacity", lambda: rate_limiter.stats()["waiting"])
+
+@app.get("/metrics", tags=["health"])
+async def metrics():
+    """Prometheus text exposition of stage timings, LLM usage, errors and queue gauges"""
+    return Response(content=registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/stats", tags=["health"])
+async def stats():
+    """Processing queue depth, in-flight job counts, job leases, result cache, LLM rate limiter, model routing, pre-classifier, structured output and retention counters"""
+    return {
+        "queue": scheduler.stats(),
+        "jobs": {
+            "runner": JOB_RUNNER,
+            "worker_id": WORKER_ID,
+            "lease_seconds": JOB_LEASE_SECONDS,
+            "max_attempts": JOB_MAX_ATTEMPTS,
+            **await run_in_threadpool(job_backlog),
+        },
+        "result_cache": result_cache.stats(),
+        "llm_rate_limiter": rate_limiter.stats(),
+        "models": model_router.stats(),
+        "structured_output": structured_output_stats.stats(),
+        "preclassifier": preclassifier_stats.stats(),
+        "quality_gate": quality_gate_stats.stats(),
+        "retention": retention_sweeper.stats(),
+    }
+
 # To run this app (assuming uvicorn is installed):
 # uvicorn backend.app.main:app --reload --host 0.0.0.0 --port 8000 
\ No newline at end of file
@@ -1,7 +1,49 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 class UploadResponse(BaseModel):
     message: str
     uuid: str
     filename: str
-    original_filename: str 
\ No newline at end of file
+    original_filename: str
+
+class BatchJob(BaseModel):
+    uuid: str
+    filename: str
+    original_filename: str
+    status: str
+
+class BatchUploadResponse(BaseModel):
+    message: str
+    batch_id: str
+    jobs: List[BatchJob]
+    skipped: List[str]
+
+class RecentDocument(BaseModel):
+    id: str
+    original_filename: str
+    document_type: str
+    status: str
+    created_at: Optional[str]
+
+class RecentDocumentPage(BaseModel):
+    items: List[RecentDocument]
+    next_cursor: Optional[str]
+
+class DocumentSearchResult(BaseModel):
+    id: str
+    original_filename: str
+    status: str
+    created_at: Optional[str]
+    document_type: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    date_of_birth: Optional[str]
+    document_number: Optional[str]
+    issue_date: Optional[str]
+    expiry_date: Optional[str]
+    country: Optional[str]
+    state: Optional[str]
+
+class DocumentSearchResponse(BaseModel):
+    items: List[DocumentSearchResult]
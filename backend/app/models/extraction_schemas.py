@@ -0,0 +1,187 @@
+import re
+from typing import Any, Dict, List, Optional, Set, Type
+from pydantic import BaseModel, ConfigDict, Field, create_model, field_validator, model_validator
+
+# Attributes requested for each document type; the names double as JSON keys
+PASSPORT_FIELDS = [
+    "First Name",
+    "Middle Name (if any)",
+    "Last Name",
+    "Date of Birth (MM/DD/YYYY)",
+    "Passport Number",
+    "Issue Date (MM/DD/YYYY)",
+    "Expiry Date (MM/DD/YYYY)",
+    "Place of Birth",
+    "Gender",
+    "Nationality",
+]
+EAD_FIELDS = [
+    "First Name",
+    "Middle Name (if any)",
+    "Last Name",
+    "Date of Birth (MM/DD/YYYY)",
+    "Card Number",
+    "USCIS Number",
+    "Category",
+    "Issue Date (MM/DD/YYYY)",
+    "Expiry Date (MM/DD/YYYY)",
+    "Country of Birth",
+    "Gender",
+]
+DRIVER_LICENSE_FIELDS = [
+    "First Name",
+    "Middle Name (if any)",
+    "Last Name",
+    "Date of Birth (MM/DD/YYYY)",
+    "License Number",
+    "Issue Date (MM/DD/YYYY)",
+    "Expiry Date (MM/DD/YYYY)",
+    "Address",
+    "Gender",
+    "Class/Type of License",
+    "Restrictions (if any)",
+]
+GENERIC_FIELDS = [
+    "First Name",
+    "Middle Name (if any)",
+    "Last Name",
+    "Date of Birth (MM/DD/YYYY)",
+    "Document Number",
+    "Issue Date (MM/DD/YYYY)",
+    "Expiry Date (MM/DD/YYYY)",
+    "Country of Issue",
+]
+
+
+def _as_text(value: Any) -> str:
+    """Models sometimes answer null or a bare number for a text field"""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_as_text(item) for item in value if item is not None)
+    if isinstance(value, dict):
+        raise ValueError("expected a text value, got an object")
+    return str(value).strip()
+
+
+def field_key(name: str) -> str:
+    """Attribute name case-folded and without its "(MM/DD/YYYY)" style hints, for matching near-miss keys"""
+    return " ".join(re.sub(r"\(.*?\)", "", name).casefold().split())
+
+
+class AttributesBase(BaseModel):
+    """Extracted attributes; every listed field is a string, empty when not found"""
+    model_config = ConfigDict(populate_by_name=True, extra="ignore")
+
+    @model_validator(mode="before")
+    @classmethod
+    def require_listed_field(cls, data: Any) -> Any:
+        """
+        Map near-miss keys ("Date of Birth" for "Date of Birth (MM/DD/YYYY)")
+        onto the listed fields. An answer naming none of the requested fields,
+        or answering one field under two keys with different values, is a
+        malformed answer rather than an empty document.
+        """
+        if not isinstance(data, dict) or not cls.model_fields:
+            return data
+        names = {field.alias or name for name, field in cls.model_fields.items()}
+        canonical = {field_key(name): name for name in names}
+        mapped = {key: value for key, value in data.items() if key in names}
+        for key, value in data.items():
+            if key in names:
+                continue
+            name = canonical.get(field_key(key)) if isinstance(key, str) else None
+            if name is None:
+                mapped[key] = value
+            elif name not in mapped:
+                mapped[name] = value
+            elif mapped[name] != value:
+                raise ValueError(f"{key!r} and {name!r} both answer the field {name!r}; use {name!r} only")
+        if not names & set(mapped):
+            raise ValueError(f"expected the fields: {', '.join(sorted(names))}")
+        return mapped
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def coerce_text(cls, value: Any) -> str:
+        return _as_text(value)
+
+
+class OpenAttributesBase(AttributesBase):
+    """Attributes that also keep keys beyond the listed fields"""
+    model_config = ConfigDict(populate_by_name=True, extra="allow")
+
+
+def _attributes_model(name: str, fields: List[str], base: Type[AttributesBase] = AttributesBase) -> Type[AttributesBase]:
+    """Build an attributes model whose aliases are the human-readable field names"""
+    definitions = {
+        f"field_{index}": (str, Field("", alias=field))
+        for index, field in enumerate(fields)
+    }
+    return create_model(name, __base__=base, **definitions)
+
+
+PassportAttributes = _attributes_model("PassportAttributes", PASSPORT_FIELDS)
+EADAttributes = _attributes_model("EADAttributes", EAD_FIELDS)
+DriverLicenseAttributes = _attributes_model("DriverLicenseAttributes", DRIVER_LICENSE_FIELDS)
+# Unknown documents may carry any "important information", so extra keys are kept
+UnknownDocAttributes = _attributes_model("UnknownDocAttributes", GENERIC_FIELDS, OpenAttributesBase)
+
+
+class DocumentTypeInfo(BaseModel):
+    """Answer of the identification step"""
+    doc_type: str
+    country: str = ""
+    state: str = ""
+
+    @field_validator("doc_type", "country", "state", mode="before")
+    @classmethod
+    def coerce_text(cls, value: Any) -> str:
+        return _as_text(value)
+
+
+class SingleCallResponse(DocumentTypeInfo):
+    """Answer of the combined classify-and-extract call"""
+    confidence: float = 0.0
+    attributes: Dict[str, Any]
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def clamp_confidence(cls, value: Any) -> float:
+        try:
+            return min(1.0, max(0.0, float(value)))
+        except (TypeError, ValueError):
+            return 0.0
+
+    @model_validator(mode="after")
+    def validate_attributes(self) -> "SingleCallResponse":
+        """Check the attributes against the schema of the identified document type"""
+        self.attributes = dump_attributes(attributes_model(self.doc_type).model_validate(self.attributes))
+        return self
+
+
+def attributes_model(doc_type: str) -> Type[AttributesBase]:
+    """Attributes model for an identified document type"""
+    doc_type = (doc_type or "").lower()
+    if "passport" in doc_type:
+        return PassportAttributes
+    if "ead" in doc_type or "employment authorization" in doc_type:
+        return EADAttributes
+    if "license" in doc_type or "driver" in doc_type:
+        return DriverLicenseAttributes
+    return UnknownDocAttributes
+
+
+def listed_fields(schema: Type[BaseModel]) -> Optional[Set[str]]:
+    """
+    Names of every field an answer is expected to contain, or None when the
+    schema also keeps unlisted keys and only the end of the answer tells.
+    """
+    if schema.model_config.get("extra") == "allow":
+        return None
+    return {field.alias or name for name, field in schema.model_fields.items()}
+
+
+def dump_attributes(attributes: AttributesBase) -> Dict[str, Any]:
+    """Attributes keyed by their human-readable names, as stored in job results"""
+    return attributes.model_dump(by_alias=True)
@@ -0,0 +1,130 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.metrics import Counter, registry
+from app.utils.image_utils import IMAGE_FORMAT
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Intermediate results of each job, kept so a job can be reprocessed without
+# redoing the stages whose inputs did not change
+JOB_ARTIFACTS = os.environ.get("JOB_ARTIFACTS", "true").lower() == "true"
+ARTIFACT_DIR = Path(os.environ.get("ARTIFACT_DIR", "./artifacts"))
+
+# Bump whenever the manifest layout changes; older manifests are ignored
+ARTIFACT_VERSION = "1"
+
+PAGE_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "PNG": ".png"}
+
+ARTIFACT_STAGES = registry.register(Counter(
+    "docparser_artifact_stages_total",
+    "Pipeline stages by whether a stored artifact was reused or the stage was run",
+    ["stage", "outcome"],
+))
+
+
+def input_key(*inputs: Any) -> str:
+    """Digest of everything a stage's output depends on"""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def manifest_path(job_id: str) -> Path:
+    """Artifacts are named after the job (<job id>.manifest.json, <job id>.page-<n><ext>)"""
+    return ARTIFACT_DIR / f"{job_id}.manifest.json"
+
+
+def _page_path(job_id: str, page_number: int) -> Path:
+    return ARTIFACT_DIR / f"{job_id}.page-{page_number}{PAGE_EXTENSIONS.get(IMAGE_FORMAT, '.jpg')}"
+
+
+def _write_atomically(path: Path, data: bytes):
+    temp_path = path.with_name(f".{path.name}.part")
+    try:
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+class JobArtifacts:
+    """
+    Stored stage outputs of one job: the normalized page images sent to the
+    model, the identification and the per-page answers with the raw LLM
+    responses they were parsed from. Each stage is stored with the key of its
+    inputs (see input_key) and only handed back for the same key. Blocking.
+    """
+
+    def __init__(self, job_id: str, stages: Optional[Dict[str, Any]] = None):
+        self.job_id = job_id
+        self.stages: Dict[str, Dict[str, Any]] = stages or {}
+
+    @classmethod
+    def load(cls, job_id: str) -> "JobArtifacts":
+        """The job's stored artifacts, or an empty set when there are none"""
+        try:
+            manifest = json.loads(manifest_path(job_id).read_text())
+        except FileNotFoundError:
+            return cls(job_id)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable artifact manifest of job ID {job_id}: {e}")
+            return cls(job_id)
+        if manifest.get("version") != ARTIFACT_VERSION:
+            return cls(job_id)
+        return cls(job_id, manifest.get("stages"))
+
+    def get(self, stage: str, key: str) -> Optional[Any]:
+        """Output stored for `stage` if it was produced from the same inputs"""
+        entry = self.stages.get(stage)
+        if entry is None or entry.get("key") != key:
+            return None
+        return entry.get("output")
+
+    def latest(self, stage: str) -> Optional[Any]:
+        """Output stored for `stage`, whatever it was produced from"""
+        entry = self.stages.get(stage)
+        return entry.get("output") if entry is not None else None
+
+    def put(self, stage: str, key: str, output: Any, responses: Optional[List[Dict[str, Any]]] = None):
+        self.stages[stage] = {"key": key, "output": output, "responses": responses or []}
+
+    def load_pages(self, key: str) -> Optional[List[str]]:
+        """Base64 payloads of the stored pages, None unless all of them are there for `key`"""
+        count = self.get("pages", key)
+        if count is None:
+            return None
+        try:
+            return [
+                base64.b64encode(_page_path(self.job_id, page_number).read_bytes()).decode("utf-8")
+                for page_number in range(1, count + 1)
+            ]
+        except OSError:
+            return None
+
+    def save_pages(self, key: str, pages: List[str]):
+        ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+        for page_number, page in enumerate(pages, start=1):
+            _write_atomically(_page_path(self.job_id, page_number), base64.b64decode(page))
+        self.put("pages", key, len(pages))
+
+    def save(self):
+        """Write the manifest, replacing the previous one"""
+        ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+        manifest = {"version": ARTIFACT_VERSION, "job_id": self.job_id, "stages": self.stages}
+        _write_atomically(manifest_path(self.job_id), json.dumps(manifest).encode("utf-8"))
+
+    def exists(self) -> bool:
+        return bool(self.stages)
+
+
+def remove_artifacts(job_id: str):
+    """Delete every artifact file of a job. Blocking."""
+    if not ARTIFACT_DIR.is_dir():
+        return
+    for path in ARTIFACT_DIR.glob(f"{job_id}.*"):
+        path.unlink(missing_ok=True)
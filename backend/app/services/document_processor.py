@@ -2,27 +2,102 @@ import os
 import json
 import base64
 import time
+import asyncio
+import hashlib
 import logging
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Dict, Any, Tuple
-from PIL import Image
-from pdf2image import convert_from_path
-from groq import Groq
+from typing import Dict, Any, Awaitable, Callable, List, NamedTuple, Optional, Sequence, Set, Tuple, Type
+from PIL import Image, UnidentifiedImageError
+from pdf2image import convert_from_path, pdfinfo_from_path
+from groq import AsyncGroq, BadRequestError
+from pydantic import BaseModel
 import mimetypes
-from fastapi import BackgroundTasks
-from sqlalchemy.orm import Session
 
+from app.db.database import session_scope
+from app.services.field_index import sync_document_fields
 from app.db.models import ExtractionJobs
+from app.services.events import broker, job_event
+from app.services.job_queue import JobScheduler
+from app.services.job_leases import JOB_RUNNER, LEASE_EVENTS, WORKER_ID, owns_lease
+from app.utils.image_utils import (
+    IMAGE_CROP_TO_DOCUMENT, IMAGE_FORMAT, IMAGE_MAX_PIXELS, IMAGE_MIME_TYPE, IMAGE_QUALITY, PDF_RENDER_DPI,
+    image_payload
+)
+from app.services.artifacts import ARTIFACT_STAGES, JOB_ARTIFACTS, JobArtifacts, input_key
+from app.services.llm_client import get_client, retry_api_call
+from app.services.model_router import PRIMARY_MODEL, model_router
+from app.services.json_stream import IncrementalJSONObject
+from app.services.metrics import (
+    JOB_SECONDS, LLM_REQUESTS, LLM_STREAMS, observe_stage, record_error, record_usage, time_stage
+)
+from app.services.rate_limiter import rate_limiter
+from app.services.previews import save_renditions
+from app.services.preclassifier import PRECLASSIFIER_MODE, classify_payload, preclassifier_stats
+from app.services.quality_gate import QUALITY_AUTO_ENHANCE, QUALITY_GATE_MODE, ImageQualityError, gate_image
+from app.services.result_cache import RESULT_CACHE_ENABLED, file_sha256, make_cache_key, result_cache
+from app.services.structured_output import (
+    LLM_RESPONSE_FORMAT, validate_response, response_format, repair_prompt, failed_generation,
+    structured_output_stats
+)
+from app.models.extraction_schemas import (
+    PASSPORT_FIELDS, EAD_FIELDS, DRIVER_LICENSE_FIELDS, GENERIC_FIELDS,
+    DocumentTypeInfo, SingleCallResponse, attributes_model, dump_attributes, field_key, listed_fields
+)
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Groq configuration
-VISION_MODEL = os.environ.get("GROQ_VISION_MODEL_1", "meta-llama/llama-4-scout-17b-16e-instruct")
+# Groq configuration; per-step model choice is made by the model router
+VISION_MODEL = PRIMARY_MODEL
 
-# Retry configuration
-MAX_RETRIES = 3
-RETRY_DELAY = 2  # seconds
+# Bump whenever the prompts or the result structure change so cached results are not reused
+PROMPT_VERSION = "3"
+
+# Pages beyond this limit are ignored (front/back scans and short multi-page PDFs)
+MAX_DOCUMENT_PAGES = int(os.environ.get("MAX_DOCUMENT_PAGES", "4"))
+
+# Pipeline modes: "two_step" identifies then extracts with two calls,
+# "single_call" classifies and extracts in one call and falls back to two_step when unsure
+TWO_STEP = "two_step"
+SINGLE_CALL = "single_call"
+PIPELINE_MODES = (TWO_STEP, SINGLE_CALL)
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", TWO_STEP)
+SINGLE_CALL_MIN_CONFIDENCE = float(os.environ.get("SINGLE_CALL_MIN_CONFIDENCE", "0.7"))
+
+# Stream the extraction answers: fields are published as they arrive and the
+# stream is closed as soon as the answer is complete
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "false").lower() == "true"
+STREAMED_TASKS = ("extract",)
+
+# Called with each field of a streamed answer as soon as it is complete
+FieldCallback = Callable[[str, Any], Awaitable[None]]
+
+
+class StreamedCompletion(NamedTuple):
+    content: str
+    usage: Any  # None when the stream was closed before the usage chunk
+
+
+# Reprocessing modes (POST /api/documents/{job_id}/reprocess) -> stages always
+# run again; every other stage is only run when its inputs changed or it failed.
+# "extract" keeps the stored identification, "identify" runs it again and
+# extracts again only if the document type came out different.
+REPROCESS_MODES = {
+    "auto": (),
+    "extract": ("extract",),
+    "identify": ("identify",),
+    "full": ("pages", "identify", "extract", "single_call"),
+}
+
+# Raw LLM answers of the stage being run, stored with its artifacts
+_llm_responses: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("llm_responses", default=None)
+
+
+def _record_response(stage: str, model: str, content: str):
+    responses = _llm_responses.get()
+    if responses is not None:
+        responses.append({"call": stage, "model": model, "content": content})
 
 
 def encode_image(image_path: Path) -> str:
@@ -31,44 +106,215 @@ def encode_image(image_path: Path) -> str:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
 
-def encode_pil_image(pil_image, format="JPEG") -> str:
-    """Encode PIL image to base64 string"""
-    import io
-    buffer = io.BytesIO()
-    pil_image.save(buffer, format=format)
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
-
-
-def retry_api_call(func, *args, **kwargs):
-    """Retry API calls with exponential backoff"""
-    retries = 0
-    while retries < MAX_RETRIES:
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            retries += 1
-            if retries == MAX_RETRIES:
-                raise
-            
-            # Check if it's a server error (5xx)
-            is_server_error = False
-            error_str = str(e)
-            if "Error code: 5" in error_str or "Service Unavailable" in error_str:
-                is_server_error = True
-            
-            if not is_server_error:
-                # If not a server error, don't retry
-                raise
-            
-            # Calculate delay with exponential backoff
-            delay = RETRY_DELAY * (2 ** (retries - 1))
-            logger.warning(f"Groq API temporarily unavailable. Retrying in {delay} seconds... (Attempt {retries}/{MAX_RETRIES})")
-            time.sleep(delay)
+async def create_vision_completion(
+    client: AsyncGroq,
+    image_data: str,
+    prompt: str,
+    response_format: Optional[Dict[str, Any]] = None,
+    model: str = VISION_MODEL
+):
+    """Send a prompt together with a base64 encoded image to the vision model"""
+    extra = {"response_format": response_format} if response_format else {}
+    return await client.chat.completions.create(
+        messages=_vision_messages(image_data, prompt),
+        model=model,
+        **extra,
+    )
 
 
-def identify_document_type(client: Groq, image_data: str) -> Dict[str, str]:
-    """Identify the type of document using Groq's vision model"""
-    prompt = """
+def _vision_messages(image_data: str, prompt: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{IMAGE_MIME_TYPE};base64,{image_data}",
+                    },
+                },
+            ],
+        }
+    ]
+
+
+async def stream_vision_completion(
+    client: AsyncGroq,
+    image_data: str,
+    prompt: str,
+    model: str = VISION_MODEL,
+    required: Optional[Set[str]] = None,
+    on_field: Optional[FieldCallback] = None
+) -> StreamedCompletion:
+    """
+    Stream the vision model's answer through an incremental JSON parser.
+    Each top-level field is passed to `on_field` once complete, and the stream
+    is closed once every `required` field has arrived, when text follows the
+    object or when the text cannot be JSON, so no output tokens are paid for
+    after that.
+    """
+    started = time.perf_counter()
+    parser = IncrementalJSONObject()
+    pieces: List[str] = []
+    usage = None
+    first_field = True
+    outcome = "ended"
+    # JSON mode and structured outputs cannot be streamed; the prompt asks for JSON
+    # and validate_response tolerates anything around the object
+    stream = await client.chat.completions.create(
+        messages=_vision_messages(image_data, prompt),
+        model=model,
+        stream=True,
+    )
+    try:
+        async for chunk in stream:
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(x_groq, "usage", None) or getattr(chunk, "usage", None) or usage
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if not text:
+                continue
+            pieces.append(text)
+            for name, value in parser.feed(text):
+                if first_field:
+                    observe_stage("first_field", time.perf_counter() - started)
+                    first_field = False
+                if on_field is not None:
+                    await on_field(name, value)
+            if parser.malformed:
+                outcome = "malformed"
+                break
+            if parser.closed:
+                # Read on for the usage chunk, unless the model keeps talking after the object
+                outcome = "closed"
+                if parser.trailing:
+                    break
+            elif required and required <= parser.members.keys():
+                outcome = "fields_complete"
+                break
+    finally:
+        await stream.close()
+    LLM_STREAMS.inc(outcome=outcome)
+    if outcome == "fields_complete":
+        # Only the closing brace is missing
+        return StreamedCompletion(json.dumps(parser.members), None)
+    return StreamedCompletion("".join(pieces), usage)
+
+
+async def create_text_completion(
+    client: AsyncGroq,
+    prompt: str,
+    response_format: Optional[Dict[str, Any]] = None,
+    model: str = VISION_MODEL
+):
+    """Send a text-only prompt to the vision model"""
+    extra = {"response_format": response_format} if response_format else {}
+    return await client.chat.completions.create(
+        messages=[{"role": "user", "content": prompt}],
+        model=model,
+        **extra,
+    )
+
+
+async def _completion_text(stage: str, model: str, create, *args, **kwargs) -> str:
+    """
+    Run a completion on `model` and return its text; JSON-mode rejections yield the rejected text.
+    Records the call duration (retries included) under `stage` and the token usage.
+    """
+    try:
+        with time_stage(stage):
+            response = await retry_api_call(create, *args, model=model, **kwargs)
+    except BadRequestError as e:
+        generated = failed_generation(e)
+        if generated is None:
+            LLM_REQUESTS.inc(model=model, outcome="error")
+            raise
+        LLM_REQUESTS.inc(model=model, outcome="invalid_json")
+        _record_response(stage, model, generated)
+        return generated
+    except Exception:
+        LLM_REQUESTS.inc(model=model, outcome="error")
+        raise
+    LLM_REQUESTS.inc(model=model, outcome="ok")
+    if isinstance(response, StreamedCompletion):
+        content, usage = response
+    else:
+        content, usage = response.choices[0].message.content, response.usage
+    record_usage(model, usage)
+    rate_limiter.record_usage(getattr(usage, "total_tokens", None))
+    _record_response(stage, model, content or "")
+    return content or ""
+
+
+# Metrics stage name of the vision call made for each step
+LLM_CALL_STAGES = {"identify": "identify_call", "extract": "extract_call", "single_call": "single_call"}
+
+
+async def request_structured(
+    client: AsyncGroq,
+    image_data: str,
+    prompt: str,
+    schema: Type[BaseModel],
+    task: str,
+    on_field: Optional[FieldCallback] = None
+) -> Optional[BaseModel]:
+    """
+    Ask the vision model for a JSON answer and validate it against the schema.
+    The model router picks the model, hedges slow calls and falls back to
+    other models on failure; returns None if no valid answer was obtained.
+    With LLM_STREAMING, answers to the streamed tasks are passed to `on_field`
+    field by field while they arrive (from every attempt, unvalidated).
+    """
+    async def attempt(model: str) -> Optional[BaseModel]:
+        return await _request_structured_on(model, client, image_data, prompt, schema, task, on_field)
+
+    return await model_router.run(task, attempt)
+
+
+async def _request_structured_on(
+    model: str,
+    client: AsyncGroq,
+    image_data: str,
+    prompt: str,
+    schema: Type[BaseModel],
+    task: str,
+    on_field: Optional[FieldCallback] = None
+) -> Optional[BaseModel]:
+    """
+    One structured request on one model. An invalid answer gets one text-only
+    repair call with the validation errors instead of a full re-run.
+    """
+    if LLM_STREAMING and task in STREAMED_TASKS:
+        raw_content = await _completion_text(
+            LLM_CALL_STAGES[task], model, stream_vision_completion, client, image_data, prompt,
+            required=listed_fields(schema), on_field=on_field,
+        )
+    else:
+        raw_content = await _completion_text(
+            LLM_CALL_STAGES[task], model, create_vision_completion, client, image_data, prompt, response_format(schema)
+        )
+    with time_stage("json_parse"):
+        parsed, errors = validate_response(raw_content, schema)
+    if parsed is not None:
+        structured_output_stats.record(task, "valid")
+        return parsed
+
+    logger.info(f"Invalid {task} response from {model}, requesting a repair: {errors}")
+    repaired_content = await _completion_text(
+        "repair_call", model, create_text_completion, client, repair_prompt(raw_content, errors, schema), response_format(schema)
+    )
+    with time_stage("json_parse"):
+        parsed, errors = validate_response(repaired_content, schema)
+    if parsed is not None:
+        structured_output_stats.record(task, "repaired")
+        return parsed
+
+    structured_output_stats.record(task, "failed")
+    logger.warning(f"Could not get a valid {task} response. Errors: {errors}. Raw response: {repaired_content}")
+    return None
+
+
+IDENTIFY_PROMPT = """
     Identify this document type from these 4 options: EAD Card, Passport, USA Drivers License, or Unknown Doc.
     
     If it's a Passport, also identify the country.
@@ -81,231 +327,440 @@ def identify_document_type(client: Groq, image_data: str) -> Dict[str, str]:
     For Passport, leave state as an empty string.
     For Driver License, leave country as an empty string.
     """
-    
-    def make_api_call(image_data, prompt):
-        response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}",
-                            },
-                        },
-                    ],
-                }
-            ],
-            model=VISION_MODEL,
-        )
-        return response
-    
-    response = retry_api_call(make_api_call, image_data, prompt)
-    
-    result = response.choices[0].message.content
-    # Extract JSON from the response
-    try:
-        return json.loads(result)
-    except json.JSONDecodeError:
-        # Try to extract JSON if it's embedded in text
-        import re
-        json_match = re.search(r'({.*})', result.replace('\n', ' '))
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except:
-                pass
-        logger.warning(f"Could not parse JSON response: {result}")
+
+
+async def identify_document_type(client: AsyncGroq, image_data: str) -> Dict[str, str]:
+    """Identify the type of document using Groq's vision model"""
+    doc_info = await request_structured(client, image_data, IDENTIFY_PROMPT, DocumentTypeInfo, "identify")
+    if doc_info is None or not doc_info.doc_type:
         return {"doc_type": "unknown", "country": "", "state": ""}
+    return doc_info.model_dump()
+
+
+async def identify_document(client: AsyncGroq, image_data: str) -> Tuple[Dict[str, str], Optional[Dict[str, Any]]]:
+    """
+    Identify the document type, letting the local pre-classifier answer when it is confident.
+    In shadow mode the local prediction is only compared with the LLM answer.
+    Returns (doc_info, prediction summary or None when the pre-classifier is off).
+    """
+    if PRECLASSIFIER_MODE not in ("shadow", "on"):
+        return await identify_document_type(client, image_data), None
+
+    try:
+        prediction = await scheduler.run_blocking(classify_payload, image_data)
+    except Exception as e:
+        logger.warning(f"Local pre-classification failed, using the LLM: {e}")
+        record_error("preclassify", e)
+        return await identify_document_type(client, image_data), None
+
+    skip_llm = PRECLASSIFIER_MODE == "on" and prediction.confident
+    preclassifier_stats.record_prediction(prediction, skip_llm)
+    summary = {**prediction.summary(), "used": skip_llm}
+    if skip_llm:
+        logger.info(f"Pre-classified as {prediction.doc_type} ({prediction.confidence}), skipping the identification call")
+        return prediction.doc_info(), summary
 
+    doc_info = await identify_document_type(client, image_data)
+    preclassifier_stats.record_comparison(prediction, doc_info["doc_type"])
+    return doc_info, summary
 
-def extract_document_info(client: Groq, image_data: str, doc_info: Dict[str, str]) -> Dict[str, Any]:
-    """Extract information from the document based on its type"""
+
+def _field_list(fields) -> str:
+    return "\n".join(f"        - {field}" for field in fields)
+
+
+def build_extraction_prompt(doc_info: Dict[str, str]) -> str:
+    """Create the extraction prompt for an identified document type"""
     doc_type = doc_info.get("doc_type", "").lower()
     country = doc_info.get("country", "")
     state = doc_info.get("state", "")
     
-    # Create a prompt based on document type
     if "passport" in doc_type:
-        prompt = f"""
-        You are examining a passport from {country}.
-        Note: Parse Date of Birth, Issue Date, and Expiry Date in the format as followed in {country}'s official documents and store them in the format MM/DD/YYYY.
+        # The local pre-classifier does not determine the issuing country
+        issuer = f"{country}'s" if country else "the issuing country's"
+        return f"""
+        You are examining a passport{f" from {country}" if country else ""}.
+        Note: Parse Date of Birth, Issue Date, and Expiry Date in the format as followed in {issuer} official documents and store them in the format MM/DD/YYYY.
         Extract the following attributes with high accuracy:
-        - First Name
-        - Middle Name (if any)
-        - Last Name
-        - Date of Birth (MM/DD/YYYY)
-        - Passport Number
-        - Issue Date (MM/DD/YYYY)
-        - Expiry Date (MM/DD/YYYY)
-        - Place of Birth
-        - Gender
-        - Nationality
+{_field_list(PASSPORT_FIELDS)}
         
         Respond with a valid JSON object containing all these fields. Leave empty string for fields not found.
         """
     elif "ead" in doc_type or "employment authorization" in doc_type:
-        prompt = """
+        return f"""
         You are examining an Employment Authorization Document (EAD Card).
         Extract the following attributes with high accuracy:
-        - First Name
-        - Middle Name (if any)
-        - Last Name
-        - Date of Birth (MM/DD/YYYY)  
-        - Card Number
-        - USCIS Number
-        - Category
-        - Issue Date (MM/DD/YYYY)
-        - Expiry Date (MM/DD/YYYY)
-        - Country of Birth
-        - Gender
+{_field_list(EAD_FIELDS)}
         
         Respond with a valid JSON object containing all these fields. Leave empty string for fields not found.
         """
     elif "license" in doc_type or "driver" in doc_type:
         location = f"{state}".strip(", ")
-        prompt = f"""
-        You are examining a Driver License from {location}, USA.
+        return f"""
+        You are examining a Driver License from {f"{location}, " if location else ""}USA.
         Extract the following attributes with high accuracy:
-        - First Name
-        - Middle Name (if any)
-        - Last Name
-        - Date of Birth (MM/DD/YYYY)
-        - License Number
-        - Issue Date (MM/DD/YYYY)
-        - Expiry Date (MM/DD/YYYY)
-        - Address
-        - Gender
-        - Class/Type of License
-        - Restrictions (if any)
+{_field_list(DRIVER_LICENSE_FIELDS)}
         
         Respond with a valid JSON object containing all these fields. Leave empty string for fields not found.
         """
     else:
-        prompt = """
+        return f"""
         Extract all important information from this document including:
-        - First Name
-        - Middle Name (if any)
-        - Last Name
-        - Date of Birth (MM/DD/YYYY)
-        - Document Number
-        - Issue Date (MM/DD/YYYY)
-        - Expiry Date (MM/DD/YYYY)
-        - Country of Issue
+{_field_list(GENERIC_FIELDS)}
         
         Respond with a valid JSON object containing all these fields.
         """
-    
-    def make_api_call(image_data, prompt):
-        response = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}",
-                            },
-                        },
-                    ],
-                }
-            ],
-            model=VISION_MODEL,
-        )
-        print(response)
-        return response
-    
-    response = retry_api_call(make_api_call, image_data, prompt)
-    
-    raw_content = response.choices[0].message.content
-    # print(result) # You can remove this debug print
 
-    # New parsing logic:
-    parsed_json = None
-    try:
-        # Attempt 1: Try to parse the raw_content directly
-        parsed_json = json.loads(raw_content)
-    except json.JSONDecodeError:
-        import re
-        # Attempt 2: Look for JSON within ```json ... ``` markdown blocks
-        # re.DOTALL makes '.' match newlines as well
-        json_blocks = re.findall(r"```json\s*(.*?)\s*```", raw_content, re.DOTALL)
-        if json_blocks:
-            # Try parsing the last found block first (often the most refined)
-            try:
-                parsed_json = json.loads(json_blocks[-1])
-            except json.JSONDecodeError:
-                # If last block fails and there are others, try the first one
-                if len(json_blocks) > 1:
-                    try:
-                        parsed_json = json.loads(json_blocks[0])
-                    except json.JSONDecodeError:
-                        pass # Fall through to next attempt
-        
-        if parsed_json is None:
-            # Attempt 3: Fallback to a non-greedy search for any JSON object
-            # Using re.DOTALL for '.' to match newlines, and .*? for non-greedy
-            json_match = re.search(r'({.*?})', raw_content, re.DOTALL)
-            if json_match:
-                try:
-                    parsed_json = json.loads(json_match.group(1))
-                except json.JSONDecodeError:
-                    pass # Fall through
-
-    if parsed_json:
-        return parsed_json
-    else:
-        logger.warning(f"Warning: Could not parse JSON response. Raw response: {raw_content}")
+
+async def extract_document_info(
+    client: AsyncGroq,
+    image_data: str,
+    doc_info: Dict[str, str],
+    on_field: Optional[FieldCallback] = None
+) -> Dict[str, Any]:
+    """
+    Extract information from the document based on its type.
+    With LLM_STREAMING, `on_field` receives each field as soon as it is read.
+    """
+    # Create a prompt based on document type
+    prompt = build_extraction_prompt(doc_info)
+    schema = attributes_model(doc_info.get("doc_type", ""))
+    listed = listed_fields(schema)
+    canonical = {field_key(field.alias or name): field.alias or name for name, field in schema.model_fields.items()}
+
+    async def on_listed_field(name: str, value: Any):
+        # Near-miss keys are published under the listed name validation maps them to;
+        # keys the schema drops would vanish from the saved result again
+        name = canonical.get(field_key(name), name)
+        if listed is None or name in listed:
+            await on_field(name, value)
+
+    attributes = await request_structured(
+        client, image_data, prompt, schema, "extract", on_listed_field if on_field is not None else None
+    )
+    if attributes is None:
         return {"error": "Failed to parse response"}
+    return dump_attributes(attributes)
+
+
+SINGLE_CALL_PROMPT = f"""
+        Identify this document type from these 4 options: EAD Card, Passport, USA Drivers License, or Unknown Doc.
+        If it's a Passport, also identify the country. If it's a Driver License, also identify the state.
+        Then extract the attributes listed for that document type with high accuracy.
+        Parse dates in the format used by the issuing country's official documents and store them as MM/DD/YYYY.
+
+        Passport attributes:
+{_field_list(PASSPORT_FIELDS)}
 
+        EAD Card attributes:
+{_field_list(EAD_FIELDS)}
 
-def process_document(file_path: Path) -> Tuple[Dict[str, Any], bool]:
+        USA Drivers License attributes:
+{_field_list(DRIVER_LICENSE_FIELDS)}
+
+        Unknown Doc attributes:
+{_field_list(GENERIC_FIELDS)}
+
+        Respond with a single valid JSON object in this exact format:
+        {{"doc_type": "...", "country": "...", "state": "...", "confidence": 0.0, "attributes": {{...}}}}
+
+        "confidence" is your confidence in the document type, between 0 and 1.
+        For EAD Card, leave country and state as empty strings.
+        For Passport, leave state as an empty string.
+        For Driver License, leave country as an empty string.
+        Leave empty string for attributes not found.
+        """
+
+
+async def classify_and_extract(client: AsyncGroq, image_data: str) -> Tuple[Dict[str, str], Optional[Dict[str, Any]], float]:
+    """
+    Identify the document and extract its attributes with a single vision call.
+    Returns (doc_info, attributes, confidence); attributes is None if the response was unusable.
+    """
+    parsed = await request_structured(client, image_data, SINGLE_CALL_PROMPT, SingleCallResponse, "single_call")
+    if parsed is None:
+        return {"doc_type": "unknown", "country": "", "state": ""}, None, 0.0
+
+    doc_info = {
+        "doc_type": parsed.doc_type or "unknown",
+        "country": parsed.country,
+        "state": parsed.state,
+    }
+    return doc_info, parsed.attributes, parsed.confidence
+
+
+def load_pdf_page(file_path: Path, page_number: int) -> Optional[str]:
+    """
+    Rasterize a single PDF page, normalize it and return it as a base64 string.
+    Pages are rendered one at a time so only one page bitmap is held per call.
+    Returns None for a blank page after the first; raises ImageQualityError
+    when the quality gate rejects the document. Blocking.
+    """
+    logger.info(f"Converting PDF page {page_number} to image: {file_path}")
+    with time_stage("pdf_rasterize"):
+        images = convert_from_path(file_path, dpi=PDF_RENDER_DPI, first_page=page_number, last_page=page_number)
+    with images[0] as image:  # This is a PIL Image object
+        if page_number == 1:
+            # The preview reuses the page already rasterized for the model
+            save_renditions(image, file_path)
+        with time_stage("quality_check"):
+            checked = gate_image(image, page_number, check_exposure=False)
+        if checked is None:
+            logger.info(f"Leaving out blank page {page_number} of {file_path}")
+            return None
+        with time_stage("image_encode"):
+            return image_payload(checked)
+
+
+def load_image_file(file_path: Path) -> str:
+    """
+    Load an image file, normalize it and return it as a base64 string.
+    Raises ImageQualityError when the quality gate rejects it. Blocking.
+    """
+    logger.info(f"Processing image: {file_path}")
+    try:
+        image = Image.open(file_path)
+        image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        # Formats Pillow cannot decode are sent to the model as-is
+        logger.warning(f"Could not decode {file_path} for normalization, sending original bytes: {e}")
+        return encode_image(file_path)
+
+    with image:
+        save_renditions(image, file_path)
+        with time_stage("quality_check"):
+            checked = gate_image(image)
+        with time_stage("image_encode"):
+            # An enhanced image is always re-encoded instead of sending the original bytes
+            return image_payload(checked, file_path if checked is image else None)
+
+
+async def load_document_pages(file_path: Path) -> List[str]:
+    """
+    Return base64 payloads for every page of a document, up to MAX_DOCUMENT_PAGES.
+    PDF pages are rasterized concurrently on the scheduler thread pool. Every
+    page passes the quality gate first (see app/services/quality_gate.py).
+    """
+    # Determine content type
+    content_type, _ = mimetypes.guess_type(file_path)
+
+    if content_type == 'application/pdf':
+        info = await scheduler.run_blocking(pdfinfo_from_path, file_path)
+        page_count = min(int(info.get("Pages", 1)), MAX_DOCUMENT_PAGES)
+        pages = await asyncio.gather(*(
+            scheduler.run_blocking(load_pdf_page, file_path, page_number)
+            for page_number in range(1, page_count + 1)
+        ))
+        return [page for page in pages if page is not None]
+    else:  # It's an image
+        return [await scheduler.run_blocking(load_image_file, file_path)]
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def merge_page_attributes(page_attributes: List[Optional[Dict[str, Any]]]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Merge per-page attribute dicts, keeping the first non-empty value for each field.
+    Returns (attributes, field_sources) where field_sources maps each field to its 1-based page.
+    Pages that failed to parse are skipped; if every page failed, the error is returned.
+    """
+    usable = [
+        (page_number, attributes)
+        for page_number, attributes in enumerate(page_attributes, start=1)
+        if isinstance(attributes, dict) and "error" not in attributes
+    ]
+    if not usable:
+        return {"error": "Failed to parse response"}, {}
+
+    merged: Dict[str, Any] = {}
+    field_sources: Dict[str, int] = {}
+    for page_number, attributes in usable:
+        for field, value in attributes.items():
+            if field not in merged or (_is_empty(merged[field]) and not _is_empty(value)):
+                merged[field] = value
+                field_sources[field] = page_number
+            elif not _is_empty(value) and value != merged[field]:
+                logger.info(f"Field '{field}' differs on page {page_number}, keeping value from page {field_sources[field]}")
+    return merged, field_sources
+
+
+def pages_input_key(file_path: Path) -> str:
+    """Inputs of the page payloads: the upload (never changed once written) and the image settings"""
+    return input_key(
+        file_path.name, MAX_DOCUMENT_PAGES, PDF_RENDER_DPI, IMAGE_MAX_PIXELS, IMAGE_FORMAT, IMAGE_QUALITY,
+        IMAGE_CROP_TO_DOCUMENT, QUALITY_GATE_MODE, QUALITY_AUTO_ENHANCE,
+    )
+
+
+async def _load_pages(file_path: Path, artifacts: Optional[JobArtifacts], rerun: Sequence[str]) -> Tuple[List[str], bool]:
+    """Page payloads, from the job's artifacts when they were made with the same settings"""
+    key = pages_input_key(file_path)
+    if artifacts is not None and "pages" not in rerun:
+        pages = await scheduler.run_blocking(artifacts.load_pages, key)
+        if pages is not None:
+            ARTIFACT_STAGES.inc(stage="pages", outcome="reused")
+            return pages, True
+    pages = await load_document_pages(file_path)
+    ARTIFACT_STAGES.inc(stage="pages", outcome="run")
+    if artifacts is not None:
+        await scheduler.run_blocking(artifacts.save_pages, key, pages)
+    return pages, False
+
+
+async def _run_stage(
+    artifacts: Optional[JobArtifacts],
+    stage: str,
+    key: str,
+    rerun: Sequence[str],
+    compute: Callable[[], Awaitable[Any]],
+    usable: Callable[[Any], bool]
+) -> Tuple[Any, bool]:
+    """
+    Run one pipeline stage, or return its stored output when it was produced
+    from the same inputs and the stage is not in `rerun`. Usable outputs are
+    stored together with the raw LLM answers they came from.
+    Returns (output, reused).
+    """
+    name = stage.split(":", 1)[0]
+    if artifacts is not None and name not in rerun:
+        stored = artifacts.get(stage, key)
+        if stored is not None:
+            ARTIFACT_STAGES.inc(stage=name, outcome="reused")
+            return stored, True
+    responses: List[Dict[str, Any]] = []
+    token = _llm_responses.set(responses)
+    try:
+        output = await compute()
+    finally:
+        _llm_responses.reset(token)
+    ARTIFACT_STAGES.inc(stage=name, outcome="run")
+    if artifacts is not None and usable(output):
+        artifacts.put(stage, key, output, responses)
+    return output, False
+
+
+async def process_document(
+    file_path: Path,
+    pipeline_mode: Optional[str] = None,
+    on_partial: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    artifacts: Optional[JobArtifacts] = None,
+    rerun: Sequence[str] = (),
+    known_doc_info: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[str, Any], bool]:
     """
     Process a document file (PDF or image) and extract information
+    Every page is extracted in parallel and the per-page attributes are merged.
+    With LLM_STREAMING, `on_partial` is called with the non-empty fields read
+    so far (first page wins) every time a streamed answer adds one.
+    With `artifacts`, the outputs of every stage are recorded there, and stored
+    outputs whose inputs did not change are reused instead of running the
+    stage again, except for the stages named in `rerun`. `known_doc_info`
+    skips identification and extracts the document as that type.
     Returns tuple of (result, success)
     """
+    mode = TWO_STEP if known_doc_info is not None else pipeline_mode or PIPELINE_MODE
     try:
-        # Check if Groq API key is set
-        api_key = os.environ.get("GROQ_API_KEY")
-        if not api_key:
+        # Shared Groq client, None if the API key is not set
+        client = get_client()
+        if client is None:
             logger.error("GROQ_API_KEY environment variable not set")
             return {"error": "GROQ_API_KEY not configured"}, False
         
-        # Setup Groq client
-        client = Groq(api_key=api_key)
+        pages, pages_reused = await _load_pages(file_path, artifacts, rerun)
+        page_digests = [hashlib.sha256(page.encode("utf-8")).hexdigest() for page in pages]
+        started = time.monotonic()
+        llm_calls = 0
+        fallback = False
+        preclassified = None
+        doc_info, page_attributes = known_doc_info, None
+        reused = ["pages"] if pages_reused else []
         
-        # Determine content type
-        content_type, _ = mimetypes.guess_type(file_path)
+        if mode == SINGLE_CALL:
+            logger.info(f"Classifying and extracting {len(pages)} page(s) in a single call each...")
+            stages = await asyncio.gather(*(
+                _run_stage(
+                    artifacts, f"single_call:{page_number}",
+                    input_key(digest, SINGLE_CALL_PROMPT, model_router.models_for("single_call"), LLM_RESPONSE_FORMAT), rerun,
+                    lambda page=page: classify_and_extract(client, page),
+                    lambda outcome: outcome[1] is not None,
+                )
+                for page_number, (page, digest) in enumerate(zip(pages, page_digests), start=1)
+            ))
+            outcomes = [outcome for outcome, _ in stages]
+            reused += [f"single_call:{page_number}" for page_number, (_, hit) in enumerate(stages, start=1) if hit]
+            llm_calls += sum(not hit for _, hit in stages)
+            # The most confident page decides the document type
+            doc_info, _, confidence = max(outcomes, key=lambda outcome: outcome[2])
+            page_attributes = [attributes for _, attributes, _ in outcomes]
+            if all(attributes is None for attributes in page_attributes) or confidence < SINGLE_CALL_MIN_CONFIDENCE:
+                logger.info(f"Single-call result not usable (confidence {confidence}), falling back to two-step")
+                fallback = True
+                doc_info, page_attributes = None, None
         
-        if content_type == 'application/pdf':
-            logger.info(f"Converting PDF to image: {file_path}")
-            images = convert_from_path(file_path, first_page=1, last_page=1)
-            image = images[0]  # This is a PIL Image object
-            # Convert PIL image to base64
-            image_data = encode_pil_image(image)
-        else:  # It's an image
-            logger.info(f"Processing image: {file_path}")
-            # Load image using PIL
-            image = Image.open(file_path)
-            image_data = encode_image(file_path)
-        
-        # Step 1: Identify document type
-        logger.info("Identifying document type...")
-        doc_info = identify_document_type(client, image_data)
-        logger.info(f"Document identified as: {json.dumps(doc_info, indent=2)}")
+        if page_attributes is None:
+            if doc_info is None:
+                # Step 1: Identify document type from the first page
+                logger.info("Identifying document type...")
+                (doc_info, preclassified), hit = await _run_stage(
+                    artifacts, "identify",
+                    input_key(
+                        page_digests[0], IDENTIFY_PROMPT, model_router.models_for("identify"),
+                        LLM_RESPONSE_FORMAT, PRECLASSIFIER_MODE,
+                    ), rerun,
+                    lambda: identify_document(client, pages[0]),
+                    # A failed identification comes back as "unknown" and is worth another try
+                    lambda outcome: outcome[0]["doc_type"] != "unknown",
+                )
+                if hit:
+                    reused.append("identify")
+                elif not (preclassified and preclassified["used"]):
+                    llm_calls += 1
+                logger.info(f"Document identified as: {json.dumps(doc_info, indent=2)}")
+            
+            # Step 2: Extract information from every page based on document type
+            logger.info(f"Extracting document information from {len(pages)} page(s)...")
+            partial_fields: Dict[str, Any] = {}
+
+            async def on_field(name: str, value: Any):
+                if on_partial is None or _is_empty(value) or not _is_empty(partial_fields.get(name)):
+                    return
+                partial_fields[name] = value
+                await on_partial(dict(partial_fields))
+
+            prompt = build_extraction_prompt(doc_info)
+            schema_name = attributes_model(doc_info.get("doc_type", "")).__name__
+            extract_models = model_router.models_for("extract")
+            stages = await asyncio.gather(*(
+                _run_stage(
+                    artifacts, f"extract:{page_number}",
+                    input_key(digest, prompt, schema_name, extract_models, LLM_RESPONSE_FORMAT), rerun,
+                    lambda page=page: extract_document_info(client, page, doc_info, on_field),
+                    lambda attributes: "error" not in attributes,
+                )
+                for page_number, (page, digest) in enumerate(zip(pages, page_digests), start=1)
+            ))
+            page_attributes = [attributes for attributes, _ in stages]
+            reused += [f"extract:{page_number}" for page_number, (_, hit) in enumerate(stages, start=1) if hit]
+            llm_calls += sum(not hit for _, hit in stages)
         
-        # Step 2: Extract information based on document type
-        logger.info("Extracting document information...")
-        doc_attributes = extract_document_info(client, image_data, doc_info)
+        doc_attributes, field_sources = merge_page_attributes(page_attributes)
         
         # Combine results
         result = {
             "document_type": doc_info,
-            "attributes": doc_attributes
+            "attributes": doc_attributes,
+            "field_sources": field_sources,
+            "pipeline": {
+                "mode": mode,
+                "fallback": fallback,
+                "pages": len(pages),
+                "llm_calls": llm_calls,
+                "llm_seconds": round(time.monotonic() - started, 3),
+                "preclassifier": preclassified,
+                "reused": reused,
+            }
         }
         
         # Check if there's an error
@@ -314,58 +769,196 @@ def process_document(file_path: Path) -> Tuple[Dict[str, Any], bool]:
             
         return result, True
         
+    except ImageQualityError as e:
+        # Rejected before any LLM call; the code tells the client what to fix
+        logger.warning(f"Rejected {file_path.name} by the quality gate: {e.code}")
+        return {"error": str(e), "error_code": e.code, "quality": e.report.summary()}, False
     except Exception as e:
         logger.error(f"Error processing document: {e}")
+        record_error("process", e)
         return {"error": str(e)}, False
 
 
-async def process_document_async(job_id: str, db: Session):
+def lookup_cached_result(
+    file_path: Path,
+    pipeline_mode: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    record: bool = True
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
     """
-    Asynchronously process a document and update the database
-    This function is meant to be run in a background task
+    Look up a previous extraction of the same file content.
+    The file is only hashed when no content_hash is supplied. record=False
+    keeps a repeated lookup for the same job out of the cache's hit ratio.
+    Returns (cache_key, result); result is None on a miss. Blocking.
     """
-    # Get the job from the database
-    job = db.query(ExtractionJobs).filter(ExtractionJobs.id == job_id).first()
-    if not job:
-        logger.error(f"Job with ID {job_id} not found")
-        return
-    
-    try:
-        # Process the document
-        logger.info(f"Processing document with job ID: {job_id}")
-        file_path = Path(job.upload_path)
-        result, success = process_document(file_path)
-        
-        # Update the job in the database
+    if not RESULT_CACHE_ENABLED:
+        return None, None
+    prompt_version = f"{PROMPT_VERSION}:{pipeline_mode or PIPELINE_MODE}"
+    if PRECLASSIFIER_MODE == "on":
+        # Pre-classified results carry no country/state, keep them apart from LLM-identified ones
+        prompt_version += ":preclassified"
+    # Answers depend on every model the router may send a step to, as with the stage artifacts
+    models = json.dumps([
+        {task: model_router.models_for(task) for task in ("identify", "extract", "single_call")},
+        model_router.identify_model,
+        LLM_RESPONSE_FORMAT,
+    ])
+    cache_key = make_cache_key(content_hash or file_sha256(file_path), models, prompt_version)
+    return cache_key, result_cache.get(cache_key, record)
+
+
+def _load_job(job_id: str) -> Optional[ExtractionJobs]:
+    """Return a detached copy of the job row, or None if the job does not exist"""
+    with session_scope() as db:
+        job = db.query(ExtractionJobs).filter(ExtractionJobs.id == job_id).first()
+        if job is not None:
+            db.expunge(job)
+        return job
+
+
+def _save_job_result(job_id: str, result: Dict[str, Any], success: bool) -> Optional[Dict[str, Any]]:
+    """
+    Persist the processing outcome on the job row and return the resulting job
+    event. Nothing is written when this process no longer holds the job's
+    lease, i.e. the job was handed to another worker in the meantime.
+    """
+    with session_scope() as db:
+        job = db.query(ExtractionJobs).filter(ExtractionJobs.id == job_id).first()
+        if not job:
+            logger.error(f"Job with ID {job_id} disappeared before results were saved")
+            return None
+        if not owns_lease(job):
+            logger.warning(f"Lease on job ID {job_id} was lost to {job.lease_owner}, result discarded")
+            LEASE_EVENTS.inc(event="lost")
+            return None
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.reprocess_mode = None
+        job.error_code = None if success else result.get("error_code")
         if success:
             # Extract document type from result
-            doc_type = result.get("document_type", {}).get("doc_type", "unknown")
-            
-            # Update job with results
-            job.document_type = doc_type
-            job.extracted_fields_json = json.dumps(result)
+            job.document_type = result.get("document_type", {}).get("doc_type", "unknown")
             job.status = "completed"
-            logger.info(f"Document processing completed for job ID: {job_id}")
         else:
             # Update job with error status
             job.status = "error"
-            job.extracted_fields_json = json.dumps(result)  # Store error information
-            logger.error(f"Document processing failed for job ID: {job_id}")
-        
-        # Commit changes to database
-        db.commit()
-        
+        job.extracted_fields_json = json.dumps(result)
+        sync_document_fields(db, job_id, result if success else None)
+        db.flush()
+        return job_event(job)
+
+
+def _reprocess_plan(job: ExtractionJobs, artifacts: Optional[JobArtifacts]) -> Tuple[Sequence[str], Optional[Dict[str, str]]]:
+    """Stages to run again and, in "extract" mode, the identification to extract with"""
+    if job.reprocess_mode is None:
+        return (), None
+    rerun = REPROCESS_MODES.get(job.reprocess_mode, ())
+    if job.reprocess_mode != "extract":
+        return rerun, None
+    # The stored identification, or the one saved with the previous result
+    # (jobs processed without artifacts, or by the single-call pipeline)
+    stored = artifacts.latest("identify") if artifacts is not None else None
+    if stored:
+        return rerun, stored[0]
+    try:
+        previous = json.loads(job.extracted_fields_json or "{}").get("document_type")
+    except (ValueError, AttributeError):
+        previous = None
+    if isinstance(previous, dict) and previous.get("doc_type") not in (None, "", "unknown"):
+        return rerun, previous
+    logger.info(f"No identification stored for job ID {job.id}, identifying it again")
+    return rerun, None
+
+
+def _save_artifacts(artifacts: JobArtifacts):
+    """Failing to store artifacts only makes a later reprocess more expensive. Blocking."""
+    try:
+        artifacts.save()
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not store the artifacts of job ID {artifacts.job_id}: {e}")
+        record_error("artifacts", e)
+
+
+async def process_document_async(job_id: str):
+    """
+    Asynchronously process a document and update the database
+    This function is run by the job scheduler workers; LLM calls are awaited on
+    the event loop and blocking work is offloaded to the scheduler's thread pool.
+    """
+    # Get the job from the database
+    job = await scheduler.run_blocking(_load_job, job_id)
+    if job is None:
+        logger.error(f"Job with ID {job_id} not found")
+        return
+    if not owns_lease(job):
+        # Claimed by another worker while it was queued here
+        logger.warning(f"Skipping job ID {job_id}, its lease is held by {job.lease_owner}")
+        LEASE_EVENTS.inc(event="lost")
+        return
+    file_path = Path(job.upload_path)
+    pipeline_mode = job.pipeline_mode
+    started = time.perf_counter()
+    artifacts = await scheduler.run_blocking(JobArtifacts.load, job_id) if JOB_ARTIFACTS else None
+    rerun, known_doc_info = _reprocess_plan(job, artifacts)
+
+    async def on_partial(fields: Dict[str, Any]):
+        # Only published: the row keeps "processing" until the validated result is saved
+        await broker.publish({"type": "partial", "id": job_id, "status": "partial", "fields": fields})
+
+    try:
+        # Uploads already counted their lookup; this one only catches results
+        # stored since then (e.g. by a duplicate that finished first)
+        cache_key, result = await scheduler.run_blocking(
+            lookup_cached_result, file_path, pipeline_mode, job.content_hash, False
+        )
+        if job.reprocess_mode is not None:
+            # Asked to run again: the fresh result replaces the cached one
+            logger.info(f"Reprocessing job ID {job_id} ({job.reprocess_mode})")
+            result, success = await process_document(
+                file_path, pipeline_mode, on_partial, artifacts, rerun, known_doc_info
+            )
+            if success and cache_key:
+                await scheduler.run_blocking(result_cache.put, cache_key, result, job.content_hash)
+        elif result is not None:
+            logger.info(f"Serving job ID {job_id} from the result cache")
+            success = True
+        else:
+            # Process the document
+            logger.info(f"Processing document with job ID: {job_id}")
+            result, success = await process_document(file_path, pipeline_mode, on_partial, artifacts)
+            if success and cache_key:
+                await scheduler.run_blocking(result_cache.put, cache_key, result, job.content_hash)
     except Exception as e:
-        # Update job with error status
         logger.error(f"Exception during document processing for job ID {job_id}: {e}")
-        job.status = "error"
-        job.extracted_fields_json = json.dumps({"error": str(e)})
-        db.commit()
+        record_error("process", e)
+        result, success = {"error": str(e)}, False
 
+    if artifacts is not None and artifacts.exists():
+        await scheduler.run_blocking(_save_artifacts, artifacts)
 
-def schedule_document_processing(job_id: str, background_tasks: BackgroundTasks, db: Session):
+    # Update the job in the database, then notify subscribers
+    event = await scheduler.run_blocking(_save_job_result, job_id, result, success)
+    JOB_SECONDS.observe(time.perf_counter() - started, outcome="completed" if success else "error")
+    if event is not None:
+        await broker.publish(event)
+    if success:
+        logger.info(f"Document processing completed for job ID: {job_id}")
+    else:
+        logger.error(f"Document processing failed for job ID: {job_id}")
+
+
+# Process-wide scheduler; started and stopped by the application lifespan
+scheduler = JobScheduler(process_document_async)
+
+
+def schedule_document_processing(job_id: str):
     """
-    Schedule a document for processing in the background
+    Queue a document for processing by the job scheduler.
+    Raises QueueFullError when the queue is at capacity. With standalone
+    workers the committed row is the queue entry, so nothing is done here.
     """
-    background_tasks.add_task(process_document_async, job_id, db)
-    logger.info(f"Document processing scheduled for job ID: {job_id}") 
\ No newline at end of file
+    if JOB_RUNNER == "worker":
+        logger.info(f"Document processing left to the workers for job ID: {job_id}")
+        return
+    scheduler.submit(job_id)
+    logger.info(f"Document processing scheduled for job ID: {job_id} (lease held by {WORKER_ID})")
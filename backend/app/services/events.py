@@ -0,0 +1,173 @@
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import anyio
+
+from app.db.database import session_scope
+from app.db.models import ExtractionJobs
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Statuses after which a job emits no further events
+TERMINAL_STATUSES = {"completed", "error"}
+
+# How often the API polls for job changes written by standalone worker processes
+JOB_EVENT_POLL_INTERVAL = float(os.environ.get("JOB_EVENT_POLL_INTERVAL", "1"))  # seconds
+JOB_EVENT_POLL_LIMIT = 500
+# Changes are re-read this far back: updated_at is set when a statement runs, which
+# can be well before its transaction commits (and SQLite stores it in whole seconds)
+JOB_EVENT_POLL_OVERLAP = timedelta(seconds=5)
+
+
+def job_event(job: ExtractionJobs) -> Dict[str, Any]:
+    """Event payload describing the current state of a job"""
+    return {
+        "type": "job",
+        "id": job.id,
+        "status": job.status,
+        "error_code": job.error_code,
+        "document_type": job.document_type,
+        "file_type": job.file_type,
+        "original_filename": job.original_filename,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "extracted_fields": job.extracted_fields_json,
+    }
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize an event in the text/event-stream wire format"""
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(event)}\n\n"
+
+
+class EventBroker:
+    """
+    Publish/subscribe interface for job events.
+    The in-process implementation below is enough for a single API process;
+    a shared backend (e.g. Redis pub/sub) can implement the same methods.
+    """
+
+    async def publish(self, event: Dict[str, Any]):
+        raise NotImplementedError
+
+    def open_subscription(self, job_id: Optional[str] = None) -> asyncio.Queue:
+        raise NotImplementedError
+
+    def close_subscription(self, queue: asyncio.Queue, job_id: Optional[str] = None):
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: Optional[str] = None):
+        """Context manager around open_subscription/close_subscription"""
+        queue = self.open_subscription(job_id)
+        try:
+            yield queue
+        finally:
+            self.close_subscription(queue, job_id)
+
+
+class InMemoryEventBroker(EventBroker):
+    """Fan events out to asyncio queues of the subscribers in this process"""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        # job_id -> subscriber queues; None holds subscribers to every job
+        self._subscribers: Dict[Optional[str], Set[asyncio.Queue]] = {}
+
+    async def publish(self, event: Dict[str, Any]):
+        targets = set(self._subscribers.get(None, ()))
+        if event.get("id") is not None:
+            targets |= self._subscribers.get(event["id"], set())
+        for queue in targets:
+            if queue.full():
+                # A slow client loses its oldest event rather than blocking publishers
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def open_subscription(self, job_id: Optional[str] = None) -> asyncio.Queue:
+        """Register a queue receiving events for one job, or for all jobs when job_id is None"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def close_subscription(self, queue: asyncio.Queue, job_id: Optional[str] = None):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+# Process-wide broker
+broker = InMemoryEventBroker()
+
+
+class JobEventRelay:
+    """
+    Publishes job changes made by other processes on the local broker.
+
+    Standalone workers write results straight to the database, where the API
+    process would never hear of them; this polls rows by updated_at, with an
+    overlap so that late commits are not missed, and publishes a job event for
+    every change not published before.
+    """
+
+    def __init__(self, event_broker: EventBroker, interval: float = JOB_EVENT_POLL_INTERVAL):
+        self.broker = event_broker
+        self.interval = interval
+        self._watermark = datetime.utcnow()
+        self._seen: Dict[str, Tuple[str, datetime]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._watermark = datetime.utcnow()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _changes(self) -> List[Dict[str, Any]]:
+        with session_scope() as db:
+            jobs = (
+                db.query(ExtractionJobs)
+                .filter(ExtractionJobs.updated_at >= self._watermark - JOB_EVENT_POLL_OVERLAP)
+                .order_by(ExtractionJobs.updated_at)
+                .limit(JOB_EVENT_POLL_LIMIT)
+                .all()
+            )
+            events = []
+            for job in jobs:
+                version = (job.status, job.updated_at)
+                if self._seen.get(job.id) != version:
+                    self._seen[job.id] = version
+                    events.append(job_event(job))
+            if jobs:
+                self._watermark = max(self._watermark, jobs[-1].updated_at)
+        horizon = self._watermark - JOB_EVENT_POLL_OVERLAP
+        self._seen = {job_id: version for job_id, version in self._seen.items() if version[1] >= horizon}
+        return events
+
+    async def _run(self):
+        while True:
+            try:
+                for event in await anyio.to_thread.run_sync(self._changes):
+                    await self.broker.publish(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Relaying job events failed: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,242 @@
+import os
+import re
+import json
+import logging
+import unicodedata
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text, select, outerjoin
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.db.database import engine, IS_SQLITE, session_scope
+from app.db.models import ExtractionJobs, DocumentFields
+from app.models.extraction_schemas import field_key
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Full-text name search through SQLite FTS5, when the SQLite build supports it
+FIELD_SEARCH_FTS = os.environ.get("FIELD_SEARCH_FTS", "true").lower() == "true"
+FTS_TABLE = "document_fields_fts"
+
+# Rows indexed per transaction when backfilling jobs completed before the index existed
+BACKFILL_BATCH_SIZE = 500
+
+# Extracted attribute names (lower-cased, without the "(MM/DD/YYYY)" style hints)
+# mapped onto the indexed columns
+ATTRIBUTE_COLUMNS = {
+    "first name": "first_name",
+    "given name": "first_name",
+    "given names": "first_name",
+    "last name": "last_name",
+    "surname": "last_name",
+    "date of birth": "date_of_birth",
+    "passport number": "document_number",
+    "license number": "document_number",
+    "card number": "document_number",
+    "document number": "document_number",
+    "issue date": "issue_date",
+    "expiry date": "expiry_date",
+    "expiration date": "expiry_date",
+}
+DATE_COLUMNS = {"date_of_birth", "issue_date", "expiry_date"}
+
+# Accepted date layouts, most likely first; the prompts ask for MM/DD/YYYY
+DATE_FORMATS = [
+    "%m/%d/%Y", "%Y-%m-%d", "%m-%d-%Y", "%Y/%m/%d", "%m.%d.%Y",
+    "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y", "%b %d %Y", "%B %d %Y",
+    "%m/%d/%y",
+]
+
+_fts_available: Optional[bool] = None
+
+
+def normalize_name(value: Any) -> Optional[str]:
+    """Case-fold, strip accents and collapse whitespace"""
+    if value is None:
+        return None
+    decomposed = unicodedata.normalize("NFKD", str(value))
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    normalized = " ".join(stripped.casefold().split())
+    return normalized or None
+
+
+def normalize_number(value: Any) -> Optional[str]:
+    """Upper-case alphanumerics only, so "ab 123-45" matches "AB12345" """
+    if value is None:
+        return None
+    normalized = re.sub(r"[^0-9A-Za-z]", "", str(value)).upper()
+    return normalized or None
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Parse an extracted date string; returns None when no known layout matches"""
+    if value is None:
+        return None
+    cleaned = " ".join(str(value).replace(",", ", ").split()).replace(" ,", ",")
+    if not cleaned:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(cleaned, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def document_type_key(doc_type: Any) -> Optional[str]:
+    """Map free-form document type names onto the supported classes"""
+    doc_type = normalize_name(doc_type)
+    if not doc_type:
+        return None
+    if "passport" in doc_type:
+        return "passport"
+    if "ead" in doc_type or "employment authorization" in doc_type:
+        return "ead"
+    if "license" in doc_type or "driver" in doc_type:
+        return "driver_license"
+    return "other"
+
+
+def _attribute_column(name: str) -> Optional[str]:
+    return ATTRIBUTE_COLUMNS.get(field_key(name))
+
+
+def extract_key_fields(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalized values for the DocumentFields columns from an extraction result"""
+    doc_info = result.get("document_type") or {}
+    fields: Dict[str, Any] = {
+        "document_type": document_type_key(doc_info.get("doc_type")),
+        "country": normalize_name(doc_info.get("country")),
+        "state": normalize_name(doc_info.get("state")),
+    }
+    for name, value in (result.get("attributes") or {}).items():
+        column = _attribute_column(name)
+        if column is None or fields.get(column) is not None:
+            continue
+        if column in DATE_COLUMNS:
+            fields[column] = parse_date(value)
+        elif column == "document_number":
+            fields[column] = normalize_number(value)
+        else:
+            fields[column] = normalize_name(value)
+    names = [fields.get("first_name"), fields.get("last_name")]
+    fields["full_name"] = " ".join(name for name in names if name) or None
+    return fields
+
+
+def ensure_search_index():
+    """Create the FTS5 table for name search if enabled and supported"""
+    global _fts_available
+    if not (IS_SQLITE and FIELD_SEARCH_FTS):
+        _fts_available = False
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(job_id UNINDEXED, full_name, tokenize='unicode61 remove_diacritics 2')"
+            ))
+        _fts_available = True
+    except OperationalError as e:
+        logger.warning(f"FTS5 is not available, name search falls back to exact name matches: {e}")
+        _fts_available = False
+
+
+def fts_available(db: Session) -> bool:
+    """Whether the FTS table exists; checked once per process"""
+    global _fts_available
+    if _fts_available is None:
+        if not (IS_SQLITE and FIELD_SEARCH_FTS):
+            _fts_available = False
+        else:
+            _fts_available = db.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE},
+            ).first() is not None
+    return _fts_available
+
+
+def _fields_rowid(db: Session, job_id: str) -> Optional[int]:
+    return db.execute(
+        text("SELECT rowid FROM document_fields WHERE job_id = :job_id"), {"job_id": job_id}
+    ).scalar()
+
+
+def sync_document_fields(db: Session, job_id: str, result: Optional[Dict[str, Any]]):
+    """
+    Upsert the indexed fields of a job in the caller's transaction.
+    A missing result (failed job) removes the job from the index.
+    FTS rows share the rowid of their document_fields row, so updates and
+    deletes are rowid lookups rather than scans.
+    """
+    if result is None:
+        remove_document_fields(db, job_id)
+        return
+    fields = extract_key_fields(result)
+    row = db.get(DocumentFields, job_id)
+    if row is None:
+        row = DocumentFields(job_id=job_id)
+        db.add(row)
+    for column, value in fields.items():
+        setattr(row, column, value)
+    if fts_available(db):
+        db.flush()
+        rowid = _fields_rowid(db, job_id)
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": rowid})
+        if fields["full_name"]:
+            db.execute(
+                text(f"INSERT INTO {FTS_TABLE} (rowid, job_id, full_name) VALUES (:rowid, :job_id, :full_name)"),
+                {"rowid": rowid, "job_id": job_id, "full_name": fields["full_name"]},
+            )
+
+
+def remove_document_fields(db: Session, job_id: str):
+    if fts_available(db):
+        rowid = _fields_rowid(db, job_id)
+        if rowid is not None:
+            db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": rowid})
+    db.query(DocumentFields).filter(DocumentFields.job_id == job_id).delete(synchronize_session=False)
+
+
+def clear_document_fields(db: Session):
+    db.query(DocumentFields).delete(synchronize_session=False)
+    if fts_available(db):
+        db.execute(text(f"DELETE FROM {FTS_TABLE}"))
+
+
+def backfill_document_fields() -> int:
+    """Index completed jobs that have no DocumentFields row yet; returns the number indexed"""
+    indexed = 0
+    while True:
+        with session_scope() as db:
+            rows = db.execute(
+                select(ExtractionJobs.id, ExtractionJobs.extracted_fields_json)
+                .select_from(outerjoin(ExtractionJobs, DocumentFields, ExtractionJobs.id == DocumentFields.job_id))
+                .where(ExtractionJobs.status == "completed", DocumentFields.job_id.is_(None))
+                .limit(BACKFILL_BATCH_SIZE)
+            ).all()
+            for job_id, fields_json in rows:
+                try:
+                    result = json.loads(fields_json) if fields_json else {}
+                except json.JSONDecodeError:
+                    result = {}
+                # Unparseable results still get an (empty) row so they are not retried forever
+                sync_document_fields(db, job_id, result if isinstance(result, dict) else {})
+        indexed += len(rows)
+        if len(rows) < BACKFILL_BATCH_SIZE:
+            break
+    if indexed:
+        logger.info(f"Indexed key fields of {indexed} existing jobs")
+    return indexed
+
+
+def name_tokens(name: str) -> List[str]:
+    return re.findall(r"\w+", normalize_name(name) or "")
+
+
+def fts_query(tokens: List[str]) -> str:
+    """FTS5 MATCH expression requiring every token as a prefix"""
+    return " AND ".join(f'"{token}"*' for token in tokens)
@@ -0,0 +1,273 @@
+import os
+import json
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import anyio
+from sqlalchemy import and_, case, func, or_, update
+
+from app.db.database import session_scope
+from app.db.models import ExtractionJobs
+from app.services.events import broker, job_event
+from app.services.field_index import sync_document_fields
+from app.services.job_queue import JobScheduler, QueueFullError
+from app.services.metrics import Counter, record_error, registry
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# "inline" processes jobs in the API process; "worker" leaves them to
+# standalone `python -m app.worker` processes sharing the database
+JOB_RUNNERS = ("inline", "worker")
+JOB_RUNNER = os.environ.get("JOB_RUNNER", "inline").lower()
+
+# Identifies this process on the leases it holds. A stable name (e.g. the pod
+# name) lets a restarted process take its own orphaned jobs back immediately.
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# A lease not renewed for this long is expired and its job can be claimed again
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 3
+# Jobs whose lease expired this many times (crashed or killed workers) are failed
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# How often the API process looks for jobs abandoned by crashed processes (inline runner)
+JOB_RECOVERY_INTERVAL = float(os.environ.get("JOB_RECOVERY_INTERVAL", "15"))  # seconds
+
+# Rows examined per claim or recovery round
+CLAIM_BATCH_SIZE = 100
+
+LEASE_EVENTS = registry.register(Counter(
+    "docparser_job_leases_total",
+    "Job lease events (claimed, released, lost, exhausted)",
+    ["event"],
+))
+
+
+def _attempts():
+    return func.coalesce(ExtractionJobs.attempts, 0)
+
+
+def _refunded_attempts():
+    return case((_attempts() > 0, _attempts() - 1), else_=0)
+
+
+def _unleased(now: datetime):
+    return and_(
+        ExtractionJobs.status == "processing",
+        or_(ExtractionJobs.lease_expires_at.is_(None), ExtractionJobs.lease_expires_at < now),
+    )
+
+
+def _lease_update(*conditions):
+    # Lease bookkeeping keeps updated_at as is, so it is not relayed as a job change
+    return (
+        update(ExtractionJobs)
+        .where(*conditions)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def lease_new_job(job: ExtractionJobs):
+    """
+    Prepare a new job row for processing. The inline runner leases it to this
+    process right away, since the upload handler queues it itself; standalone
+    workers claim unleased rows.
+    """
+    job.attempts = 0
+    if JOB_RUNNER == "inline":
+        job.lease_owner = WORKER_ID
+        job.lease_expires_at = datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+        job.attempts = 1
+
+
+def claim_jobs(owner: str, limit: int) -> List[str]:
+    """
+    Claim up to `limit` unleased or expired jobs, oldest first. Each claim is a
+    compare-and-set on the row, so concurrent workers never get the same job.
+    Blocking.
+    """
+    if limit <= 0:
+        return []
+    now = datetime.utcnow()
+    claimable = and_(_unleased(now), _attempts() < JOB_MAX_ATTEMPTS)
+    claimed = []
+    with session_scope() as db:
+        candidates = [
+            job_id for job_id, in db.query(ExtractionJobs.id)
+            .filter(claimable)
+            .order_by(ExtractionJobs.created_at, ExtractionJobs.id)
+            .limit(min(limit * 2, CLAIM_BATCH_SIZE))
+        ]
+        for job_id in candidates:
+            result = db.execute(
+                _lease_update(ExtractionJobs.id == job_id, claimable).values(
+                    lease_owner=owner,
+                    lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    attempts=_attempts() + 1,
+                    updated_at=ExtractionJobs.updated_at,
+                )
+            )
+            if result.rowcount == 1:
+                claimed.append(job_id)
+                if len(claimed) == limit:
+                    break
+    if claimed:
+        LEASE_EVENTS.inc(len(claimed), event="claimed")
+    return claimed
+
+
+def renew_leases(owner: str) -> int:
+    """Extend every lease held by `owner`, queued and running jobs alike. Blocking."""
+    with session_scope() as db:
+        return db.execute(
+            _lease_update(ExtractionJobs.lease_owner == owner, ExtractionJobs.status == "processing").values(
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+                updated_at=ExtractionJobs.updated_at,
+            )
+        ).rowcount
+
+
+def release_leases(owner: str, refund_attempt: bool = True) -> int:
+    """
+    Make the unfinished jobs of `owner` claimable again. A graceful shutdown
+    refunds the attempt; a restart taking back its orphaned jobs does not.
+    Blocking.
+    """
+    values: Dict[str, Any] = {"lease_owner": None, "lease_expires_at": None, "updated_at": ExtractionJobs.updated_at}
+    if refund_attempt:
+        values["attempts"] = _refunded_attempts()
+    with session_scope() as db:
+        released = db.execute(
+            _lease_update(ExtractionJobs.lease_owner == owner, ExtractionJobs.status == "processing").values(**values)
+        ).rowcount
+    if released:
+        LEASE_EVENTS.inc(released, event="released")
+    return released
+
+
+def job_backlog() -> Dict[str, int]:
+    """Unfinished jobs waiting for a worker and jobs leased by one. Blocking."""
+    now = datetime.utcnow()
+    with session_scope() as db:
+        pending = db.query(func.count(ExtractionJobs.id)).filter(_unleased(now)).scalar()
+        leased = db.query(func.count(ExtractionJobs.id)).filter(
+            ExtractionJobs.status == "processing", ExtractionJobs.lease_expires_at >= now
+        ).scalar()
+    return {"pending": pending, "leased": leased}
+
+
+def owns_lease(job: ExtractionJobs, owner: str = WORKER_ID) -> bool:
+    return job.status == "processing" and job.lease_owner == owner
+
+
+def fail_exhausted_jobs() -> List[Dict[str, Any]]:
+    """Fail jobs that lost their lease JOB_MAX_ATTEMPTS times; returns their job events. Blocking."""
+    events = []
+    with session_scope() as db:
+        jobs = (
+            db.query(ExtractionJobs)
+            .filter(_unleased(datetime.utcnow()), _attempts() >= JOB_MAX_ATTEMPTS)
+            .limit(CLAIM_BATCH_SIZE)
+            .all()
+        )
+        for job in jobs:
+            logger.error(f"Job ID {job.id} was interrupted {job.attempts} times, giving up")
+            job.status = "error"
+            job.extracted_fields_json = json.dumps({"error": f"Processing was interrupted {job.attempts} times"})
+            job.lease_owner = None
+            job.lease_expires_at = None
+            sync_document_fields(db, job.id, None)
+            db.flush()
+            events.append(job_event(job))
+    if events:
+        LEASE_EVENTS.inc(len(events), event="exhausted")
+    return events
+
+
+class LeaseKeeper:
+    """
+    Keeps the leases of one process: renews them every JOB_HEARTBEAT_INTERVAL,
+    claims jobs abandoned by crashed processes (standalone workers: every
+    pending job) into the scheduler and fails jobs out of attempts.
+
+    `claim_limit` returns how many jobs may be claimed at the moment, e.g. the
+    idle workers of a standalone worker or the free queue slots of the API.
+    """
+
+    def __init__(
+        self,
+        scheduler: JobScheduler,
+        poll_interval: float,
+        claim_limit: Callable[[], int],
+        owner: str = WORKER_ID,
+    ):
+        self.scheduler = scheduler
+        self.poll_interval = poll_interval
+        self.claim_limit = claim_limit
+        self.owner = owner
+        self.claiming = True
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # Jobs still leased under this name belong to a previous run of this process
+        recovered = await anyio.to_thread.run_sync(release_leases, self.owner, False)
+        if recovered:
+            logger.warning(f"Recovered {recovered} jobs left unfinished by a previous run of {self.owner}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, release: bool = True):
+        """Stop renewing; with `release` the unfinished jobs become claimable right away"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if release:
+            released = await anyio.to_thread.run_sync(release_leases, self.owner)
+            if released:
+                logger.info(f"Released {released} unfinished jobs")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_heartbeat = loop.time()
+        while True:
+            try:
+                if loop.time() >= next_heartbeat:
+                    await anyio.to_thread.run_sync(renew_leases, self.owner)
+                    next_heartbeat = loop.time() + JOB_HEARTBEAT_INTERVAL
+                for event in await anyio.to_thread.run_sync(fail_exhausted_jobs):
+                    await broker.publish(event)
+                if self.claiming:
+                    await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job lease upkeep failed: {e}")
+                record_error("job_lease", e)
+            await asyncio.sleep(min(self.poll_interval, JOB_HEARTBEAT_INTERVAL))
+
+    async def _claim(self):
+        job_ids = await anyio.to_thread.run_sync(claim_jobs, self.owner, self.claim_limit())
+        for index, job_id in enumerate(job_ids):
+            try:
+                self.scheduler.submit(job_id)
+            except QueueFullError:
+                # Claimed more than fits; hand the rest back for another worker
+                await anyio.to_thread.run_sync(_release_jobs, job_ids[index:], self.owner)
+                break
+        if job_ids:
+            logger.info(f"Claimed {len(job_ids)} jobs: {', '.join(job_ids)}")
+
+
+def _release_jobs(job_ids: List[str], owner: str):
+    with session_scope() as db:
+        db.execute(
+            _lease_update(ExtractionJobs.id.in_(job_ids), ExtractionJobs.lease_owner == owner).values(
+                lease_owner=None,
+                lease_expires_at=None,
+                attempts=_refunded_attempts(),
+                updated_at=ExtractionJobs.updated_at,
+            )
+        )
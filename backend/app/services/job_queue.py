@@ -0,0 +1,171 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Scheduler configuration
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "4"))
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "100"))
+DEFAULT_RETRY_AFTER = 5  # seconds, used until a job duration has been observed
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the scheduler queue is at capacity"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Processing queue is full")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Bounded in-process job scheduler.
+    Jobs are queued on a bounded asyncio queue and consumed by a fixed number of
+    worker tasks. Blocking work is pushed onto a dedicated thread pool via
+    `run_blocking` so the event loop stays free to serve requests.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str], Awaitable[Any]],
+        max_concurrency: int = MAX_CONCURRENT_JOBS,
+        max_queue_size: int = MAX_QUEUED_JOBS,
+    ):
+        self.handler = handler
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max(1, max_queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._avg_duration: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    async def start(self):
+        """Create the queue, thread pool and worker tasks on the running loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="doc-worker"
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.max_concurrency)
+        ]
+        logger.info(
+            f"Job scheduler started with {self.max_concurrency} workers "
+            f"and a queue of {self.max_queue_size}"
+        )
+
+    async def stop(self):
+        """Cancel workers and release the thread pool. Queued jobs are dropped."""
+        if not self.running:
+            return
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        dropped = self._queue.qsize()
+        self._queue = None
+        if dropped:
+            logger.warning(f"Job scheduler stopped with {dropped} queued jobs not processed")
+        logger.info("Job scheduler stopped.")
+
+    def is_full(self) -> bool:
+        return self.running and self._queue.full()
+
+    def free_slots(self) -> int:
+        return self._queue.maxsize - self._queue.qsize() if self.running else 0
+
+    def idle_workers(self) -> int:
+        """Workers that would start a new job right away"""
+        if not self.running:
+            return 0
+        return max(0, self.max_concurrency - self._in_flight - self._queue.qsize())
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until queued and running jobs are done; returns False on timeout"""
+        if not self.running:
+            return True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def check_capacity(self, count: int = 1):
+        """Raise QueueFullError if `count` new jobs would not fit in the queue right now"""
+        if self.running and self.free_slots() < count:
+            self._rejected += count
+            raise QueueFullError(self.retry_after())
+
+    def retry_after(self) -> int:
+        """Estimate how many seconds until a queue slot frees up"""
+        if self._avg_duration is None:
+            return DEFAULT_RETRY_AFTER
+        depth = self._queue.qsize() if self.running else 0
+        return max(1, math.ceil(self._avg_duration * (depth + 1) / self.max_concurrency))
+
+    def submit(self, job_id: str):
+        """Enqueue a job without waiting. Raises QueueFullError when at capacity."""
+        if not self.running:
+            raise RuntimeError("Job scheduler is not running")
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise QueueFullError(self.retry_after())
+
+    async def run_blocking(self, func: Callable, *args) -> Any:
+        """Run a blocking callable on the scheduler's thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self.running else 0,
+            "in_flight": self._in_flight,
+            "max_queue_size": self.max_queue_size,
+            "max_concurrency": self.max_concurrency,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "avg_job_seconds": round(self._avg_duration, 3) if self._avg_duration else None,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            self._in_flight += 1
+            started = time.monotonic()
+            try:
+                await self.handler(job_id)
+                self._completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"Worker {index} failed on job ID {job_id}: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+                duration = time.monotonic() - started
+                # Exponentially weighted average keeps Retry-After estimates current
+                if self._avg_duration is None:
+                    self._avg_duration = duration
+                else:
+                    self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
@@ -0,0 +1,100 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+# Text tolerated before the opening brace ("```json", "Here is the JSON:" ...)
+MAX_PREAMBLE_CHARS = 200
+
+
+class IncrementalJSONObject:
+    """
+    Incremental parser for a JSON object arriving in pieces, as in a streamed
+    completion. Top-level members are decoded as soon as the comma or closing
+    brace after them arrives, so fields can be used before the answer is
+    complete; nested objects and arrays are returned once they are whole.
+
+    `closed` is set when the object's closing brace has been read, `trailing`
+    when text other than whitespace follows it (and is ignored), `malformed`
+    when the text cannot be a JSON object.
+    """
+
+    def __init__(self):
+        self.members: Dict[str, Any] = {}
+        self.closed = False
+        self.trailing = False
+        self.malformed = False
+        self._started = False
+        self._preamble = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        """No further input can change the members"""
+        return self.closed or self.malformed
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume the next piece of text; returns the members it completed, in order"""
+        completed: List[Tuple[str, Any]] = []
+        for char in text:
+            if self.closed:
+                self.trailing = self.trailing or not char.isspace()
+                continue
+            if self.malformed:
+                break
+            if not self._started:
+                self._skip_preamble(char)
+                continue
+            if self._in_string:
+                self._member.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if self._depth == 0 and char in ",}":
+                member = "".join(self._member).strip()
+                self._member = []
+                if member:
+                    completed.extend(self._decode(member))
+                elif char == "," or self.members:
+                    # An empty member: "{,", ",," or a trailing ",}"
+                    self.malformed = True
+                if char == "}" and not self.malformed:
+                    self.closed = True
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth < 0:
+                    self.malformed = True
+                    continue
+            self._member.append(char)
+        return completed
+
+    def _skip_preamble(self, char: str):
+        if char == "{":
+            self._started = True
+            return
+        self._preamble += 1
+        if self._preamble > MAX_PREAMBLE_CHARS:
+            self.malformed = True
+
+    def _decode(self, member: str) -> List[Tuple[str, Any]]:
+        try:
+            decoded = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            self.malformed = True
+            return []
+        if not isinstance(decoded, dict) or len(decoded) != 1:
+            self.malformed = True
+            return []
+        key, value = next(iter(decoded.items()))
+        self.members[key] = value
+        return [(key, value)]
@@ -0,0 +1,145 @@
+import os
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from groq import AsyncGroq, APIStatusError, APIConnectionError, DefaultAsyncHttpxClient
+
+from app.services.metrics import LLM_RETRIES, record_error
+from app.services.rate_limiter import parse_duration, rate_limiter
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Connection pool configuration shared by every extraction job
+GROQ_MAX_CONNECTIONS = int(os.environ.get("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("GROQ_MAX_KEEPALIVE_CONNECTIONS", "10"))
+GROQ_KEEPALIVE_EXPIRY = float(os.environ.get("GROQ_KEEPALIVE_EXPIRY", "60"))  # seconds
+GROQ_TIMEOUT = float(os.environ.get("GROQ_TIMEOUT", "60"))  # seconds
+GROQ_CONNECT_TIMEOUT = float(os.environ.get("GROQ_CONNECT_TIMEOUT", "5"))  # seconds
+
+# Retry configuration
+MAX_RETRIES = 3
+RETRY_DELAY = 2  # seconds, base of the exponential backoff
+MAX_RETRY_DELAY = 30  # seconds
+RETRYABLE_STATUS_CODES = {408, 500, 502, 503, 504}
+# 429s are retried separately: the rate limiter holds every request until the quota frees up
+RATE_LIMIT_STATUS_CODE = 429
+MAX_RATE_LIMIT_RETRIES = int(os.environ.get("GROQ_MAX_RATE_LIMIT_RETRIES", "6"))
+
+_client: Optional[AsyncGroq] = None
+
+
+def init_client() -> Optional[AsyncGroq]:
+    """
+    Create the process-wide AsyncGroq client.
+    Called from the application lifespan; returns None when no API key is configured.
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        logger.warning("GROQ_API_KEY environment variable not set, LLM client not created")
+        return None
+
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(GROQ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT),
+        # Feed rate-limit headers (and 429s) of every response to the shared limiter
+        event_hooks={"response": [rate_limiter.on_response]},
+    )
+    # Retries are handled by retry_api_call so the SDK's own retry loop is disabled
+    _client = AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+    logger.info(
+        f"Groq client created (max {GROQ_MAX_CONNECTIONS} connections, "
+        f"{GROQ_MAX_KEEPALIVE_CONNECTIONS} keep-alive)"
+    )
+    return _client
+
+
+async def close_client():
+    """Close the shared client and its connection pool"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+        logger.info("Groq client closed.")
+
+
+def get_client() -> Optional[AsyncGroq]:
+    """Return the shared client, creating it lazily outside of the app lifespan"""
+    return _client if _client is not None else init_client()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Server errors, timeouts and dropped connections are worth retrying"""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, APIConnectionError)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, APIStatusError) and error.status_code == RATE_LIMIT_STATUS_CODE
+
+
+def rate_limit_delay(error: APIStatusError, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a 429 ourselves. Zero when the response
+    hook already paused the limiter, since the next admission waits for it.
+    """
+    if rate_limiter.retry_after() > 0:
+        return 0.0
+    return parse_duration(error.response.headers.get("retry-after")) or backoff_delay(attempt)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given 1-based attempt"""
+    ceiling = min(MAX_RETRY_DELAY, RETRY_DELAY * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+async def retry_api_call(func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """
+    Run an API call through the shared rate limiter, retrying transient
+    failures with jittered exponential backoff and 429s after their retry-after
+    """
+    retries = 0
+    rate_limit_retries = 0
+    while True:
+        try:
+            async with rate_limiter.slot():
+                return await func(*args, **kwargs)
+        except Exception as e:
+            if is_rate_limited(e) and rate_limit_retries < MAX_RATE_LIMIT_RETRIES:
+                rate_limit_retries += 1
+                delay = rate_limit_delay(e, rate_limit_retries)
+                LLM_RETRIES.inc(reason=str(RATE_LIMIT_STATUS_CODE))
+                logger.warning(
+                    f"Groq API rate limit reached. Retrying after the limiter reopens... "
+                    f"(Attempt {rate_limit_retries}/{MAX_RATE_LIMIT_RETRIES})"
+                )
+                if delay:
+                    await asyncio.sleep(delay)
+                continue
+
+            retries += 1
+            if retries >= MAX_RETRIES or not is_retryable(e):
+                record_error("llm_call", e)
+                raise
+
+            delay = backoff_delay(retries)
+            status = getattr(e, "status_code", type(e).__name__)
+            LLM_RETRIES.inc(reason=str(status))
+            logger.warning(
+                f"Groq API temporarily unavailable ({status}). Retrying in {delay:.1f} seconds... "
+                f"(Attempt {retries}/{MAX_RETRIES})"
+            )
+            await asyncio.sleep(delay)
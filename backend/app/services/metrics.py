@@ -0,0 +1,234 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from fast local work up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count per label combination"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Current value read from a callback at scrape time, so updates cost nothing"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {_format_number(self.callback())}"]
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count per label combination"""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self, **labels: str) -> Optional[Dict[str, float]]:
+        series = self._series.get(self._key(labels))
+        if series is None:
+            return None
+        return {"count": series[2], "sum": series[1]}
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_number(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry, exported on /metrics
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "docparser_stage_seconds",
+    "Time spent per pipeline stage (upload_write, pdf_rasterize, quality_check, image_encode, preview_render, identify_call, "
+    "extract_call, single_call, first_field, repair_call, json_parse, rate_limit_wait, db_commit, retention_sweep, sqlite_vacuum)",
+    ["stage"],
+))
+JOB_SECONDS = registry.register(Histogram(
+    "docparser_job_seconds",
+    "Processing time of a job from dequeue to saved result",
+    ["outcome"],
+))
+LLM_REQUESTS = registry.register(Counter(
+    "docparser_llm_requests_total",
+    "Chat completion requests by model and outcome",
+    ["model", "outcome"],
+))
+LLM_STREAMS = registry.register(Counter(
+    "docparser_llm_streams_total",
+    "Streamed completions by how they ended (closed, fields_complete, malformed, ended)",
+    ["outcome"],
+))
+LLM_RETRIES = registry.register(Counter(
+    "docparser_llm_retries_total",
+    "LLM calls retried after a transient failure, by reason",
+    ["reason"],
+))
+LLM_TOKENS = registry.register(Counter(
+    "docparser_llm_tokens_total",
+    "LLM token usage reported by the API",
+    ["model", "kind"],
+))
+ERRORS = registry.register(Counter(
+    "docparser_errors_total",
+    "Errors by stage and exception class",
+    ["stage", "error_class"],
+))
+STRUCTURED_OUTPUT = registry.register(Counter(
+    "docparser_structured_output_total",
+    "Model answers by step and validation outcome (valid, repaired, failed)",
+    ["task", "outcome"],
+))
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def time_stage(stage: str):
+    """Context manager timing one pipeline stage"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def record_error(stage: str, error: BaseException):
+    ERRORS.inc(stage=stage, error_class=type(error).__name__)
+
+
+def record_usage(model: str, usage) -> None:
+    """Add the token counts of a completion's `usage` block"""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+
+
+def register_gauge(name: str, documentation: str, callback: Callable[[], float]):
+    registry.register(Gauge(name, documentation, callback))
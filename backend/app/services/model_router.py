@@ -0,0 +1,277 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from app.services.metrics import Counter, Histogram, registry
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _model_list(value: str) -> List[str]:
+    return [model.strip() for model in value.split(",") if model.strip()]
+
+
+# Model used for every step unless routed elsewhere
+PRIMARY_MODEL = os.environ.get("GROQ_VISION_MODEL_1", "meta-llama/llama-4-scout-17b-16e-instruct")
+# Cheaper/faster model for the document type identification step
+IDENTIFY_MODEL = os.environ.get("GROQ_IDENTIFY_MODEL", "") or PRIMARY_MODEL
+# Ordered models tried when the preferred one fails; defaults to GROQ_VISION_MODEL_2
+FALLBACK_MODELS = _model_list(os.environ.get("GROQ_FALLBACK_MODELS", "") or os.environ.get("GROQ_VISION_MODEL_2", ""))
+
+# Hedging: after a delay, a slow extraction call is duplicated on the next model
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Delay used until enough latencies are known, then the HEDGE_QUANTILE of the model's latency
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", "8"))  # seconds
+LLM_HEDGE_QUANTILE = float(os.environ.get("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "1"))  # seconds
+# When hedges rarely beat the original, hedge later (halfway between the quantile and the maximum)
+LLM_HEDGE_MIN_WIN_RATE = float(os.environ.get("LLM_HEDGE_MIN_WIN_RATE", "0.2"))
+HEDGE_MIN_SAMPLES = 20
+HEDGED_TASKS = ("extract", "single_call")
+
+# A model failing this many calls in a row is tried last for the cooldown period
+LLM_FALLBACK_AFTER_FAILURES = int(os.environ.get("LLM_FALLBACK_AFTER_FAILURES", "3"))
+LLM_FALLBACK_COOLDOWN = float(os.environ.get("LLM_FALLBACK_COOLDOWN", "60"))  # seconds
+
+# Latencies kept per model and task for the adaptive hedge delay
+LATENCY_WINDOW = 200
+
+MODEL_SECONDS = registry.register(Histogram(
+    "docparser_llm_model_seconds",
+    "Duration of a routed LLM step (call, validation and repair) by model and task",
+    ["model", "task"],
+))
+HEDGES = registry.register(Counter(
+    "docparser_llm_hedges_total",
+    "Hedged LLM steps by outcome (launched, won by the hedge, won by the original)",
+    ["outcome"],
+))
+FALLBACKS = registry.register(Counter(
+    "docparser_llm_fallbacks_total",
+    "LLM steps retried on the next model after a failure, by failed model",
+    ["model"],
+))
+
+
+class ModelStats:
+    """
+    Latency samples and outcomes of one model. Hedge races are counted under
+    the model that was hedged (the original), whichever model the hedge ran on.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.degraded_until = 0.0
+        self.hedge_races = 0
+        self.original_wins = 0
+        self.hedge_wins = 0
+
+    def quantile(self, task: str, q: float) -> Optional[float]:
+        samples = self.latencies.get(task)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict[str, Any]:
+        latency = {}
+        for task, samples in self.latencies.items():
+            ordered = sorted(samples)
+            latency[task] = {
+                "samples": len(ordered),
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+            }
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "degraded": self.degraded_until > time.monotonic(),
+            "hedge_races": self.hedge_races,
+            "original_wins": self.original_wins,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedge_races, 4) if self.hedge_races else None,
+            "latency_seconds": latency,
+        }
+
+
+class ModelRouter:
+    """
+    Chooses the model for each LLM step.
+
+    Identification goes to IDENTIFY_MODEL, everything else to the primary
+    model. When a step takes longer than its hedge delay (a latency quantile of
+    the model, adapted as samples come in) the same step is started on the next
+    model and the first valid answer wins; the other call is cancelled. When a
+    step fails it is retried on the next model of the fallback list, and a
+    model that keeps failing moves to the back of the list for a cooldown.
+    Hedged duplicates count against the rate limiter like any other call.
+    """
+
+    def __init__(
+        self,
+        primary: str = PRIMARY_MODEL,
+        identify_model: str = IDENTIFY_MODEL,
+        fallbacks: Optional[List[str]] = None,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+    ):
+        self.primary = primary
+        self.identify_model = identify_model
+        self.fallbacks = FALLBACK_MODELS if fallbacks is None else fallbacks
+        self.hedge_enabled = hedge_enabled
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model: str) -> ModelStats:
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = ModelStats()
+            return stats
+
+    def models_for(self, task: str) -> List[str]:
+        """Ordered candidate models for a step; degraded models go last"""
+        preferred = self.identify_model if task == "identify" else self.primary
+        candidates = list(dict.fromkeys([preferred, self.primary] + self.fallbacks))
+        now = time.monotonic()
+        return sorted(candidates, key=lambda model: self._model_stats(model).degraded_until > now)
+
+    def hedge_delay(self, model: str, task: str) -> float:
+        stats = self._model_stats(model)
+        quantile = LLM_HEDGE_QUANTILE
+        # How often hedging this model paid off
+        if stats.hedge_races >= HEDGE_MIN_SAMPLES and stats.hedge_wins / stats.hedge_races < LLM_HEDGE_MIN_WIN_RATE:
+            quantile = (1 + quantile) / 2
+        learned = stats.quantile(task, quantile)
+        return LLM_HEDGE_DELAY if learned is None else max(LLM_HEDGE_MIN_DELAY, learned)
+
+    def _record(self, model: str, task: str, seconds: float, success: bool):
+        stats = self._model_stats(model)
+        MODEL_SECONDS.observe(seconds, model=model, task=task)
+        with self._lock:
+            stats.calls += 1
+            if success:
+                stats.latencies.setdefault(task, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+                stats.consecutive_failures = 0
+                return
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= LLM_FALLBACK_AFTER_FAILURES:
+                stats.degraded_until = time.monotonic() + LLM_FALLBACK_COOLDOWN
+                stats.consecutive_failures = 0
+                logger.warning(f"Model {model} keeps failing, deprioritized for {LLM_FALLBACK_COOLDOWN:.0f}s")
+
+    def _record_latency(self, model: str, task: str, seconds: float):
+        stats = self._model_stats(model)
+        with self._lock:
+            stats.latencies.setdefault(task, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    async def _timed(self, model: str, task: str, step: Callable[[str], Awaitable[Optional[T]]]) -> Optional[T]:
+        started = time.perf_counter()
+        try:
+            result = await step(model)
+        except asyncio.CancelledError:
+            # A hedge loser still ran at least this long; dropping it would bias the quantile low
+            self._record_latency(model, task, time.perf_counter() - started)
+            raise
+        except Exception:
+            self._record(model, task, time.perf_counter() - started, False)
+            raise
+        self._record(model, task, time.perf_counter() - started, result is not None)
+        return result
+
+    async def _hedged(
+        self,
+        model: str,
+        hedge_model: Optional[str],
+        task: str,
+        step: Callable[[str], Awaitable[Optional[T]]]
+    ) -> Optional[T]:
+        if hedge_model is None or not self.hedge_enabled or task not in HEDGED_TASKS:
+            return await self._timed(model, task, step)
+
+        original = asyncio.ensure_future(self._timed(model, task, step))
+        racers = [original]
+        errors: List[BaseException] = []
+        try:
+            done, _ = await asyncio.wait(racers, timeout=self.hedge_delay(model, task))
+            if done:
+                return original.result()
+
+            HEDGES.inc(outcome="launched")
+            hedge = asyncio.ensure_future(self._timed(hedge_model, task, step))
+            racers.append(hedge)
+            pending = set(racers)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for racer in done:
+                    if racer.exception() is not None:
+                        errors.append(racer.exception())
+                    elif racer.result() is not None:
+                        self._record_race(model, won_by_hedge=racer is hedge)
+                        return racer.result()
+        finally:
+            # The losing call (or both, when the caller is cancelled) is abandoned
+            unfinished = [racer for racer in racers if not racer.done()]
+            for racer in unfinished:
+                racer.cancel()
+            if unfinished:
+                await asyncio.gather(*unfinished, return_exceptions=True)
+        if len(errors) == len(racers):
+            raise errors[0]
+        return None
+
+    def _record_race(self, model: str, won_by_hedge: bool):
+        HEDGES.inc(outcome="hedge_won" if won_by_hedge else "original_won")
+        with self._lock:
+            stats = self._stats[model]
+            stats.hedge_races += 1
+            if won_by_hedge:
+                stats.hedge_wins += 1
+            else:
+                stats.original_wins += 1
+
+    async def run(self, task: str, step: Callable[[str], Awaitable[Optional[T]]]) -> Optional[T]:
+        """
+        Run `step(model)` for a pipeline step (identify, extract, single_call).
+        The step returns None for an answer that stayed invalid and raises when
+        the API call failed; failures move on to the next candidate model.
+        """
+        candidates = self.models_for(task)
+        for index, model in enumerate(candidates):
+            alternatives = candidates[index + 1:]
+            try:
+                return await self._hedged(model, alternatives[0] if alternatives else None, task, step)
+            except Exception as e:
+                if not alternatives:
+                    raise
+                FALLBACKS.inc(model=model)
+                logger.warning(f"{task} call on {model} failed ({e}), falling back to {alternatives[0]}")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {model: stats.summary() for model, stats in self._stats.items()}
+        return {
+            "primary": self.primary,
+            "identify_model": self.identify_model,
+            "fallbacks": self.fallbacks,
+            "hedging": self.hedge_enabled,
+            "hedge_delay_seconds": {
+                task: round(self.hedge_delay(self.primary, task), 3) for task in HEDGED_TASKS
+            },
+            "models": models,
+        }
+
+
+# Process-wide router shared by every extraction job
+model_router = ModelRouter()
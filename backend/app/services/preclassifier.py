@@ -0,0 +1,241 @@
+import io
+import os
+import time
+import base64
+import logging
+import threading
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.services.field_index import document_type_key
+from app.services.metrics import Counter, registry
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# "off" always asks the LLM, "shadow" classifies locally only to measure agreement
+# with the LLM, "on" skips the LLM identification call for confident predictions
+PRECLASSIFIER_MODES = ("off", "shadow", "on")
+PRECLASSIFIER_MODE = os.environ.get("PRECLASSIFIER_MODE", "shadow").lower()
+PRECLASSIFIER_MIN_CONFIDENCE = float(os.environ.get("PRECLASSIFIER_MIN_CONFIDENCE", "0.9"))
+
+# Feature extraction works on a small greyscale copy
+ANALYSIS_SIZE = 640  # longest side in pixels
+COLOUR_SIZE = 160  # longest side of the copy used for colour statistics
+EDGE_THRESHOLD = 40  # grey-level step between neighbouring pixels that counts as an edge
+
+# MRZ: full-width text lines in the lower part of the page (2 lines on passports, 3 on ID-1 cards)
+MRZ_COLUMN_BINS = 24
+MRZ_MIN_OCCUPANCY = 0.8  # share of column bins a row must touch
+MRZ_LINE_HEIGHT = (0.015, 0.1)  # min/max line height as a share of the image height
+MRZ_TOP = 0.55  # MRZ lines start below this share of the image height
+
+# PDF417: stacked rows of vertical bars on the back of US licenses
+BARCODE_CELL = 16  # pixels
+BARCODE_MIN_DENSITY = 0.25  # share of a cell's pixels that are vertical edges
+BARCODE_MIN_RATIO = 2.5  # vertical edges per horizontal edge in a barcode cell
+BARCODE_ROW_COVERAGE = 0.4  # share of a cell row covered by barcode cells
+BARCODE_MIN_ROWS = 3  # consecutive cell rows
+
+# EAD cards are printed on a pink/magenta background
+MAGENTA_MIN_SHARE = 0.15
+
+# Aspect ratios (long side / short side): ID-1 cards are 85.6x54mm, passport data pages 125x88mm
+ID1_ASPECT = (1.5, 1.7)
+PASSPORT_ASPECT = (1.3, 1.5)
+
+PREDICTIONS = registry.register(Counter(
+    "docparser_preclassifier_total",
+    "Local pre-classifier predictions by outcome (skipped_llm, agreed, disagreed, no_prediction)",
+    ["outcome"],
+))
+
+
+class Prediction(NamedTuple):
+    doc_type: str  # one of the identification classes, "Unknown Doc" when undecided
+    confidence: float
+    features: Dict[str, float]
+    milliseconds: float
+
+    @property
+    def confident(self) -> bool:
+        return self.doc_type != "Unknown Doc" and self.confidence >= PRECLASSIFIER_MIN_CONFIDENCE
+
+    def doc_info(self) -> Dict[str, str]:
+        """Identification result; country and state are not determined locally"""
+        return {"doc_type": self.doc_type, "country": "", "state": ""}
+
+    def summary(self) -> Dict[str, Any]:
+        return {"doc_type": self.doc_type, "confidence": self.confidence, "milliseconds": self.milliseconds}
+
+
+def _bands(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) of runs of True values"""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(padded))
+    return list(zip(changes[::2], changes[1::2]))
+
+
+def mrz_line_count(dx_edges: np.ndarray) -> int:
+    """Number of adjacent MRZ-like lines: evenly sized full-width text bands near the bottom"""
+    height, width = dx_edges.shape
+    bins = np.array_split(np.arange(width), MRZ_COLUMN_BINS)
+    occupancy = np.stack([dx_edges[:, columns].any(axis=1) for columns in bins], axis=1).mean(axis=1)
+    lines = [
+        (start, end) for start, end in _bands(occupancy >= MRZ_MIN_OCCUPANCY)
+        if start >= MRZ_TOP * height
+        and MRZ_LINE_HEIGHT[0] * height <= end - start <= MRZ_LINE_HEIGHT[1] * height
+    ]
+    # Count the longest chain of lines with similar heights and small gaps
+    best = count = min(1, len(lines))
+    for previous, current in zip(lines, lines[1:]):
+        heights = (previous[1] - previous[0], current[1] - current[0])
+        regular = max(heights) <= 1.5 * min(heights) and current[0] - previous[1] <= 3 * max(heights)
+        count = count + 1 if regular else 1
+        best = max(best, count)
+    return best
+
+
+def has_barcode(dx_edges: np.ndarray, dy_edges: np.ndarray) -> bool:
+    """Whether a block of cells dominated by vertical edges spans several cell rows"""
+    rows = (min(dx_edges.shape[0], dy_edges.shape[0])) // BARCODE_CELL
+    cols = (min(dx_edges.shape[1], dy_edges.shape[1])) // BARCODE_CELL
+    if rows == 0 or cols == 0:
+        return False
+    shape = (rows, BARCODE_CELL, cols, BARCODE_CELL)
+    dx_density = dx_edges[:rows * BARCODE_CELL, :cols * BARCODE_CELL].reshape(shape).mean(axis=(1, 3))
+    dy_density = dy_edges[:rows * BARCODE_CELL, :cols * BARCODE_CELL].reshape(shape).mean(axis=(1, 3))
+    cells = (dx_density >= BARCODE_MIN_DENSITY) & (dx_density >= BARCODE_MIN_RATIO * dy_density)
+    return any(end - start >= BARCODE_MIN_ROWS for start, end in _bands(cells.mean(axis=1) >= BARCODE_ROW_COVERAGE))
+
+
+def _fit(size: Tuple[int, int], longest: int) -> Tuple[int, int]:
+    scale = min(1.0, longest / max(size))
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def magenta_share(image: Image.Image) -> float:
+    small = image.convert("RGB").resize(_fit(image.size, COLOUR_SIZE), Image.BILINEAR)
+    hsv = np.asarray(small.convert("HSV"), dtype=np.float32)
+    hue = hsv[..., 0] * 360 / 255
+    saturation = hsv[..., 1] / 255
+    return float((((hue >= 290) | (hue <= 10)) & (saturation > 0.15)).mean())
+
+
+def image_features(image: Image.Image) -> Dict[str, float]:
+    """CPU-only layout and colour features of a (normalized, cropped) document image"""
+    small = image.convert("RGB").resize(_fit(image.size, ANALYSIS_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    gray = np.asarray(small.convert("L"), dtype=np.int16)
+    dx_edges = np.abs(np.diff(gray, axis=1)) > EDGE_THRESHOLD
+    dy_edges = np.abs(np.diff(gray, axis=0)) > EDGE_THRESHOLD
+    return {
+        "aspect": round(max(small.size) / min(small.size), 3),
+        "mrz_lines": mrz_line_count(dx_edges),
+        "barcode": float(has_barcode(dx_edges, dy_edges)),
+        "magenta": round(magenta_share(small), 3),
+    }
+
+
+def _within(value: float, bounds: Tuple[float, float]) -> bool:
+    return bounds[0] <= value <= bounds[1]
+
+
+def score(features: Dict[str, float]) -> Tuple[str, float]:
+    """
+    Rule-based decision over the features. Confidences are calibrated on the
+    sample corpus and are meant to be checked with the agreement statistics.
+    """
+    aspect = features["aspect"]
+    if features["mrz_lines"] == 2:
+        return "Passport", 0.95 if _within(aspect, PASSPORT_ASPECT) else 0.9
+    if features["barcode"]:
+        return "USA Drivers License", 0.9 if _within(aspect, ID1_ASPECT) else 0.75
+    if features["mrz_lines"] == 3:
+        # TD1 MRZ: EAD backs, but also green cards and foreign ID cards
+        return "EAD Card", 0.6
+    if features["magenta"] >= MAGENTA_MIN_SHARE and _within(aspect, ID1_ASPECT):
+        return "EAD Card", 0.8
+    return "Unknown Doc", 0.0
+
+
+def classify_image(image: Image.Image) -> Prediction:
+    started = time.perf_counter()
+    features = image_features(image)
+    doc_type, confidence = score(features)
+    return Prediction(doc_type, confidence, features, round((time.perf_counter() - started) * 1000, 2))
+
+
+def classify_payload(image_data: str) -> Prediction:
+    """Classify a base64 page payload as sent to the vision model. Blocking."""
+    started = time.perf_counter()
+    with Image.open(io.BytesIO(base64.b64decode(image_data))) as image:
+        # JPEG can decode straight to a reduced size, which is most of the cost here
+        image.draft("RGB", _fit(image.size, ANALYSIS_SIZE))
+        prediction = classify_image(image)
+    return prediction._replace(milliseconds=round((time.perf_counter() - started) * 1000, 2))
+
+
+class PreclassifierStats:
+    """
+    Agreement of the local prediction with the LLM identification, overall and
+    for predictions above the confidence threshold (the ones "on" mode skips).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._confusion: Dict[str, Dict[str, int]] = {}
+        self._compared = 0
+        self._agreed = 0
+        self._confident = 0
+        self._confident_agreed = 0
+        self._skipped = 0
+        self._milliseconds = 0.0
+        self._predictions = 0
+
+    def record_prediction(self, prediction: Prediction, skipped_llm: bool):
+        with self._lock:
+            self._predictions += 1
+            self._milliseconds += prediction.milliseconds
+            if skipped_llm:
+                self._skipped += 1
+        if skipped_llm:
+            PREDICTIONS.inc(outcome="skipped_llm")
+
+    def record_comparison(self, prediction: Prediction, llm_doc_type: str):
+        predicted = document_type_key(prediction.doc_type)
+        actual = document_type_key(llm_doc_type) or "other"
+        if prediction.doc_type == "Unknown Doc":
+            PREDICTIONS.inc(outcome="no_prediction")
+        else:
+            PREDICTIONS.inc(outcome="agreed" if predicted == actual else "disagreed")
+        with self._lock:
+            row = self._confusion.setdefault(predicted, {})
+            row[actual] = row.get(actual, 0) + 1
+            if prediction.doc_type == "Unknown Doc":
+                return
+            self._compared += 1
+            self._agreed += predicted == actual
+            if prediction.confident:
+                self._confident += 1
+                self._confident_agreed += predicted == actual
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": PRECLASSIFIER_MODE,
+                "min_confidence": PRECLASSIFIER_MIN_CONFIDENCE,
+                "predictions": self._predictions,
+                "skipped_llm_calls": self._skipped,
+                "mean_milliseconds": round(self._milliseconds / self._predictions, 2) if self._predictions else None,
+                "compared": self._compared,
+                "agreement": round(self._agreed / self._compared, 4) if self._compared else None,
+                "confident_compared": self._confident,
+                "confident_agreement": round(self._confident_agreed / self._confident, 4) if self._confident else None,
+                "confusion": {predicted: dict(row) for predicted, row in self._confusion.items()},
+            }
+
+
+# Process-wide counters
+preclassifier_stats = PreclassifierStats()
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+from pdf2image import convert_from_path
+
+from app.services.metrics import record_error, time_stage
+from app.utils.image_utils import to_rgb
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Downscaled renditions of page 1, written once when the document is processed
+PREVIEW_DIR = Path(os.environ.get("PREVIEW_DIR", "./previews"))
+PREVIEW_FORMAT = os.environ.get("PREVIEW_FORMAT", "WEBP").upper()  # WEBP or JPEG
+PREVIEW_MAX_SIZE = int(os.environ.get("PREVIEW_MAX_SIZE", "1600"))  # longest side in pixels
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", "256"))  # longest side in pixels
+# DPI used when a PDF has to be rasterized only for its preview (older jobs, cache hits)
+PREVIEW_RENDER_DPI = 100
+
+PREVIEW_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+PREVIEW_MEDIA_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+# Rendition name -> (longest side, quality); ordered largest first so each is made from the previous one
+RENDITIONS: Dict[str, Tuple[int, int]] = {
+    "preview": (PREVIEW_MAX_SIZE, 80),
+    "thumbnail": (THUMBNAIL_SIZE, 70),
+}
+
+# Bump whenever the way renditions are produced changes; part of their ETag
+PREVIEW_VERSION = "1"
+
+
+def rendition_media_type() -> str:
+    return PREVIEW_MEDIA_TYPES.get(PREVIEW_FORMAT, "image/jpeg")
+
+
+def rendition_path(upload_path: Path, rendition: str) -> Path:
+    """Renditions are named after the upload (<job id>.<rendition>.<ext>)"""
+    return PREVIEW_DIR / f"{upload_path.stem}.{rendition}{PREVIEW_EXTENSIONS.get(PREVIEW_FORMAT, '.jpg')}"
+
+
+def rendition_fingerprint(rendition: str) -> str:
+    """Short digest of everything besides the source content that determines a rendition's bytes"""
+    size, quality = RENDITIONS[rendition]
+    settings = json.dumps([PREVIEW_VERSION, PREVIEW_FORMAT, rendition, size, quality])
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:12]
+
+
+def _save(image: Image.Image, path: Path, quality: int):
+    """Write through a temporary file so readers never see a partial rendition"""
+    temp_path = path.with_name(f".{path.name}.part")
+    try:
+        if PREVIEW_FORMAT == "WEBP":
+            image.save(temp_path, format="WEBP", quality=quality, method=4)
+        else:
+            image.save(temp_path, format="JPEG", quality=quality, optimize=True)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def save_renditions(image: Image.Image, upload_path: Path):
+    """
+    Write the preview and thumbnail of a decoded page 1 image. Called with the
+    image the extraction pipeline already decoded or rasterized, so no extra
+    decode is needed. Failures are logged, never raised. Blocking.
+    """
+    try:
+        with time_stage("preview_render"):
+            PREVIEW_DIR.mkdir(parents=True, exist_ok=True)
+            rendition = to_rgb(ImageOps.exif_transpose(image))
+            for name, (size, quality) in RENDITIONS.items():
+                if max(rendition.size) > size:
+                    rendition = rendition.copy()
+                    rendition.thumbnail((size, size), Image.LANCZOS)
+                _save(rendition, rendition_path(upload_path, name), quality)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not write preview renditions for {upload_path}: {e}")
+        record_error("preview_render", e)
+
+
+def _decode_first_page(upload_path: Path) -> Optional[Image.Image]:
+    content_type, _ = mimetypes.guess_type(upload_path)
+    if content_type == "application/pdf":
+        pages = convert_from_path(upload_path, dpi=PREVIEW_RENDER_DPI, first_page=1, last_page=1)
+        return pages[0] if pages else None
+    image = Image.open(upload_path)
+    image.load()
+    return image
+
+
+def ensure_rendition(upload_path: Path, rendition: str) -> Optional[Path]:
+    """
+    Return the rendition file, producing the renditions on demand for jobs
+    processed before previews existed or completed from the result cache.
+    Returns None when the document cannot be decoded. Blocking.
+    """
+    path = rendition_path(upload_path, rendition)
+    if path.exists():
+        return path
+    if not upload_path.exists():
+        return None
+    try:
+        image = _decode_first_page(upload_path)
+    except Exception as e:
+        # Pillow and pdf2image/poppler failures alike
+        logger.warning(f"Could not decode {upload_path} for a preview: {e}")
+        return None
+    if image is None:
+        return None
+    with image:
+        save_renditions(image, upload_path)
+    return path if path.exists() else None
+
+
+def remove_renditions(upload_path: Path):
+    for rendition in RENDITIONS:
+        rendition_path(upload_path, rendition).unlink(missing_ok=True)
@@ -0,0 +1,254 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.services.metrics import Counter, registry
+from app.utils.image_utils import IMAGE_CROP_TO_DOCUMENT, crop_to_document
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# "off" sends every page, "shadow" only measures which pages would be rejected,
+# "on" fails unreadable documents before any LLM call
+QUALITY_GATE_MODES = ("off", "shadow", "on")
+QUALITY_GATE_MODE = os.environ.get("QUALITY_GATE_MODE", "shadow").lower()
+# In "on" mode, straighten skewed pages and correct exposure problems (contrast
+# stretch) instead of rejecting them
+QUALITY_AUTO_ENHANCE = os.environ.get("QUALITY_AUTO_ENHANCE", "false").lower() == "true"
+
+# Thresholds, calibrated on the sample corpus against blurred, brightened,
+# darkened and downscaled copies of it
+QUALITY_MIN_SIDE = int(os.environ.get("QUALITY_MIN_SIDE", "250"))  # pixels on the document's short side
+QUALITY_MIN_SHARPNESS = float(os.environ.get("QUALITY_MIN_SHARPNESS", "150"))  # Laplacian variance, contrast-normalized
+QUALITY_MAX_WHITE_SHARE = float(os.environ.get("QUALITY_MAX_WHITE_SHARE", "0.4"))  # share of near-white pixels
+QUALITY_MIN_HIGHLIGHT = float(os.environ.get("QUALITY_MIN_HIGHLIGHT", "90"))  # 99th percentile grey level
+QUALITY_BLANK_MAX_RANGE = float(os.environ.get("QUALITY_BLANK_MAX_RANGE", "24"))  # 1st to 99th percentile grey levels
+
+# Measurements work on a small greyscale copy so they cost a few milliseconds;
+# sharpness is only comparable between images analysed at the same size
+ANALYSIS_SIZE = 800  # longest side in pixels
+NEAR_WHITE = 250  # grey level
+
+# Deskew: projection profiles of the ink are compared over this range of angles
+DESKEW_MAX_ANGLE = 15.0  # degrees
+DESKEW_MIN_ANGLE = 0.75  # degrees; smaller skews are left alone
+DESKEW_SIZE = 480  # longest side of the copy used to find the angle
+OVEREXPOSED_GAMMA = 1.8
+
+# Error codes stored on rejected jobs, with the advice shown to the user
+ERROR_MESSAGES = {
+    "image_too_small": "The document is too small to read ({short_side}px on its short side, at least {min_side}px needed). Upload a larger scan or a closer photo.",
+    "image_underexposed": "The image is too dark to read. Retake the photo in better light.",
+    "image_blank": "The page appears to be blank. Check that the right side of the document was uploaded.",
+    "image_overexposed": "The image is washed out. Retake the photo without glare or direct flash.",
+    "image_blurry": "The image is too blurry to read. Hold the camera steady and make sure the document is in focus.",
+}
+# Problems that contrast correction can fix well enough for extraction
+ENHANCEABLE = {"image_underexposed", "image_overexposed"}
+
+QUALITY_CHECKS = registry.register(Counter(
+    "docparser_quality_gate_total",
+    "Image quality checks by outcome (passed, rejected, enhanced, dropped, would_reject) and problem",
+    ["outcome", "code"],
+))
+
+
+class QualityReport(NamedTuple):
+    code: Optional[str]  # one of ERROR_MESSAGES, None when the image passed
+    metrics: Dict[str, float]
+    milliseconds: float
+
+    @property
+    def passed(self) -> bool:
+        return self.code is None
+
+    @property
+    def message(self) -> Optional[str]:
+        if self.code is None:
+            return None
+        return ERROR_MESSAGES[self.code].format(
+            short_side=int(self.metrics["short_side"]), min_side=QUALITY_MIN_SIDE
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {"code": self.code, "metrics": self.metrics, "milliseconds": self.milliseconds}
+
+
+class ImageQualityError(Exception):
+    """A page failed the quality gate; the document is rejected without LLM calls"""
+
+    def __init__(self, report: QualityReport):
+        super().__init__(report.message)
+        self.report = report
+
+    @property
+    def code(self) -> str:
+        return self.report.code
+
+
+def _analysis_copy(image: Image.Image) -> Image.Image:
+    small = image.convert("RGB")
+    small.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    return small
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian: low when edges are soft"""
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var()) if laplacian.size else 0.0
+
+
+def measure(image: Image.Image) -> Dict[str, float]:
+    """CPU-only quality measurements of the document region of an image"""
+    small = _analysis_copy(image)
+    scale = max(image.size) / max(small.size)
+    if IMAGE_CROP_TO_DOCUMENT:
+        small = crop_to_document(small)
+    gray = np.asarray(small.convert("L"), dtype=np.float32)
+    darkest, median, brightest = np.percentile(gray, [1, 50, 99])
+    # Stretching to the 1st..99th percentiles makes sharpness independent of exposure
+    stretched = (gray - darkest) * (255 / max(brightest - darkest, 1))
+    return {
+        "short_side": round(min(small.size) * scale),
+        "sharpness": round(laplacian_variance(stretched), 1),
+        "white_share": round(float((gray >= NEAR_WHITE).mean()), 3),
+        "p1": float(darkest),
+        "p50": float(median),
+        "p99": float(brightest),
+    }
+
+
+def _problem(metrics: Dict[str, float], check_exposure: bool) -> Optional[str]:
+    if metrics["short_side"] < QUALITY_MIN_SIDE:
+        return "image_too_small"
+    if metrics["p99"] < QUALITY_MIN_HIGHLIGHT:
+        return "image_underexposed"
+    if metrics["p99"] - metrics["p1"] < QUALITY_BLANK_MAX_RANGE:
+        return "image_blank"
+    # Rendered PDF pages are mostly white paper, so only photos are checked for glare
+    if check_exposure and metrics["white_share"] > QUALITY_MAX_WHITE_SHARE:
+        return "image_overexposed"
+    if metrics["sharpness"] < QUALITY_MIN_SHARPNESS:
+        return "image_blurry"
+    return None
+
+
+def assess_image(image: Image.Image, check_exposure: bool = True) -> QualityReport:
+    """Measure an image and name its most serious problem. Blocking."""
+    started = time.perf_counter()
+    metrics = measure(image)
+    code = _problem(metrics, check_exposure)
+    return QualityReport(code, metrics, round((time.perf_counter() - started) * 1000, 2))
+
+
+def _profile_score(ink: Image.Image, angle: float) -> float:
+    rows = np.asarray(ink.rotate(angle, resample=Image.NEAREST, expand=True), dtype=np.float32).sum(axis=1)
+    # Text lines aligned with the rows give a profile with sharp steps
+    return float(np.square(np.diff(rows)).sum())
+
+
+def estimate_skew(image: Image.Image) -> float:
+    """Rotation (degrees, counter-clockwise) that levels the text lines of an image"""
+    gray = image.convert("L")
+    gray.thumbnail((DESKEW_SIZE, DESKEW_SIZE))
+    pixels = np.asarray(gray, dtype=np.float32)
+    ink = Image.fromarray(((pixels < pixels.mean() - pixels.std()) * 255).astype(np.uint8))
+    # Coarse search in whole degrees, then refine around the best one
+    best = max(np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1), key=lambda angle: _profile_score(ink, angle))
+    return float(max(np.arange(best - 1, best + 1.01, 0.25), key=lambda angle: _profile_score(ink, angle)))
+
+
+def enhance_image(image: Image.Image, code: Optional[str] = None) -> Optional[Image.Image]:
+    """
+    Stretch the contrast of a badly exposed image and straighten a skewed one.
+    Returns None when there was nothing to correct. Blocking.
+    """
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    changed = False
+    if code in ENHANCEABLE:
+        image = ImageOps.autocontrast(image, cutoff=1)
+        if code == "image_overexposed":
+            lut = [round(255 * (value / 255) ** OVEREXPOSED_GAMMA) for value in range(256)]
+            image = image.point(lut * 3)
+        changed = True
+    angle = estimate_skew(image)
+    if abs(angle) >= DESKEW_MIN_ANGLE:
+        logger.info(f"Deskewing page by {angle:.2f} degrees")
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=(255, 255, 255))
+        changed = True
+    return image if changed else None
+
+
+def gate_image(image: Image.Image, page_number: int = 1, check_exposure: bool = True) -> Optional[Image.Image]:
+    """
+    Check a page before it is sent to the model. Returns the image to send
+    (enhanced, or as it is), or None to leave out a blank later page. Raises
+    ImageQualityError when the document should be rejected: only the first
+    page can reject it, later pages are sent even when they look poor.
+    Blocking.
+    """
+    if QUALITY_GATE_MODE not in ("shadow", "on"):
+        return image
+    report = assess_image(image, check_exposure)
+    quality_gate_stats.record(report)
+    if not report.passed:
+        logger.info(f"Page {page_number} failed the quality gate ({report.code}): {report.metrics}")
+    if QUALITY_GATE_MODE == "shadow":
+        QUALITY_CHECKS.inc(outcome="passed" if report.passed else "would_reject", code=report.code or "none")
+        return image
+    if QUALITY_AUTO_ENHANCE and (report.passed or report.code in ENHANCEABLE):
+        enhanced = enhance_image(image, report.code)
+        if enhanced is not None:
+            QUALITY_CHECKS.inc(outcome="enhanced", code=report.code or "skew")
+            return enhanced
+    if report.passed:
+        QUALITY_CHECKS.inc(outcome="passed", code="none")
+        return image
+    if page_number > 1:
+        if report.code == "image_blank":
+            QUALITY_CHECKS.inc(outcome="dropped", code=report.code)
+            return None
+        return image
+    QUALITY_CHECKS.inc(outcome="rejected", code=report.code)
+    raise ImageQualityError(report)
+
+
+class QualityGateStats:
+    """Problems found by the gate, with the share of checked pages they affect"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._problems: Dict[str, int] = {}
+        self._milliseconds = 0.0
+
+    def record(self, report: QualityReport):
+        with self._lock:
+            self._checked += 1
+            self._milliseconds += report.milliseconds
+            if report.code is not None:
+                self._problems[report.code] = self._problems.get(report.code, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            failed = sum(self._problems.values())
+            return {
+                "mode": QUALITY_GATE_MODE,
+                "auto_enhance": QUALITY_AUTO_ENHANCE,
+                "checked_pages": self._checked,
+                "failed_pages": failed,
+                "failure_rate": round(failed / self._checked, 4) if self._checked else None,
+                "problems": dict(self._problems),
+                "mean_milliseconds": round(self._milliseconds / self._checked, 2) if self._checked else None,
+            }
+
+
+# Process-wide counters
+quality_gate_stats = QualityGateStats()
@@ -0,0 +1,261 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.services.metrics import Counter, observe_stage, registry
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Client-side quota; 0 leaves a budget unenforced until the API reports its limit
+GROQ_REQUESTS_PER_MINUTE = int(os.environ.get("GROQ_REQUESTS_PER_MINUTE", "0"))
+GROQ_TOKENS_PER_MINUTE = int(os.environ.get("GROQ_TOKENS_PER_MINUTE", "0"))
+# Upper bound for concurrent LLM requests; the limit adapts below it on 429s
+GROQ_MAX_CONCURRENT_REQUESTS = int(os.environ.get("GROQ_MAX_CONCURRENT_REQUESTS", "16"))
+# Initial token estimate per request (image + prompt + answer), refined from actual usage
+GROQ_TOKENS_PER_REQUEST = int(os.environ.get("GROQ_TOKENS_PER_REQUEST", "2000"))
+
+# Pause used when a 429 carries no usable retry-after or reset header
+DEFAULT_RATE_LIMIT_PAUSE = 1.0  # seconds
+
+RATE_LIMITED = registry.register(Counter(
+    "docparser_llm_rate_limited_total",
+    "429 responses received from the LLM API",
+))
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse rate-limit reset values such as "7.66s", "2m59.56s", "120ms" or a bare number of seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers: httpx.Headers, name: str) -> Optional[int]:
+    try:
+        return int(float(headers[name]))
+    except (KeyError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Budget refilled continuously at `per_minute / 60` per second, holding at most `per_minute`"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self, now: float):
+        rate = self.capacity / 60
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it is available now)"""
+        if not self.enabled:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.capacity / 60)
+
+    def take(self, amount: float):
+        if self.enabled:
+            self.level -= min(amount, self.capacity)
+
+    def set_limit(self, per_minute: int, now: float):
+        if per_minute > 0 and per_minute != self.capacity:
+            if self.enabled:
+                self._refill(now)
+                self.level = min(self.level, float(per_minute))
+            else:
+                # First limit learned from the API starts full; remaining headers cap it
+                self.level = float(per_minute)
+                self.updated = now
+            self.capacity = float(per_minute)
+
+    def cap(self, remaining: float, now: float):
+        """Never assume more budget than the server says is left"""
+        if self.enabled:
+            self._refill(now)
+            self.level = min(self.level, remaining)
+
+
+class LLMRateLimiter:
+    """
+    Process-wide admission control for LLM requests.
+
+    Every request waits for a concurrency slot, one unit of the
+    requests-per-minute bucket and its estimated tokens from the
+    tokens-per-minute bucket. Response headers keep the buckets in line with
+    the server's view: x-ratelimit-limit-tokens sets the token budget and the
+    remaining counts cap it. A 429 pauses all requests for its retry-after
+    time and halves the concurrency limit. Successful responses grow the
+    limit back one step per window of `limit` successes (AIMD).
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = GROQ_TOKENS_PER_MINUTE,
+        max_concurrency: int = GROQ_MAX_CONCURRENT_REQUESTS,
+        tokens_per_request: int = GROQ_TOKENS_PER_REQUEST,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.tokens_per_request = float(tokens_per_request)
+        self._active = 0
+        self._waiting = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        # asyncio primitives belong to one event loop, and the worker and the
+        # benchmarks run several loops (asyncio.run) in one process
+        self._conditions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Condition]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _cond(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        condition = self._conditions.get(loop)
+        if condition is None:
+            condition = self._conditions[loop] = asyncio.Condition()
+        return condition
+
+    async def _acquire_slot(self):
+        async with self._cond():
+            await self._cond().wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def _release_slot(self):
+        async with self._cond():
+            self._active -= 1
+            self._cond().notify_all()
+
+    async def _wait_for_budget(self):
+        while True:
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(self.tokens_per_request, now),
+            )
+            if wait <= 0:
+                # No await between the check and the debit, so this is atomic on the event loop
+                self.requests.take(1)
+                self.tokens.take(self.tokens_per_request)
+                return
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold admission for one LLM request"""
+        started = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._acquire_slot()
+            try:
+                await self._wait_for_budget()
+            except BaseException:
+                await self._release_slot()
+                raise
+        finally:
+            self._waiting -= 1
+        observe_stage("rate_limit_wait", time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            await self._release_slot()
+
+    async def on_response(self, response: httpx.Response):
+        """httpx response hook: learn from rate-limit headers and 429s"""
+        now = time.monotonic()
+        headers = response.headers
+
+        token_limit = _header_int(headers, "x-ratelimit-limit-tokens")
+        if token_limit:
+            self.tokens.set_limit(token_limit, now)
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None:
+            self.tokens.cap(remaining_tokens, now)
+        if _header_int(headers, "x-ratelimit-remaining-requests") == 0:
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self._pause(now + reset)
+
+        if response.status_code == 429:
+            RATE_LIMITED.inc()
+            pause = (
+                parse_duration(headers.get("retry-after"))
+                or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+                or DEFAULT_RATE_LIMIT_PAUSE
+            )
+            self._pause(now + pause)
+            previous = self.limit
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            if self.limit != previous:
+                logger.warning(f"LLM rate limited, pausing {pause:.1f}s and lowering concurrency to {self.limit}")
+        elif response.status_code < 400 and self.limit < self.max_concurrency:
+            self._successes += 1
+            if self._successes >= self.limit:
+                self._successes = 0
+                self.limit += 1
+                async with self._cond():
+                    self._cond().notify_all()
+
+    def _pause(self, until: float):
+        self._paused_until = max(self._paused_until, until)
+
+    def record_usage(self, total_tokens: Optional[int]):
+        """Refine the per-request token estimate from reported usage"""
+        if total_tokens:
+            self.tokens_per_request = 0.8 * self.tokens_per_request + 0.2 * total_tokens
+
+    def retry_after(self) -> float:
+        """Seconds until requests are admitted again after a 429"""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "concurrency_limit": self.limit,
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "waiting": self._waiting,
+            "paused_seconds": round(max(0.0, self._paused_until - now), 2),
+            "requests_per_minute": int(self.requests.capacity) or None,
+            "tokens_per_minute": int(self.tokens.capacity) or None,
+            "tokens_available": round(self.tokens.level) if self.tokens.enabled else None,
+            "tokens_per_request": round(self.tokens_per_request),
+            "rate_limited": int(RATE_LIMITED.value()),
+        }
+
+
+# Process-wide limiter shared by every extraction job
+rate_limiter = LLMRateLimiter()
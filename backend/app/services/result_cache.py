@@ -0,0 +1,224 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_PATH = Path(os.environ.get("RESULT_CACHE_PATH", BASE_DIR / "result_cache.db"))
+RESULT_CACHE_MEMORY_ENTRIES = int(os.environ.get("RESULT_CACHE_MEMORY_ENTRIES", "256"))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: Path) -> str:
+    """Hash a file in chunks without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(content_hash: str, models: str, prompt_version: str) -> str:
+    """Cache key for an extraction: same bytes, same models and response format, same prompts"""
+    return hashlib.sha256(f"{content_hash}:{models}:{prompt_version}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of extraction results.
+    An in-memory LRU sits in front of a SQLite table that survives restarts.
+    Entries expire after `ttl` seconds and the least recently used rows are
+    evicted once the table grows past `max_entries`. Entries record the content
+    hash of the file they were extracted from, so they can be removed with the
+    last job of that file. All methods are blocking and thread-safe.
+    """
+
+    def __init__(
+        self,
+        path: Path = RESULT_CACHE_PATH,
+        memory_entries: int = RESULT_CACHE_MEMORY_ENTRIES,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        ttl: int = RESULT_CACHE_TTL,
+    ):
+        self.path = Path(path)
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expired": 0,
+            "removed": 0,
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                "key TEXT PRIMARY KEY, result_json TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, content_hash TEXT)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(extraction_cache)")}
+            if "content_hash" not in columns:
+                # Caches created before entries recorded their file; those rows simply expire
+                self._conn.execute("ALTER TABLE extraction_cache ADD COLUMN content_hash TEXT")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_extraction_cache_accessed_at "
+                "ON extraction_cache (accessed_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_extraction_cache_content_hash "
+                "ON extraction_cache (content_hash)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, result: Dict[str, Any], created_at: float, content_hash: Optional[str]):
+        self._memory[key] = (result, created_at, content_hash)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def get(self, key: str, record: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        The cached result, a copy the caller may change. With record=False the
+        lookup is left out of the hit/miss counters, for repeated lookups of
+        the same job.
+        """
+        now = time.time()
+
+        def count(outcome: str):
+            if record:
+                self._counters[outcome] += 1
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                result, created_at, _ = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    count("memory_hits")
+                    return copy.deepcopy(result)
+                del self._memory[key]
+
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT result_json, created_at, content_hash FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                count("misses")
+                return None
+            result_json, created_at, content_hash = row
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                conn.commit()
+                self._counters["expired"] += 1
+                count("misses")
+                return None
+            conn.execute("UPDATE extraction_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            result = json.loads(result_json)
+            self._remember(key, result, created_at, content_hash)
+            count("disk_hits")
+            return copy.deepcopy(result)
+
+    def put(self, key: str, result: Dict[str, Any], content_hash: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, result_json, created_at, accessed_at, content_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(result), now, now, content_hash),
+            )
+            # Kept apart from the caller's dict, which it may still change
+            self._remember(key, copy.deepcopy(result), now, content_hash)
+            self._counters["stores"] += 1
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired rows, then the least recently used rows above the size cap"""
+        expired = conn.execute(
+            "DELETE FROM extraction_cache WHERE created_at < ?", (now - self.ttl,)
+        ).rowcount
+        self._counters["expired"] += max(expired, 0)
+        count = conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM extraction_cache WHERE key IN ("
+                "SELECT key FROM extraction_cache ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+            self._counters["disk_evictions"] += overflow
+
+    def remove(self, content_hashes: Iterable[str]) -> int:
+        """Drop every entry extracted from one of these files; returns the number of rows removed"""
+        content_hashes = set(content_hashes)
+        if not content_hashes:
+            return 0
+        with self._lock:
+            for key in [key for key, entry in self._memory.items() if entry[2] in content_hashes]:
+                del self._memory[key]
+            conn = self._connection()
+            placeholders = ", ".join("?" * len(content_hashes))
+            removed = conn.execute(
+                f"DELETE FROM extraction_cache WHERE content_hash IN ({placeholders})", tuple(content_hashes)
+            ).rowcount
+            conn.commit()
+            self._counters["removed"] += max(removed, 0)
+            return max(removed, 0)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connection()
+            conn.execute("DELETE FROM extraction_cache")
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+        lookups = hits + self._counters["misses"]
+        return {
+            "enabled": RESULT_CACHE_ENABLED,
+            "memory_entries": len(self._memory),
+            **self._counters,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+        }
+
+
+# Process-wide cache instance
+result_cache = ResultCache()
@@ -0,0 +1,281 @@
+import os
+import io
+import csv
+import json
+import logging
+import importlib.util
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from sqlalchemy import String, select, type_coerce
+
+from app.db.database import IS_SQLITE, session_scope
+from app.db.models import DocumentFields, ExtractionJobs
+from app.services.metrics import Counter, registry
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_STATUSES = ("processing", "completed", "error")
+
+# Rows fetched from the database cursor and encoded per chunk (and per Parquet row group)
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# Jobs changed within this many seconds of an export are left to the next one:
+# updated_at is stamped when a statement runs, before its transaction commits,
+# so the newest rows could still be joined by rows stamped earlier
+EXPORT_SETTLE_SECONDS = float(os.environ.get("EXPORT_SETTLE_SECONDS", "5"))
+
+# Layout of timestamps written by SQLite's CURRENT_TIMESTAMP (UTC, whole seconds)
+STORED_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+JOB_COLUMNS = ["id", "status", "error_code", "document_type", "file_type", "original_filename", "created_at", "updated_at"]
+KEY_FIELD_COLUMNS = [
+    "document_type", "first_name", "last_name", "full_name", "date_of_birth",
+    "document_number", "issue_date", "expiry_date", "country", "state",
+]
+KEY_FIELD_DATES = {"date_of_birth", "issue_date", "expiry_date"}
+# Flat layout of CSV and Parquet exports. Attribute names differ per document
+# type, so the flattened attributes go into one JSON column instead of a
+# header that could only be known after reading every row.
+FLAT_COLUMNS = JOB_COLUMNS + [f"key_fields.{name}" for name in KEY_FIELD_COLUMNS] + ["error", "attributes"]
+
+EXPORTED_ROWS = registry.register(Counter(
+    "docparser_export_rows_total",
+    "Jobs written by result exports by format",
+    ["format"],
+))
+
+
+def parquet_available() -> bool:
+    """Parquet exports need the optional pyarrow package"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def export_checkpoint() -> datetime:
+    """
+    Upper bound (exclusive, on updated_at) of an export started now. Passed as
+    `since` to the next export it yields exactly the jobs changed in between.
+    """
+    return (datetime.utcnow() - timedelta(seconds=EXPORT_SETTLE_SECONDS)).replace(microsecond=0)
+
+
+def format_checkpoint(checkpoint: datetime) -> str:
+    return checkpoint.isoformat() + "Z"
+
+
+def parse_checkpoint(value: Union[str, datetime]) -> datetime:
+    """Naive UTC datetime from a checkpoint or an ISO timestamp; raises ValueError"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _stored(column):
+    # Bounds are compared with the timestamps exactly as stored: a bound parameter
+    # carries microseconds, which would order "12:00:00" before "12:00:00.000000"
+    return type_coerce(column, String) if IS_SQLITE else column
+
+
+def _bound(value: datetime):
+    return value.strftime(STORED_TIMESTAMP_FORMAT) if IS_SQLITE else value
+
+
+def _export_query(
+    statuses: Sequence[str],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    since: Optional[datetime],
+    until: datetime,
+):
+    key_fields = [getattr(DocumentFields, name).label(f"key_{name}") for name in KEY_FIELD_COLUMNS]
+    query = (
+        select(
+            *(getattr(ExtractionJobs, name) for name in JOB_COLUMNS),
+            ExtractionJobs.extracted_fields_json,
+            DocumentFields.job_id.label("key_job_id"),
+            *key_fields,
+        )
+        .outerjoin(DocumentFields, DocumentFields.job_id == ExtractionJobs.id)
+        .where(_stored(ExtractionJobs.updated_at) < _bound(until))
+    )
+    if statuses:
+        query = query.where(ExtractionJobs.status.in_(statuses))
+    if since is not None:
+        query = query.where(_stored(ExtractionJobs.updated_at) >= _bound(since))
+    if created_from is not None:
+        query = query.where(_stored(ExtractionJobs.created_at) >= _bound(created_from))
+    if created_to is not None:
+        query = query.where(_stored(ExtractionJobs.created_at) < _bound(created_to))
+    # Unordered: the checkpoint bounds do not depend on row order, and sorting
+    # would hold back the first row until the whole result has been read
+    return query
+
+
+def flatten_attributes(attributes: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Nested attribute objects become dotted keys; lists and scalars are kept as they are"""
+    flat: Dict[str, Any] = {}
+    for name, value in attributes.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(flatten_attributes(value, f"{key}."))
+        else:
+            flat[key] = value
+    return flat
+
+
+def _export_record(row) -> Dict[str, Any]:
+    try:
+        result = json.loads(row.extracted_fields_json) if row.extracted_fields_json else {}
+    except ValueError:
+        result = {"error": "Stored result is not valid JSON"}
+    if not isinstance(result, dict):
+        result = {}
+    attributes = result.get("attributes")
+    record = {name: getattr(row, name) for name in JOB_COLUMNS}
+    record["key_fields"] = (
+        {name: getattr(row, f"key_{name}") for name in KEY_FIELD_COLUMNS} if row.key_job_id else None
+    )
+    record["attributes"] = flatten_attributes(attributes) if isinstance(attributes, dict) else {}
+    record["error"] = result.get("error")
+    return record
+
+
+def iter_export_records(
+    statuses: Sequence[str] = ("completed",),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Jobs matching the filters with their key fields and flattened attributes,
+    in no particular order. Rows are streamed from the database cursor in batches
+    of EXPORT_BATCH_SIZE, so memory use does not depend on the number of jobs.
+    Blocking.
+    """
+    query = _export_query(statuses, created_from, created_to, since, until or export_checkpoint())
+    with session_scope() as db:
+        for row in db.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            yield _export_record(row)
+
+
+def _batches(records: Iterable[Dict[str, Any]], export_format: str) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    exported = 0
+    for record in records:
+        batch.append(record)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            exported += len(batch)
+            EXPORTED_ROWS.inc(len(batch), format=export_format)
+            yield batch
+            batch = []
+    if batch:
+        exported += len(batch)
+        EXPORTED_ROWS.inc(len(batch), format=export_format)
+        yield batch
+    logger.info(f"Exported {exported} jobs as {export_format}")
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def flat_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Record in the FLAT_COLUMNS layout of CSV and Parquet exports"""
+    flat = {name: record[name] for name in JOB_COLUMNS}
+    key_fields = record["key_fields"] or {}
+    for name in KEY_FIELD_COLUMNS:
+        flat[f"key_fields.{name}"] = key_fields.get(name)
+    flat["error"] = record["error"]
+    flat["attributes"] = json.dumps(record["attributes"], default=_json_default) if record["attributes"] else None
+    return flat
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_ndjson(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for batch in _batches(records, "ndjson"):
+        yield "".join(json.dumps(record, default=_json_default) + "\n" for record in batch)
+
+
+def encode_csv(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FLAT_COLUMNS)
+    yield buffer.getvalue()
+    for batch in _batches(records, "csv"):
+        buffer.seek(0)
+        buffer.truncate()
+        for record in batch:
+            flat = flat_record(record)
+            writer.writerow(_csv_value(flat[name]) for name in FLAT_COLUMNS)
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what the Parquet writer produces until drained"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def encode_parquet(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """One row group per batch; requires pyarrow (see parquet_available)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"created_at": pa.timestamp("us"), "updated_at": pa.timestamp("us")}
+    types.update({f"key_fields.{name}": pa.date32() for name in KEY_FIELD_DATES})
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in FLAT_COLUMNS])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd") as writer:
+        for batch in _batches(records, "parquet"):
+            columns: Dict[str, List[Any]] = {name: [] for name in FLAT_COLUMNS}
+            for record in batch:
+                for name, value in flat_record(record).items():
+                    columns[name].append(value)
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS = {"ndjson": encode_ndjson, "csv": encode_csv, "parquet": encode_parquet}
+
+
+def export_stream(export_format: str, **filters) -> Iterator[Union[str, bytes]]:
+    """Encoded export of iter_export_records(**filters), chunk by chunk. Blocking."""
+    return ENCODERS[export_format](iter_export_records(**filters))
@@ -0,0 +1,374 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import anyio
+from sqlalchemy import func, text
+
+from app.db.database import engine, IS_SQLITE, session_scope
+from app.db.models import ExtractionJobs
+from app.services.events import broker, TERMINAL_STATUSES
+from app.services.field_index import remove_document_fields
+from app.services.metrics import Counter, record_error, registry, time_stage
+from app.services.artifacts import ARTIFACT_DIR, remove_artifacts
+from app.services.previews import PREVIEW_DIR, remove_renditions
+from app.services.result_cache import result_cache
+from app.utils.file_utils import PARTIAL_SUFFIX, UPLOAD_DIR
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Finished jobs older than this are deleted together with their files (0 keeps them forever)
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", "0"))
+# Oldest finished jobs are deleted while the uploads total more than this (0 disables the limit)
+RETENTION_MAX_UPLOAD_MB = float(os.environ.get("RETENTION_MAX_UPLOAD_MB", "0"))
+RETENTION_SWEEP_INTERVAL = float(os.environ.get("RETENTION_SWEEP_INTERVAL", "300"))  # seconds
+# Without either limit the sweeper only runs (orphan files, missing uploads,
+# SQLite compaction) when this is set
+RETENTION_SWEEP_WITHOUT_LIMITS = os.environ.get("RETENTION_SWEEP_WITHOUT_LIMITS", "false").lower() == "true"
+# Rows or files handled per transaction, with a pause in between so request
+# handlers and job workers get the write lock
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "100"))
+RETENTION_BATCH_PAUSE = 0.05  # seconds
+# Files without a job are only removed once older than this, so uploads whose
+# row is not committed yet are left alone
+ORPHAN_GRACE_SECONDS = float(os.environ.get("ORPHAN_GRACE_SECONDS", "3600"))
+# Finished jobs whose upload is gone are reported; with this set they are deleted too
+RETENTION_DELETE_MISSING_FILES = os.environ.get("RETENTION_DELETE_MISSING_FILES", "false").lower() == "true"
+
+# SQLite compaction: free pages are returned in steps after every sweep once the
+# database uses incremental auto-vacuum. A database created before that needs
+# one full VACUUM to switch, done when this share of its pages is free.
+SQLITE_VACUUM_FREE_RATIO = float(os.environ.get("SQLITE_VACUUM_FREE_RATIO", "0.25"))
+SQLITE_INCREMENTAL_VACUUM_PAGES = 1000  # pages released per step
+SQLITE_ANALYZE_INTERVAL = float(os.environ.get("SQLITE_ANALYZE_INTERVAL", str(6 * 3600)))  # seconds
+SQLITE_ANALYSIS_LIMIT = 1000  # rows sampled per index by ANALYZE
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+REMOVED = registry.register(Counter(
+    "docparser_retention_removed_total",
+    "Jobs and files removed by the retention sweeper by reason (expired, over_quota, missing_file, orphan_upload, orphan_preview, orphan_artifact, partial_upload)",
+    ["reason"],
+))
+
+
+def remove_job_files(upload_paths: Iterable[str]):
+    """Delete uploads with their preview renditions and processing artifacts. Blocking."""
+    for upload_path in upload_paths:
+        path = Path(upload_path)
+        try:
+            path.unlink(missing_ok=True)
+            remove_renditions(path)
+            remove_artifacts(path.stem)
+        except OSError as e:
+            logger.warning(f"Could not delete {path}: {e}")
+
+
+def _delete_jobs(job_ids: List[str]) -> Tuple[List[str], Set[str]]:
+    """
+    Delete jobs and their index rows in one transaction. Returns their upload
+    paths and the content hashes no remaining job shares, whose cached results
+    can go as well.
+    """
+    with session_scope() as db:
+        rows = (
+            db.query(ExtractionJobs.id, ExtractionJobs.upload_path, ExtractionJobs.content_hash)
+            .filter(ExtractionJobs.id.in_(job_ids))
+            .all()
+        )
+        for job_id, _, _ in rows:
+            remove_document_fields(db, job_id)
+        db.query(ExtractionJobs).filter(ExtractionJobs.id.in_(job_ids)).delete(synchronize_session=False)
+        content_hashes = {content_hash for _, _, content_hash in rows if content_hash}
+        if content_hashes:
+            content_hashes -= {
+                content_hash for content_hash, in
+                db.query(ExtractionJobs.content_hash).filter(ExtractionJobs.content_hash.in_(content_hashes)).distinct()
+            }
+    return [upload_path for _, upload_path, _ in rows], content_hashes
+
+
+def _finished_jobs(db, limit: int, older_than: Optional[datetime] = None) -> List[str]:
+    """Oldest finished jobs first; jobs still processing are never touched"""
+    query = db.query(ExtractionJobs.id).filter(ExtractionJobs.status.in_(TERMINAL_STATUSES))
+    if older_than is not None:
+        query = query.filter(ExtractionJobs.created_at < older_than)
+    return [job_id for job_id, in query.order_by(ExtractionJobs.created_at, ExtractionJobs.id).limit(limit)]
+
+
+def _finished_job_sizes(db, limit: int) -> List[Tuple[str, Optional[int]]]:
+    query = db.query(ExtractionJobs.id, ExtractionJobs.file_size).filter(ExtractionJobs.status.in_(TERMINAL_STATUSES))
+    return [tuple(row) for row in query.order_by(ExtractionJobs.created_at, ExtractionJobs.id).limit(limit)]
+
+
+def _stored_upload_bytes() -> int:
+    with session_scope() as db:
+        return db.query(func.coalesce(func.sum(ExtractionJobs.file_size), 0)).scalar()
+
+
+class RetentionSweeper:
+    """
+    Background task that keeps uploads, previews and the job table bounded.
+
+    Every sweep deletes finished jobs past RETENTION_DAYS and, while the
+    uploads exceed RETENTION_MAX_UPLOAD_MB, the oldest finished jobs; rows go
+    first, files after the commit, so a crash in between leaves orphan files
+    that the next sweep collects. Files in the upload and preview directories
+    without a job are removed, and finished jobs without their upload are
+    reported. All work is done in batches of RETENTION_BATCH_SIZE, each in its
+    own short transaction. SQLite databases are then compacted and analyzed.
+    With neither limit set the sweeper is only started when `sweep_without_limits`
+    is, so disabled retention leaves files and the database alone.
+    """
+
+    def __init__(
+        self,
+        retention_days: float = RETENTION_DAYS,
+        max_upload_bytes: int = int(RETENTION_MAX_UPLOAD_MB * 1024 * 1024),
+        interval: float = RETENTION_SWEEP_INTERVAL,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        sweep_without_limits: bool = RETENTION_SWEEP_WITHOUT_LIMITS,
+    ):
+        self.retention_days = retention_days
+        self.max_upload_bytes = max_upload_bytes
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.sweep_without_limits = sweep_without_limits
+        self._task: Optional[asyncio.Task] = None
+        self._missing_cursor = ""  # job id where the missing file scan resumes
+        self._last_analyze: Optional[float] = None
+        self._sweeps = 0
+        self._last_sweep: Optional[Dict[str, Any]] = None
+        self._missing_files: List[str] = []
+
+    def start(self):
+        if not (self.retention_days > 0 or self.max_upload_bytes > 0 or self.sweep_without_limits):
+            logger.info("Retention sweeper not started (RETENTION_DAYS and RETENTION_MAX_UPLOAD_MB are off)")
+            return
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Retention sweeper started (every {self.interval:.0f}s)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+                record_error("retention_sweep", e)
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self) -> Dict[str, int]:
+        """Run one full sweep; returns the number of jobs and files removed by reason"""
+        removed = {reason: 0 for reason in (
+            "expired", "over_quota", "missing_file", "orphan_upload", "orphan_preview", "orphan_artifact", "partial_upload"
+        )}
+        started = time.monotonic()
+        with time_stage("retention_sweep"):
+            if self.retention_days > 0:
+                cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+                removed["expired"] = await self._delete_in_batches(
+                    lambda db: _finished_jobs(db, self.batch_size, older_than=cutoff)
+                )
+            if self.max_upload_bytes > 0:
+                removed["over_quota"] = await self._enforce_quota()
+            removed["missing_file"] = await self._check_missing_files()
+            await self._remove_orphans(removed)
+            await anyio.to_thread.run_sync(self._compact)
+        for reason, count in removed.items():
+            if count:
+                REMOVED.inc(count, reason=reason)
+        if any(removed.values()):
+            logger.info(f"Retention sweep removed {removed}")
+        self._sweeps += 1
+        self._last_sweep = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "seconds": round(time.monotonic() - started, 3),
+            "removed": removed,
+        }
+        return removed
+
+    async def _delete_batch(self, job_ids: List[str]) -> int:
+        upload_paths, content_hashes = await anyio.to_thread.run_sync(_delete_jobs, job_ids)
+        await anyio.to_thread.run_sync(remove_job_files, upload_paths)
+        # Extracted attributes are kept no longer than the jobs they came from
+        await anyio.to_thread.run_sync(result_cache.remove, content_hashes)
+        for job_id in job_ids:
+            await broker.publish({"type": "deleted", "id": job_id})
+        return len(job_ids)
+
+    async def _delete_in_batches(self, select_batch) -> int:
+        deleted = 0
+        while True:
+            job_ids = await anyio.to_thread.run_sync(self._select, select_batch)
+            if not job_ids:
+                return deleted
+            deleted += await self._delete_batch(job_ids)
+            if len(job_ids) < self.batch_size:
+                return deleted
+            await asyncio.sleep(RETENTION_BATCH_PAUSE)
+
+    @staticmethod
+    def _select(select_batch) -> List[str]:
+        with session_scope() as db:
+            return select_batch(db)
+
+    async def _enforce_quota(self) -> int:
+        deleted = 0
+        while True:
+            excess = await anyio.to_thread.run_sync(_stored_upload_bytes) - self.max_upload_bytes
+            if excess <= 0:
+                return deleted
+            jobs = await anyio.to_thread.run_sync(self._select, lambda db: _finished_job_sizes(db, self.batch_size))
+            if not jobs:
+                logger.warning("Uploads exceed RETENTION_MAX_UPLOAD_MB but no finished job is left to delete")
+                return deleted
+            # Only as many of the oldest jobs as needed to get under the limit
+            job_ids = []
+            for job_id, file_size in jobs:
+                job_ids.append(job_id)
+                excess -= file_size or 0
+                if excess <= 0:
+                    break
+            deleted += await self._delete_batch(job_ids)
+            await asyncio.sleep(RETENTION_BATCH_PAUSE)
+
+    def _missing_batch(self) -> List[str]:
+        """Next batch of finished jobs, in id order, whose upload no longer exists"""
+        with session_scope() as db:
+            rows = (
+                db.query(ExtractionJobs.id, ExtractionJobs.upload_path)
+                .filter(ExtractionJobs.id > self._missing_cursor, ExtractionJobs.status.in_(TERMINAL_STATUSES))
+                .order_by(ExtractionJobs.id)
+                .limit(self.batch_size)
+                .all()
+            )
+        self._missing_cursor = rows[-1][0] if len(rows) == self.batch_size else ""
+        return [job_id for job_id, upload_path in rows if not Path(upload_path).exists()]
+
+    async def _check_missing_files(self) -> int:
+        """
+        Scan one batch of jobs per sweep for missing uploads, resuming where the
+        previous sweep stopped, so large tables are covered over several sweeps.
+        """
+        missing = await anyio.to_thread.run_sync(self._missing_batch)
+        self._missing_files = (self._missing_files + missing)[-self.batch_size:]
+        if not missing:
+            return 0
+        if not RETENTION_DELETE_MISSING_FILES:
+            logger.warning(f"{len(missing)} finished jobs have no upload on disk, e.g. {missing[0]}")
+            return 0
+        return await self._delete_batch(missing)
+
+    async def _remove_orphans(self, removed: Dict[str, int]):
+        """Remove uploads, renditions and artifacts that belong to no job, and stale partial files"""
+        for directory, reason in (
+            (UPLOAD_DIR, "orphan_upload"), (PREVIEW_DIR, "orphan_preview"), (ARTIFACT_DIR, "orphan_artifact"),
+        ):
+            files = await anyio.to_thread.run_sync(_old_files, directory)
+            for start in range(0, len(files), self.batch_size):
+                batch = files[start:start + self.batch_size]
+                counts = await anyio.to_thread.run_sync(_remove_orphan_batch, batch)
+                removed[reason] += counts["orphan"]
+                removed["partial_upload"] += counts["partial"]
+                await asyncio.sleep(RETENTION_BATCH_PAUSE)
+
+    def _compact(self):
+        """Return free pages to the filesystem and refresh planner statistics. Blocking."""
+        if not IS_SQLITE:
+            return
+        with engine.connect() as conn:
+            auto_vacuum = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+            free_pages = conn.execute(text("PRAGMA freelist_count")).scalar()
+            pages = conn.execute(text("PRAGMA page_count")).scalar()
+            if auto_vacuum == AUTO_VACUUM_INCREMENTAL and free_pages:
+                # The sqlite3 module steps a statement that returns no rows only once,
+                # which frees a single page; executescript runs it to completion
+                driver_connection = conn.connection.driver_connection
+                with time_stage("sqlite_vacuum"):
+                    # Each step is a short write transaction of its own
+                    for _ in range(free_pages // SQLITE_INCREMENTAL_VACUUM_PAGES + 1):
+                        driver_connection.executescript(f"PRAGMA incremental_vacuum({SQLITE_INCREMENTAL_VACUUM_PAGES})")
+            elif auto_vacuum != AUTO_VACUUM_INCREMENTAL and pages and free_pages / pages >= SQLITE_VACUUM_FREE_RATIO:
+                # One-off rewrite that also switches the database to incremental auto-vacuum
+                logger.info(f"Vacuuming database ({free_pages} of {pages} pages free)")
+                with time_stage("sqlite_vacuum"):
+                    conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+                    conn.execute(text("VACUUM"))
+                conn.commit()
+            if self._last_analyze is None or time.monotonic() - self._last_analyze >= SQLITE_ANALYZE_INTERVAL:
+                conn.execute(text(f"PRAGMA analysis_limit={SQLITE_ANALYSIS_LIMIT}"))
+                conn.execute(text("ANALYZE"))
+                conn.commit()
+                self._last_analyze = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval,
+            "retention_days": self.retention_days or None,
+            "max_upload_bytes": self.max_upload_bytes or None,
+            "sweeps": self._sweeps,
+            "last_sweep": self._last_sweep,
+            "jobs_missing_files": list(self._missing_files),
+        }
+
+
+def _old_files(directory: Path) -> List[Path]:
+    """Files in a directory last modified more than ORPHAN_GRACE_SECONDS ago"""
+    if not directory.is_dir():
+        return []
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    with os.scandir(directory) as entries:
+        return [
+            Path(entry.path) for entry in entries
+            if entry.is_file() and entry.stat().st_mtime < cutoff
+        ]
+
+
+def _job_id(path: Path) -> str:
+    """
+    Uploads are <job id><ext>, renditions <job id>.<rendition><ext>, artifacts
+    <job id>.<artifact><ext>, partial files .<name>.part
+    """
+    return path.name.lstrip(".").split(".", 1)[0]
+
+
+def _remove_orphan_batch(paths: List[Path]) -> Dict[str, int]:
+    counts = {"orphan": 0, "partial": 0}
+    with session_scope() as db:
+        known = {
+            job_id for job_id, in db.query(ExtractionJobs.id).filter(
+                ExtractionJobs.id.in_({_job_id(path) for path in paths})
+            )
+        }
+    for path in paths:
+        partial = path.name.endswith(PARTIAL_SUFFIX)
+        # A partial file this old belongs to an interrupted upload or rendition
+        if not partial and _job_id(path) in known:
+            continue
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not delete {path}: {e}")
+            continue
+        counts["partial" if partial else "orphan"] += 1
+    return counts
+
+
+# Process-wide sweeper, started with the application
+retention_sweeper = RetentionSweeper()
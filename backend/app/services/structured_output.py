@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple, Type
+
+from groq import BadRequestError
+from pydantic import BaseModel, ValidationError
+
+from app.services.metrics import STRUCTURED_OUTPUT
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# How model answers are constrained: "json_object" (JSON mode), "json_schema"
+# (structured outputs, for models that support it) or "none" (prompt only)
+JSON_OBJECT = "json_object"
+JSON_SCHEMA = "json_schema"
+RESPONSE_FORMATS = (JSON_OBJECT, JSON_SCHEMA, "none")
+LLM_RESPONSE_FORMAT = os.environ.get("LLM_RESPONSE_FORMAT", JSON_OBJECT).lower()
+
+REPAIR_PROMPT = """
+The JSON below was supposed to match the given JSON schema but failed validation.
+
+Validation errors:
+{errors}
+
+JSON schema:
+{schema}
+
+Response to fix:
+{response}
+
+Return only the corrected JSON object. Keep every value that is already present and use empty strings for fields that are missing.
+"""
+
+
+def response_format(schema: Type[BaseModel]) -> Optional[Dict[str, Any]]:
+    """The response_format request parameter for the configured mode"""
+    if LLM_RESPONSE_FORMAT == JSON_OBJECT:
+        return {"type": "json_object"}
+    if LLM_RESPONSE_FORMAT == JSON_SCHEMA:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema(by_alias=True)},
+        }
+    return None
+
+
+def repair_prompt(raw_content: str, errors: str, schema: Type[BaseModel]) -> str:
+    return REPAIR_PROMPT.format(
+        errors=errors,
+        schema=json.dumps(schema.model_json_schema(by_alias=True)),
+        response=raw_content,
+    )
+
+
+def failed_generation(error: BadRequestError) -> Optional[str]:
+    """
+    In JSON mode Groq rejects output that is not valid JSON with a 400
+    "json_validate_failed" error carrying the generated text; return that text.
+    """
+    body = error.body if isinstance(error.body, dict) else {}
+    body = body.get("error", body) if isinstance(body.get("error"), dict) else body
+    if body.get("code") != "json_validate_failed":
+        return None
+    return body.get("failed_generation") or ""
+
+
+def _first_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Decode the first complete JSON object in the text, nested objects included"""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"{", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def parse_json_response(raw_content: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse a JSON object out of a model response, tolerating markdown fences and surrounding text"""
+    if not raw_content:
+        return None
+    try:
+        # Attempt 1: the whole response is the object (always the case in JSON mode)
+        parsed = json.loads(raw_content)
+        if isinstance(parsed, dict):
+            return parsed
+    except json.JSONDecodeError:
+        pass
+    # Attempt 2: ```json ... ``` markdown blocks, the last one is often the most refined
+    for block in reversed(re.findall(r"```(?:json)?\s*(.*?)\s*```", raw_content, re.DOTALL)):
+        parsed = _first_json_object(block)
+        if parsed is not None:
+            return parsed
+    # Attempt 3: the first balanced object anywhere in the text
+    return _first_json_object(raw_content)
+
+
+def validate_response(raw_content: Optional[str], schema: Type[BaseModel]) -> Tuple[Optional[BaseModel], Optional[str]]:
+    """Return (model, None) for a valid answer, or (None, description of the problem)"""
+    parsed = parse_json_response(raw_content)
+    if parsed is None:
+        return None, "The response does not contain a JSON object."
+    try:
+        return schema.model_validate(parsed), None
+    except ValidationError as e:
+        return None, str(e)
+
+
+class StructuredOutputStats:
+    """
+    Outcome counters per extraction step: answers valid on the first try,
+    answers fixed by the repair call, and answers that stayed unusable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, task: str, outcome: str):
+        STRUCTURED_OUTPUT.inc(task=task, outcome=outcome)
+        with self._lock:
+            counts = self._counts.setdefault(task, {"valid": 0, "repaired": 0, "failed": 0})
+            counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tasks = {task: dict(counts) for task, counts in self._counts.items()}
+        total = sum(sum(counts.values()) for counts in tasks.values())
+        failed = sum(counts["failed"] for counts in tasks.values())
+        repaired = sum(counts["repaired"] for counts in tasks.values())
+        return {
+            "response_format": LLM_RESPONSE_FORMAT,
+            "responses": total,
+            "repair_rate": round(repaired / total, 4) if total else None,
+            "parse_failure_rate": round(failed / total, 4) if total else None,
+            "tasks": tasks,
+        }
+
+
+# Process-wide counters
+structured_output_stats = StructuredOutputStats()
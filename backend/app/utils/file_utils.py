@@ -1,21 +1,173 @@
-import shutil
 import os
+import uuid as uuid_lib
+import hashlib
+import zipfile
 from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Tuple
+import anyio
 from fastapi import UploadFile
 
 UPLOAD_DIR = Path("./uploads")
 
-def save_upload_file(upload_file: UploadFile, uuid: str) -> Path:
+# Extensions accepted as documents, both as direct uploads and inside ZIP archives
+SUPPORTED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".webp", ".avif", ".bmp", ".gif", ".tif", ".tiff"}
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "200"))
+MAX_UPLOAD_BYTES = int(float(os.environ.get("MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = int(float(os.environ.get("MAX_BATCH_UPLOAD_MB", "500")) * 1024 * 1024)
+COPY_CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = ".part"
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an uploaded document exceeds MAX_UPLOAD_BYTES"""
+
+    def __init__(self, limit: int = MAX_UPLOAD_BYTES):
+        super().__init__(f"File exceeds the {limit // (1024 * 1024)} MB upload limit")
+        self.limit = limit
+
+
+class SavedUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+def _upload_paths(uuid: str, extension: str) -> Tuple[Path, Path]:
+    """Final path and the hidden temporary path it is written through"""
+    final_path = UPLOAD_DIR / f"{uuid}{extension}"
+    return final_path, UPLOAD_DIR / f".{final_path.name}{PARTIAL_SUFFIX}"
+
+
+async def save_upload_file(upload_file: UploadFile, uuid: str) -> SavedUpload:
+    """
+    Stream an upload to <uuid><extension> without blocking the event loop.
+    The file is written in chunks to a temporary file, hashed and measured on
+    the way, and atomically renamed into place once complete, so a crash never
+    leaves a partial document behind. Raises UploadTooLargeError past MAX_UPLOAD_BYTES.
+    """
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     
     # Get the file extension from the original filename
     _, extension = os.path.splitext(upload_file.filename)
     
     # Create a new filename using the UUID and original extension
-    new_filename = f"{uuid}{extension}"
-    
-    # Save the file with the new UUID-based filename
-    file_path = UPLOAD_DIR / new_filename
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
-    return file_path 
\ No newline at end of file
+    file_path, temp_path = _upload_paths(uuid, extension)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(temp_path, "wb") as buffer:
+            while chunk := await upload_file.read(COPY_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLargeError()
+                digest.update(chunk)
+                await buffer.write(chunk)
+        await anyio.to_thread.run_sync(os.replace, temp_path, file_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return SavedUpload(file_path, size, digest.hexdigest())
+
+
+def save_stream(stream: BinaryIO, uuid: str, extension: str) -> SavedUpload:
+    """Blocking counterpart of save_upload_file for file-like objects such as ZIP members"""
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    file_path, temp_path = _upload_paths(uuid, extension.lower())
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with temp_path.open("wb") as buffer:
+            while chunk := stream.read(COPY_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLargeError()
+                digest.update(chunk)
+                buffer.write(chunk)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return SavedUpload(file_path, size, digest.hexdigest())
+
+
+def is_zip_upload(upload_file: UploadFile) -> bool:
+    return Path(upload_file.filename or "").suffix.lower() == ".zip"
+
+
+def _zip_documents(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Supported document members of an archive, skipping folders and macOS metadata"""
+    return [
+        member for member in archive.infolist()
+        if not member.is_dir()
+        and not member.filename.startswith("__MACOSX/")
+        and not Path(member.filename).name.startswith(".")
+        and Path(member.filename).suffix.lower() in SUPPORTED_EXTENSIONS
+    ]
+
+
+def _check_member_sizes(members: List[zipfile.ZipInfo]):
+    """Reject oversized members from the central directory before decompressing anything"""
+    for member in members:
+        if member.file_size > MAX_UPLOAD_BYTES:
+            raise UploadTooLargeError()
+
+
+def count_batch_documents(upload_files: List[UploadFile]) -> int:
+    """Count the documents a batch will create, reading only ZIP central directories"""
+    total = 0
+    for upload_file in upload_files:
+        if is_zip_upload(upload_file):
+            with zipfile.ZipFile(upload_file.file) as archive:
+                members = _zip_documents(archive)
+                _check_member_sizes(members)
+                total += len(members)
+            upload_file.file.seek(0)
+        elif Path(upload_file.filename or "").suffix.lower() in SUPPORTED_EXTENSIONS:
+            if upload_file.size is not None and upload_file.size > MAX_UPLOAD_BYTES:
+                raise UploadTooLargeError()
+            total += 1
+    return total
+
+
+def iter_batch_documents(upload_files: List[UploadFile]) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Yield (original_filename, stream) for every document in a batch.
+    ZIP members are decompressed as they are read, so archives are never
+    extracted into memory as a whole.
+    """
+    for upload_file in upload_files:
+        if is_zip_upload(upload_file):
+            with zipfile.ZipFile(upload_file.file) as archive:
+                for member in _zip_documents(archive):
+                    with archive.open(member) as stream:
+                        yield Path(member.filename).name, stream
+        elif Path(upload_file.filename or "").suffix.lower() in SUPPORTED_EXTENSIONS:
+            yield upload_file.filename, upload_file.file
+
+
+def save_batch_files(upload_files: List[UploadFile]) -> Tuple[List[Dict[str, object]], List[str]]:
+    """
+    Save every document of a batch under a new UUID. Blocking.
+    Returns (saved, skipped): saved entries carry uuid, original_filename,
+    file_type and the SavedUpload; skipped lists uploads that are not documents.
+    """
+    saved, skipped = [], []
+    for upload_file in upload_files:
+        if not is_zip_upload(upload_file) and Path(upload_file.filename or "").suffix.lower() not in SUPPORTED_EXTENSIONS:
+            skipped.append(upload_file.filename or "")
+    try:
+        for original_filename, stream in iter_batch_documents(upload_files):
+            document_uuid = str(uuid_lib.uuid4())
+            extension = Path(original_filename).suffix.lower()
+            saved.append({
+                "uuid": document_uuid,
+                "original_filename": original_filename,
+                "file_type": extension.lstrip("."),
+                "upload": save_stream(stream, document_uuid, extension),
+            })
+    except BaseException:
+        # Do not leave half a batch on disk without job rows pointing at it
+        for entry in saved:
+            entry["upload"].path.unlink(missing_ok=True)
+        raise
+    return saved, skipped
@@ -0,0 +1,146 @@
+import io
+import os
+import math
+import base64
+import logging
+from pathlib import Path
+from typing import Optional
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Normalization configuration
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", "2500000"))  # ~2000x1250
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()  # JPEG, WEBP or PNG
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+IMAGE_CROP_TO_DOCUMENT = os.environ.get("IMAGE_CROP_TO_DOCUMENT", "true").lower() == "true"
+PDF_RENDER_DPI = int(os.environ.get("PDF_RENDER_DPI", "150"))
+
+IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+IMAGE_MIME_TYPE = IMAGE_MIME_TYPES.get(IMAGE_FORMAT, "image/jpeg")
+
+# Document cropping heuristics
+CROP_ANALYSIS_SIZE = 512  # longest side of the copy used to find the document
+CROP_THRESHOLD = 40  # grey-level difference from the background that counts as content
+CROP_MARGIN = 0.02  # fraction of the image kept around the detected document
+CROP_MIN_AREA = 0.2  # ignore detections smaller than this share of the image
+CROP_MAX_AREA = 0.9  # skip cropping when the document already fills the frame
+
+
+def to_rgb(image: Image.Image) -> Image.Image:
+    """Convert to RGB, flattening any transparency onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def _border_median(gray: Image.Image) -> int:
+    """Median grey level of a thin frame around the image, taken as the background"""
+    width, height = gray.size
+    band = max(1, min(width, height) // 50)
+    strips = [
+        gray.crop((0, 0, width, band)),
+        gray.crop((0, height - band, width, height)),
+        gray.crop((0, 0, band, height)),
+        gray.crop((width - band, 0, width, height)),
+    ]
+    medians = sorted(ImageStat.Stat(strip).median[0] for strip in strips)
+    return int((medians[1] + medians[2]) / 2)
+
+
+def crop_to_document(image: Image.Image) -> Image.Image:
+    """
+    Crop away a uniform background around the document.
+    Works on a small greyscale copy and leaves the image untouched when the
+    detected region is implausibly small or already fills the frame.
+    """
+    gray = image.convert("L")
+    gray.thumbnail((CROP_ANALYSIS_SIZE, CROP_ANALYSIS_SIZE))
+    background = Image.new("L", gray.size, _border_median(gray))
+    mask = ImageChops.difference(gray, background).point(lambda p: 255 if p > CROP_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+
+    area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) / (gray.width * gray.height)
+    if area < CROP_MIN_AREA or area > CROP_MAX_AREA:
+        return image
+
+    scale_x = image.width / gray.width
+    scale_y = image.height / gray.height
+    margin_x = image.width * CROP_MARGIN
+    margin_y = image.height * CROP_MARGIN
+    box = (
+        max(0, int(bbox[0] * scale_x - margin_x)),
+        max(0, int(bbox[1] * scale_y - margin_y)),
+        min(image.width, int(bbox[2] * scale_x + margin_x)),
+        min(image.height, int(bbox[3] * scale_y + margin_y)),
+    )
+    return image.crop(box)
+
+
+def limit_pixels(image: Image.Image, max_pixels: int = IMAGE_MAX_PIXELS) -> Image.Image:
+    """Downscale so that width * height stays within the pixel budget"""
+    pixels = image.width * image.height
+    if pixels <= max_pixels:
+        return image
+    scale = math.sqrt(max_pixels / pixels)
+    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def normalize_image(image: Image.Image) -> Image.Image:
+    """Apply EXIF orientation, flatten to RGB, crop to the document and cap the pixel count"""
+    original_size = image.size
+    image = ImageOps.exif_transpose(image)
+    image = to_rgb(image)
+    if IMAGE_CROP_TO_DOCUMENT:
+        image = crop_to_document(image)
+    image = limit_pixels(image)
+    if image.size != original_size:
+        logger.info(f"Normalized image from {original_size[0]}x{original_size[1]} to {image.width}x{image.height}")
+    return image
+
+
+def encode_normalized_image(image: Image.Image) -> str:
+    """Encode an RGB image to base64 using the configured format and quality"""
+    buffer = io.BytesIO()
+    if IMAGE_FORMAT == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=IMAGE_FORMAT, quality=IMAGE_QUALITY, optimize=True)
+    logger.info(f"Encoded {IMAGE_FORMAT} payload of {buffer.tell() // 1024} KB")
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def image_payload(image: Image.Image, source_path: Optional[Path] = None) -> str:
+    """
+    Normalize and encode an image for the vision model.
+    When nothing had to change and the source file is already an RGB image in
+    the target format, the smaller of the original and re-encoded bytes is
+    sent. Files carrying EXIF data (orientation, camera, GPS position) are
+    always re-encoded, which drops it.
+    """
+    source_format = image.format
+    source_mode = image.mode
+    has_exif = len(image.getexif()) > 0
+    normalized = normalize_image(image)
+    encoded = encode_normalized_image(normalized)
+    if (
+        source_path is not None
+        and source_format == IMAGE_FORMAT
+        and source_mode == "RGB"
+        and not has_exif
+        and normalized.size == image.size
+    ):
+        with open(source_path, "rb") as source_file:
+            original = source_file.read()
+        if len(original) * 4 / 3 < len(encoded):
+            return base64.b64encode(original).decode('utf-8')
+    return encoded
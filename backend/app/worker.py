@@ -0,0 +1,106 @@
+"""
+Standalone extraction worker.
+
+Claims pending jobs from the shared database under a lease, processes them
+with the same pipeline as the API process and renews the lease while they
+run. Start any number of them, on one machine or several, next to an API
+started with JOB_RUNNER=worker:
+
+    python -m app.worker
+
+Concurrency per worker is MAX_CONCURRENT_JOBS. On SIGTERM/SIGINT the worker
+stops claiming, lets running jobs finish for up to WORKER_SHUTDOWN_TIMEOUT
+seconds and hands unfinished ones back.
+"""
+import os
+import signal
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file before app modules read their configuration
+load_dotenv()
+
+from app.db.database import ensure_schema
+from app.services import llm_client
+from app.services.document_processor import scheduler
+from app.services.field_index import ensure_search_index
+from app.services.job_leases import WORKER_ID, LeaseKeeper
+from app.services.metrics import registry, register_gauge, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.services.result_cache import result_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How often an idle worker looks for new jobs
+WORKER_POLL_INTERVAL = float(os.environ.get("WORKER_POLL_INTERVAL", "1"))  # seconds
+WORKER_SHUTDOWN_TIMEOUT = float(os.environ.get("WORKER_SHUTDOWN_TIMEOUT", "30"))  # seconds
+# Port of a /metrics endpoint for Prometheus (0 disables it)
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "0"))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving worker metrics on port {port}")
+    return server
+
+
+async def run_worker():
+    ensure_schema()
+    ensure_search_index()
+    llm_client.init_client()
+    await scheduler.start()
+    # Claim only as many jobs as there are idle workers, so the rest stay available to other processes
+    keeper = LeaseKeeper(scheduler, WORKER_POLL_INTERVAL, scheduler.idle_workers)
+    await keeper.start()
+
+    register_gauge("docparser_jobs_in_flight", "Jobs currently being processed", lambda: scheduler.stats()["in_flight"])
+    metrics_server = start_metrics_server(WORKER_METRICS_PORT) if WORKER_METRICS_PORT else None
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    logger.info(f"Worker {WORKER_ID} started with {scheduler.max_concurrency} concurrent jobs")
+
+    await stopping.wait()
+    logger.info(f"Worker {WORKER_ID} stopping, waiting up to {WORKER_SHUTDOWN_TIMEOUT:.0f}s for running jobs")
+    keeper.claiming = False
+    if not await scheduler.drain(WORKER_SHUTDOWN_TIMEOUT):
+        logger.warning("Running jobs did not finish in time, handing them back")
+    await scheduler.stop()
+    await keeper.stop()
+    await llm_client.close_client()
+    result_cache.close()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    logger.info(f"Worker {WORKER_ID} stopped")
+
+
+def main():
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
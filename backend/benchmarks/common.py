@@ -0,0 +1,34 @@
+"""Helpers shared by the benchmark scripts"""
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SUPPORTED_SUFFIXES = {".pdf", ".jpg", ".jpeg", ".png", ".webp", ".avif", ".bmp", ".gif"}
+
+
+def collect_documents(source: Path, workdir: Path) -> List[Path]:
+    """Return document paths from a directory or a zip archive"""
+    if source.suffix.lower() == ".zip":
+        with zipfile.ZipFile(source) as archive:
+            archive.extractall(workdir)
+        source = workdir
+    return sorted(p for p in source.rglob("*") if p.suffix.lower() in SUPPORTED_SUFFIXES)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def distribution(values: List[float], scale: float = 1.0, digits: int = 3) -> Optional[Dict[str, float]]:
+    """p50/p95/p99/mean/max of the values, multiplied by `scale`"""
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50) * scale, digits),
+        "p95": round(percentile(values, 95) * scale, digits),
+        "p99": round(percentile(values, 99) * scale, digits),
+        "mean": round(sum(values) / len(values) * scale, digits),
+        "max": round(max(values) * scale, digits),
+    }
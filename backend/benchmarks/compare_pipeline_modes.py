@@ -0,0 +1,133 @@
+"""
+Compare the two-step and single-call extraction pipelines on a set of documents.
+
+Runs every document through both modes against the live Groq API and reports
+latency, LLM calls, single-call fallback rate and agreement. Agreement is
+measured against ground-truth labels when given, otherwise the two-step
+result is treated as the reference.
+
+Usage (from the backend directory, with GROQ_API_KEY set):
+    python -m benchmarks.compare_pipeline_modes ../sample_documents.zip
+    python -m benchmarks.compare_pipeline_modes ./docs --labels labels.json --repeat 3
+
+labels.json maps file names to {"doc_type": "...", "attributes": {...}}.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.document_processor import process_document, TWO_STEP, SINGLE_CALL
+from benchmarks.common import collect_documents, percentile
+
+
+def _normalize(value: Any) -> str:
+    return " ".join(str(value or "").split()).lower()
+
+
+def _doc_type_key(doc_type: str) -> str:
+    """Map free-form document type names onto the four supported classes"""
+    doc_type = _normalize(doc_type)
+    if "passport" in doc_type:
+        return "passport"
+    if "ead" in doc_type or "employment authorization" in doc_type:
+        return "ead"
+    if "license" in doc_type or "driver" in doc_type:
+        return "driver_license"
+    return "unknown"
+
+
+def field_agreement(result: Dict[str, Any], reference: Dict[str, Any]) -> Optional[float]:
+    """Share of reference attributes whose values match, ignoring case and whitespace"""
+    expected = {_normalize(k): _normalize(v) for k, v in (reference.get("attributes") or {}).items() if v}
+    if not expected:
+        return None
+    actual = {_normalize(k): _normalize(v) for k, v in (result.get("attributes") or {}).items()}
+    matched = sum(1 for key, value in expected.items() if actual.get(key) == value)
+    return matched / len(expected)
+
+
+async def run_mode(path: Path, mode: str) -> Dict[str, Any]:
+    started = time.monotonic()
+    result, success = await process_document(path, mode)
+    return {"result": result, "success": success, "seconds": time.monotonic() - started}
+
+
+async def compare(documents: List[Path], labels: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    runs = {TWO_STEP: [], SINGLE_CALL: []}
+    for path in documents:
+        for _ in range(repeat):
+            outcomes = {mode: await run_mode(path, mode) for mode in runs}
+            reference = labels.get(path.name)
+            if reference is None:
+                two_step = outcomes[TWO_STEP]["result"]
+                reference = {
+                    "doc_type": (two_step.get("document_type") or {}).get("doc_type", ""),
+                    "attributes": two_step.get("attributes") or {},
+                }
+            for mode, outcome in outcomes.items():
+                result = outcome["result"]
+                pipeline = result.get("pipeline", {})
+                outcome.update({
+                    "file": path.name,
+                    "llm_calls": pipeline.get("llm_calls", 0),
+                    "fallback": pipeline.get("fallback", False),
+                    "doc_type_match": _doc_type_key((result.get("document_type") or {}).get("doc_type", ""))
+                    == _doc_type_key(reference.get("doc_type", "")),
+                    "field_agreement": field_agreement(result, reference),
+                })
+                runs[mode].append(outcome)
+            print(
+                f"{path.name}: two_step {outcomes[TWO_STEP]['seconds']:.2f}s, "
+                f"single_call {outcomes[SINGLE_CALL]['seconds']:.2f}s"
+                f"{' (fallback)' if outcomes[SINGLE_CALL]['fallback'] else ''}"
+            )
+
+    summary = {}
+    for mode, outcomes in runs.items():
+        seconds = [o["seconds"] for o in outcomes]
+        agreements = [o["field_agreement"] for o in outcomes if o["field_agreement"] is not None]
+        summary[mode] = {
+            "documents": len(outcomes),
+            "success_rate": sum(o["success"] for o in outcomes) / len(outcomes),
+            "mean_seconds": statistics.mean(seconds),
+            "p50_seconds": percentile(seconds, 50),
+            "p95_seconds": percentile(seconds, 95),
+            "mean_llm_calls": statistics.mean(o["llm_calls"] for o in outcomes),
+            "fallback_rate": sum(o["fallback"] for o in outcomes) / len(outcomes),
+            "doc_type_accuracy": sum(o["doc_type_match"] for o in outcomes) / len(outcomes),
+            "field_agreement": statistics.mean(agreements) if agreements else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two_step and single_call pipeline modes")
+    parser.add_argument("source", type=Path, help="Directory of documents or a zip archive")
+    parser.add_argument("--labels", type=Path, help="JSON file with ground-truth labels per file name")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per document and mode")
+    parser.add_argument("--output", type=Path, help="Write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    labels = json.loads(args.labels.read_text()) if args.labels else {}
+    with tempfile.TemporaryDirectory() as workdir:
+        documents = collect_documents(args.source, Path(workdir))
+        if not documents:
+            parser.error(f"No supported documents found in {args.source}")
+        summary = asyncio.run(compare(documents, labels, args.repeat))
+
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
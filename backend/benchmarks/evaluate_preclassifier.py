@@ -0,0 +1,95 @@
+"""
+Evaluate the local document pre-classifier on a set of documents.
+
+Classifies the first page of every document locally (the same payload the
+vision model receives) and reports timing, coverage above the confidence
+threshold and agreement with a reference: ground-truth labels when given,
+otherwise the LLM identification call (--llm, needs GROQ_API_KEY).
+
+Usage (from the backend directory):
+    python -m benchmarks.evaluate_preclassifier ../sample_documents.zip --labels labels.json
+    python -m benchmarks.evaluate_preclassifier ./docs --llm --threshold 0.8
+
+labels.json maps file names to {"doc_type": "..."} (the compare_pipeline_modes format).
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.document_processor import identify_document_type, load_document_pages
+from app.services.field_index import document_type_key
+from app.services.llm_client import get_client
+from app.services.preclassifier import PRECLASSIFIER_MIN_CONFIDENCE, classify_payload
+from benchmarks.common import collect_documents, distribution
+
+
+async def evaluate(paths: List[Path], labels: Dict[str, Any], use_llm: bool, threshold: float) -> Dict[str, Any]:
+    client = get_client() if use_llm else None
+    if use_llm and client is None:
+        raise SystemExit("GROQ_API_KEY is not set")
+
+    rows = []
+    for path in paths:
+        pages = await load_document_pages(path)
+        prediction = classify_payload(pages[0])
+        reference: Optional[str] = None
+        if path.name in labels:
+            reference = labels[path.name].get("doc_type")
+        elif client is not None:
+            reference = (await identify_document_type(client, pages[0]))["doc_type"]
+        rows.append({
+            "file": path.name,
+            "predicted": prediction.doc_type,
+            "confidence": prediction.confidence,
+            "reference": reference,
+            "agrees": None if reference is None else document_type_key(prediction.doc_type) == document_type_key(reference),
+            "milliseconds": prediction.milliseconds,
+            "features": prediction.features,
+        })
+        print(f"{path.name}: {prediction.doc_type} ({prediction.confidence:.2f}, {prediction.milliseconds:.1f} ms)"
+              f" reference={reference} features={prediction.features}")
+
+    decided = [row for row in rows if row["predicted"] != "Unknown Doc" and row["agrees"] is not None]
+    confident = [row for row in decided if row["confidence"] >= threshold]
+    return {
+        "documents": len(rows),
+        "threshold": threshold,
+        "milliseconds": distribution([row["milliseconds"] for row in rows]),
+        "predicted": len([row for row in rows if row["predicted"] != "Unknown Doc"]),
+        "coverage": round(len([row for row in rows if row["predicted"] != "Unknown Doc" and row["confidence"] >= threshold]) / len(rows), 4) if rows else None,
+        "agreement": round(sum(row["agrees"] for row in decided) / len(decided), 4) if decided else None,
+        "confident_agreement": round(sum(row["agrees"] for row in confident) / len(confident), 4) if confident else None,
+        "rows": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local pre-classifier against labels or the LLM")
+    parser.add_argument("source", type=Path, help="Directory or zip archive of documents")
+    parser.add_argument("--labels", type=Path, help="JSON file of ground-truth labels")
+    parser.add_argument("--llm", action="store_true", help="Use the LLM identification call as the reference")
+    parser.add_argument("--threshold", type=float, default=PRECLASSIFIER_MIN_CONFIDENCE,
+                        help="Confidence above which the identification call would be skipped")
+    parser.add_argument("--output", type=Path, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    labels = json.loads(args.labels.read_text()) if args.labels else {}
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = collect_documents(args.source, Path(workdir))
+        report = asyncio.run(evaluate(paths, labels, args.llm, args.threshold))
+
+    summary = {key: value for key, value in report.items() if key != "rows"}
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+Answers the prompts of the extraction pipeline with synthetic or recorded
+responses after a configurable latency, and can inject 429 rate-limit and
+5xx errors, either at random or by enforcing requests/tokens per minute.
+Requests with "stream": true are answered as a server-sent event stream of
+small content pieces, the first one arriving after STREAM_FIRST_TOKEN_SHARE of
+the latency, like the real API.
+Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port>.
+
+Usage (from the backend directory):
+    python -m benchmarks.mock_groq_server --port 8100 --latency lognormal:0.8,0.4 --rate-429 0.02
+    python -m benchmarks.mock_groq_server --responses recorded.json --rpm 300
+
+recorded.json maps a prompt kind ("identify", "extract", "single_call",
+"repair") to a response text or a list of texts used in rotation.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SYNTHETIC_RESPONSES = {
+    "identify": [
+        {"doc_type": "Passport", "country": "India", "state": ""},
+        {"doc_type": "USA Drivers License", "country": "", "state": "California"},
+        {"doc_type": "EAD Card", "country": "", "state": ""},
+    ],
+    "extract": [
+        {
+            "First Name": "Jane", "Middle Name (if any)": "", "Last Name": "Doe",
+            "Date of Birth (MM/DD/YYYY)": "01/02/1990", "Passport Number": "P1234567",
+            "License Number": "D1234567", "Card Number": "SRC1234567890",
+            "Issue Date (MM/DD/YYYY)": "03/04/2020", "Expiry Date (MM/DD/YYYY)": "03/03/2030",
+            "Document Number": "X1234567", "Gender": "F",
+        },
+    ],
+    "single_call": [
+        {
+            "doc_type": "Passport", "country": "India", "state": "", "confidence": 0.95,
+            "attributes": {
+                "First Name": "Jane", "Middle Name (if any)": "", "Last Name": "Doe",
+                "Date of Birth (MM/DD/YYYY)": "01/02/1990", "Passport Number": "P1234567",
+                "Issue Date (MM/DD/YYYY)": "03/04/2020", "Expiry Date (MM/DD/YYYY)": "03/03/2030",
+            },
+        },
+    ],
+}
+SYNTHETIC_RESPONSES["repair"] = SYNTHETIC_RESPONSES["extract"]
+
+# Rough token accounting: images are billed as a fixed block
+IMAGE_TOKENS = 1500
+
+# Streamed answers: share of the latency before the first piece arrives, the
+# rest is spread over pieces of this many characters (about one token each)
+STREAM_FIRST_TOKEN_SHARE = 0.3
+STREAM_PIECE_CHARS = 4
+COMPLETION_TOKENS = 150
+
+
+def parse_latency(spec: str, rng: Optional[random.Random] = None):
+    """
+    Build a latency sampler from "fixed:S", "uniform:LOW,HIGH",
+    "normal:MEAN,STDDEV" or "lognormal:MEDIAN,SIGMA" (seconds).
+    """
+    rng = rng or random.Random()
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution: {spec}")
+
+
+def prompt_kind(payload: Dict[str, Any]) -> Tuple[str, bool]:
+    """Classify a request by its prompt; returns (kind, has_image)"""
+    content = payload["messages"][-1]["content"]
+    if isinstance(content, str):
+        text, has_image = content, False
+    else:
+        text = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        has_image = any(part.get("type") == "image_url" for part in content)
+    if "failed validation" in text:
+        return "repair", has_image
+    if "Then extract the attributes" in text:
+        return "single_call", has_image
+    if "Identify this document type" in text:
+        return "identify", has_image
+    return "extract", has_image
+
+
+class SlidingWindow:
+    """Amounts consumed in the last 60 seconds"""
+
+    def __init__(self):
+        self.events: Deque[Tuple[float, int]] = deque()
+        self.total = 0
+
+    def used(self, now: float) -> int:
+        while self.events and now - self.events[0][0] >= 60:
+            self.total -= self.events.popleft()[1]
+        return self.total
+
+    def add(self, now: float, amount: int):
+        self.events.append((now, amount))
+        self.total += amount
+
+    def reset_after(self, now: float) -> float:
+        return max(0.0, 60 - (now - self.events[0][0])) if self.events else 0.0
+
+
+class MockGroq:
+    def __init__(
+        self,
+        latency: str = "fixed:0.5",
+        rate_429: float = 0.0,
+        rate_5xx: float = 0.0,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        responses: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+        model_latency: Optional[Dict[str, str]] = None,
+    ):
+        self.random = random.Random(seed)
+        self.sample_latency = parse_latency(latency, self.random)
+        # Per-model latency overrides, e.g. to make the primary model slow and test hedging
+        self.model_latency = {
+            model: parse_latency(spec, self.random) for model, spec in (model_latency or {}).items()
+        }
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rpm = rpm
+        self.tpm = tpm
+        merged = {**SYNTHETIC_RESPONSES, **(responses or {})}
+        self.responses = {
+            kind: itertools.cycle(value if isinstance(value, list) else [value])
+            for kind, value in merged.items()
+        }
+        self.requests = SlidingWindow()
+        self.tokens = SlidingWindow()
+        self.lock = threading.Lock()
+        self.counters = {
+            "requests": 0, "ok": 0, "rate_limited": 0, "server_errors": 0, "in_flight": 0, "max_in_flight": 0,
+            "streams": 0, "streams_cancelled": 0, "streamed_pieces": 0,
+        }
+
+    def _rate_limit_headers(self, now: float) -> Dict[str, str]:
+        headers = {}
+        if self.rpm:
+            headers["x-ratelimit-limit-requests"] = str(self.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.rpm - self.requests.used(now)))
+            headers["x-ratelimit-reset-requests"] = f"{self.requests.reset_after(now):.2f}s"
+        if self.tpm:
+            headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tpm - self.tokens.used(now)))
+            headers["x-ratelimit-reset-tokens"] = f"{self.tokens.reset_after(now):.2f}s"
+        return headers
+
+    def _admit(self, tokens: int) -> Optional[JSONResponse]:
+        """Apply quotas and random error injection; returns an error response or None"""
+        now = time.monotonic()
+        with self.lock:
+            self.counters["requests"] += 1
+            over_rpm = self.rpm and self.requests.used(now) + 1 > self.rpm
+            over_tpm = self.tpm and self.tokens.used(now) + tokens > self.tpm
+            if over_rpm or over_tpm or self.random.random() < self.rate_429:
+                self.counters["rate_limited"] += 1
+                window = self.requests if over_rpm else self.tokens
+                retry_after = max(1, round(window.reset_after(now))) if (over_rpm or over_tpm) else 1
+                headers = {"retry-after": str(retry_after), **self._rate_limit_headers(now)}
+                return JSONResponse(
+                    status_code=429,
+                    headers=headers,
+                    content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                )
+            if self.random.random() < self.rate_5xx:
+                self.counters["server_errors"] += 1
+                return JSONResponse(
+                    status_code=self.random.choice([500, 502, 503]),
+                    content={"error": {"message": "Injected server error", "type": "internal_server_error"}},
+                )
+            self.requests.add(now, 1)
+            self.tokens.add(now, tokens)
+        return None
+
+    async def chat_completions(self, request: Request):
+        payload = await request.json()
+        kind, has_image = prompt_kind(payload)
+        prompt_tokens = len(json.dumps(payload["messages"])) // 4 if not has_image else IMAGE_TOKENS
+        error = self._admit(prompt_tokens + COMPLETION_TOKENS)
+        if error is not None:
+            return error
+
+        latency = self.model_latency.get(payload.get("model"), self.sample_latency)()
+        content = next(self.responses[kind])
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        if payload.get("stream"):
+            return StreamingResponse(
+                self._stream(payload, content, prompt_tokens, latency),
+                media_type="text/event-stream",
+                headers=self._rate_limit_headers(time.monotonic()),
+            )
+
+        self._start_request()
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            self._finish_request()
+        return JSONResponse(
+            headers=self._rate_limit_headers(time.monotonic()),
+            content={
+                "id": f"chatcmpl-mock-{self.counters['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "mock"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": COMPLETION_TOKENS,
+                    "total_tokens": prompt_tokens + COMPLETION_TOKENS,
+                },
+            },
+        )
+
+    def _start_request(self):
+        with self.lock:
+            self.counters["in_flight"] += 1
+            self.counters["max_in_flight"] = max(self.counters["max_in_flight"], self.counters["in_flight"])
+
+    def _finish_request(self):
+        with self.lock:
+            self.counters["in_flight"] -= 1
+            self.counters["ok"] += 1
+
+    async def _stream(self, payload: Dict[str, Any], content: str, prompt_tokens: int, latency: float) -> AsyncIterator[str]:
+        """Chat completion chunks of a streamed answer; usage comes with the last one, as x_groq.usage"""
+        pieces = [content[i:i + STREAM_PIECE_CHARS] for i in range(0, len(content), STREAM_PIECE_CHARS)] or [""]
+        base = {
+            "id": f"chatcmpl-mock-{self.counters['requests']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+        }
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> str:
+            body = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+            return f"data: {json.dumps(body)}\n\n"
+
+        self._start_request()
+        with self.lock:
+            self.counters["streams"] += 1
+        finished = False
+        try:
+            await asyncio.sleep(latency * STREAM_FIRST_TOKEN_SHARE)
+            yield chunk({"role": "assistant", "content": ""})
+            interval = latency * (1 - STREAM_FIRST_TOKEN_SHARE) / len(pieces)
+            for index, piece in enumerate(pieces):
+                if index:
+                    await asyncio.sleep(interval)
+                with self.lock:
+                    self.counters["streamed_pieces"] += 1
+                yield chunk({"content": piece})
+            completion_tokens = len(pieces)  # pieces stand in for tokens
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            yield chunk({}, "stop", x_groq={"id": base["id"], "usage": usage})
+            yield "data: [DONE]\n\n"
+            finished = True
+        finally:
+            with self.lock:
+                self.counters["in_flight"] -= 1
+                self.counters["ok" if finished else "streams_cancelled"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def reset_stats(self):
+        with self.lock:
+            for key in self.counters:
+                if key != "in_flight":
+                    self.counters[key] = 0
+
+
+def create_app(mock: MockGroq) -> FastAPI:
+    app = FastAPI(title="Mock Groq API")
+    app.add_api_route("/openai/v1/chat/completions", mock.chat_completions, methods=["POST"])
+    app.add_api_route("/stats", mock.stats, methods=["GET"])
+    return app
+
+
+class MockGroqServer:
+    """Run the mock API on a background thread (for use by the benchmark driver)"""
+
+    def __init__(self, mock: MockGroq, host: str = "127.0.0.1", port: int = 8100):
+        self.mock = mock
+        self.url = f"http://{host}:{port}"
+        config = uvicorn.Config(create_app(mock), host=host, port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "MockGroqServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default="lognormal:0.8,0.35",
+                        help="Response latency: fixed:S, uniform:LOW,HIGH, normal:MEAN,SD or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Share of requests answered with 500/502/503")
+    parser.add_argument("--rpm", type=int, help="Requests per minute before returning 429")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute before returning 429")
+    parser.add_argument("--responses", type=argparse.FileType("r"), help="JSON file of recorded responses per prompt kind")
+    parser.add_argument("--seed", type=int, help="Random seed for latency and error injection")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+                        help="Latency distribution for one model (repeatable)")
+
+
+def mock_from_arguments(args: argparse.Namespace) -> MockGroq:
+    return MockGroq(
+        latency=args.latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        responses=json.load(args.responses) if args.responses else None,
+        seed=args.seed,
+        model_latency=dict(item.split("=", 1) for item in args.model_latency),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    parse_latency(args.latency)
+    uvicorn.run(create_app(mock_from_arguments(args)), host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+End-to-end throughput benchmark against a local mock Groq server.
+
+For every concurrency level a fresh API process is started (empty database,
+result cache off) with GROQ_BASE_URL pointing at the mock server. Documents
+are pushed through upload -> processing -> GET /{job_id} by that many
+concurrent clients. Completion is awaited over the job's event stream.
+
+Reported per level:
+- docs/sec
+- p50/p95/p99 latency of the upload, processing, LLM and end-to-end stages
+- mean time per pipeline stage, as recorded by the API's /metrics
+- peak RSS of the API process
+- the wait to acquire the SQLite write lock, measured by a probe
+  connection running BEGIN IMMEDIATE while the benchmark runs
+
+Usage (from the backend directory):
+    python -m benchmarks.run_benchmark ../sample_documents.zip --concurrency 1,4,16
+    python -m benchmarks.run_benchmark ../sample_documents.zip --rate-429 0.05 --rate-5xx 0.02
+    python -m benchmarks.run_benchmark ../sample_documents.zip --save-baseline benchmarks/baselines/mock_groq.json
+    python -m benchmarks.run_benchmark ../sample_documents.zip --compare benchmarks/baselines/mock_groq.json
+
+Extra settings for the API process are passed with --app-env KEY=VALUE,
+e.g. --app-env MAX_CONCURRENT_JOBS=8 --app-env PIPELINE_MODE=single_call.
+With --workers N the API only records jobs (JOB_RUNNER=worker) and N
+standalone `python -m app.worker` processes, started with the same
+settings, process them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import collect_documents, distribution
+from benchmarks.mock_groq_server import MockGroqServer, add_mock_arguments, mock_from_arguments
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+TERMINAL_STATUSES = {"completed", "error"}
+LOCK_PROBE_INTERVAL = 0.05  # seconds between write-lock probes
+STARTUP_TIMEOUT = 30  # seconds to wait for the API process to answer /health
+JOB_TIMEOUT = 600  # seconds to wait for one job to finish
+
+
+class LockProbe(threading.Thread):
+    """Repeatedly take and release the SQLite write lock, recording how long acquiring it took"""
+
+    def __init__(self, db_path: Path):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.waits: List[float] = []
+        self.timeouts = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        try:
+            while not self._stop_event.wait(LOCK_PROBE_INTERVAL):
+                started = time.perf_counter()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                except sqlite3.OperationalError:
+                    self.timeouts += 1
+                    continue
+                self.waits.append(time.perf_counter() - started)
+                conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def server_stage_means(url: str) -> Dict[str, float]:
+    """Mean seconds per pipeline stage from the API's /metrics histograms"""
+    try:
+        text = httpx.get(f"{url}/metrics", timeout=5).text
+    except httpx.HTTPError:
+        return {}
+    sums, counts = {}, {}
+    for line in text.splitlines():
+        match = re.match(r'docparser_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)', line)
+        if match:
+            target = sums if match.group(1) == "sum" else counts
+            target[match.group(2)] = float(match.group(3))
+    return {stage: round(sums[stage] / counts[stage], 4) for stage in sorted(sums) if counts.get(stage)}
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """High-water mark of the resident set of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class AppProcess:
+    """The real API, run with uvicorn in a scratch directory, and optionally standalone workers"""
+
+    def __init__(self, workdir: Path, port: int, env: Dict[str, str], workers: int = 0):
+        self.workdir = workdir
+        self.port = port
+        self.workers = workers
+        self.url = f"http://127.0.0.1:{port}"
+        self.db_path = workdir / "benchmark.db"
+        self.env = {
+            **os.environ,
+            "PYTHONPATH": str(BACKEND_DIR),
+            "DATABASE_URL": f"sqlite:///{self.db_path}",
+            "RESULT_CACHE_ENABLED": "false",
+            "RESULT_CACHE_PATH": str(workdir / "result_cache.db"),
+            **env,
+        }
+        if workers:
+            self.env["JOB_RUNNER"] = "worker"
+        self.process: Optional[subprocess.Popen] = None
+        self.worker_processes: List[subprocess.Popen] = []
+
+    def __enter__(self) -> "AppProcess":
+        self.log = open(self.workdir / "app.log", "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.workdir, env=self.env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"API process exited during startup, see {self.workdir / 'app.log'}")
+            try:
+                if httpx.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    self._start_workers()
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("API process did not become healthy in time")
+
+    def _start_workers(self):
+        # Workers share the API's log file and database; each gets its own name on the leases
+        for index in range(self.workers):
+            self.worker_processes.append(subprocess.Popen(
+                [sys.executable, "-m", "app.worker"],
+                cwd=self.workdir, env={**self.env, "WORKER_ID": f"benchmark-worker-{index}"},
+                stdout=self.log, stderr=subprocess.STDOUT,
+            ))
+
+    def __exit__(self, *exc_info):
+        for process in [*self.worker_processes, self.process]:
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        self.log.close()
+
+
+async def wait_for_job(client: httpx.AsyncClient, job_id: str):
+    """Follow the job's event stream until it reaches a terminal status"""
+    async with client.stream("GET", f"/api/documents/{job_id}/events", timeout=JOB_TIMEOUT) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                event = json.loads(line[len("data: "):])
+                if event.get("id") == job_id and event.get("status") in TERMINAL_STATUSES:
+                    return
+
+
+async def run_document(client: httpx.AsyncClient, path: Path, counters: Dict[str, int]) -> Dict[str, Any]:
+    document_id = str(uuid.uuid4())
+    content = path.read_bytes()
+    started = time.perf_counter()
+    while True:
+        response = await client.post(
+            "/api/documents/upload",
+            files={"file": (path.name, content)},
+            data={"original_file_name": path.name, "document_id": document_id},
+        )
+        if response.status_code != 503:
+            break
+        # Queue full: back off as instructed by the server
+        counters["rejected_uploads"] += 1
+        await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+    uploaded = time.perf_counter()
+    if response.status_code != 200:
+        return {"status": f"upload_{response.status_code}", "upload": uploaded - started}
+
+    await wait_for_job(client, document_id)
+    finished = time.perf_counter()
+    job = (await client.get(f"/api/documents/{document_id}")).json()
+    try:
+        pipeline = json.loads(job.get("extracted_fields") or "{}").get("pipeline") or {}
+    except (TypeError, json.JSONDecodeError):
+        pipeline = {}
+    return {
+        "status": job.get("status"),
+        "upload": uploaded - started,
+        "processing": finished - uploaded,
+        "end_to_end": finished - started,
+        "llm": pipeline.get("llm_seconds"),
+        "llm_calls": pipeline.get("llm_calls"),
+    }
+
+
+async def drive(url: str, documents: List[Path], total: int, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    counters = {"rejected_uploads": 0}
+    limits = httpx.Limits(max_connections=concurrency * 2 + 4)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def one(index: int):
+            async with semaphore:
+                return await run_document(client, documents[index % len(documents)], counters)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(total)))
+        wall = time.perf_counter() - started
+    return {"results": results, "wall": wall, **counters}
+
+
+def run_level(args: argparse.Namespace, documents: List[Path], concurrency: int, mock_server: MockGroqServer) -> Dict[str, Any]:
+    app_env = dict(item.split("=", 1) for item in args.app_env)
+    app_env.setdefault("GROQ_API_KEY", "benchmark")
+    app_env["GROQ_BASE_URL"] = mock_server.url
+    mock_server.mock.reset_stats()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with AppProcess(Path(workdir), args.app_port, app_env, args.workers) as app:
+            probe = LockProbe(app.db_path)
+            probe.start()
+            try:
+                outcome = asyncio.run(drive(app.url, documents, args.documents or len(documents) * 3, concurrency))
+            finally:
+                probe.stop()
+            rss = peak_rss_mb(app.process.pid)
+            stage_means = server_stage_means(app.url)
+
+    results = outcome["results"]
+    completed = [r for r in results if r["status"] == "completed"]
+    stages = {
+        stage: distribution([r[stage] for r in results if r.get(stage) is not None])
+        for stage in ("upload", "processing", "llm", "end_to_end")
+    }
+    return {
+        "concurrency": concurrency,
+        "documents": len(results),
+        "completed": len(completed),
+        "errors": len(results) - len(completed),
+        "rejected_uploads": outcome["rejected_uploads"],
+        "wall_seconds": round(outcome["wall"], 3),
+        "docs_per_sec": round(len(completed) / outcome["wall"], 3) if outcome["wall"] else None,
+        "latency_seconds": stages,
+        "server_stage_mean_seconds": stage_means,
+        "peak_rss_mb": rss,
+        "db_lock_wait_ms": distribution(probe.waits, scale=1000),
+        "db_lock_timeouts": probe.timeouts,
+        "llm_api": mock_server.mock.stats(),
+    }
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Describe every level whose throughput fell or p95 latency rose by more than `tolerance`"""
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        label = f"concurrency {level['concurrency']}"
+        if before.get("docs_per_sec") and level["docs_per_sec"] is not None:
+            change = level["docs_per_sec"] / before["docs_per_sec"] - 1
+            print(f"{label}: docs/sec {before['docs_per_sec']} -> {level['docs_per_sec']} ({change:+.1%})")
+            if change < -tolerance:
+                regressions.append(f"{label}: throughput {change:+.1%}")
+        p95_before = ((before.get("latency_seconds") or {}).get("end_to_end") or {}).get("p95")
+        p95_now = ((level.get("latency_seconds") or {}).get("end_to_end") or {}).get("p95")
+        if p95_before and p95_now:
+            change = p95_now / p95_before - 1
+            print(f"{label}: end-to-end p95 {p95_before}s -> {p95_now}s ({change:+.1%})")
+            if change > tolerance:
+                regressions.append(f"{label}: end-to-end p95 {change:+.1%}")
+    return regressions
+
+
+def print_level(level: Dict[str, Any]):
+    e2e = level["latency_seconds"].get("end_to_end") or {}
+    lock = level["db_lock_wait_ms"] or {}
+    print(
+        f"concurrency {level['concurrency']:>3}: {level['docs_per_sec']} docs/s, "
+        f"{level['completed']}/{level['documents']} completed, "
+        f"e2e p50/p95/p99 {e2e.get('p50')}/{e2e.get('p95')}/{e2e.get('p99')}s, "
+        f"peak RSS {level['peak_rss_mb']} MB, lock wait p95 {lock.get('p95')} ms, "
+        f"429s {level['llm_api']['rate_limited']}, 5xx {level['llm_api']['server_errors']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API end to end against a mock Groq server")
+    parser.add_argument("source", type=Path, nargs="?", default=BACKEND_DIR.parent / "sample_documents.zip",
+                        help="Directory of documents or a zip archive")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated client concurrency levels")
+    parser.add_argument("--documents", type=int, help="Documents per level (default: three passes over the corpus)")
+    parser.add_argument("--app-port", type=int, default=8200)
+    parser.add_argument("--mock-port", type=int, default=8100)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Environment variable for the API process (repeatable)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Process jobs in this many standalone worker processes instead of the API process")
+    parser.add_argument("--output", type=Path, help="Write the report as JSON to this file")
+    parser.add_argument("--save-baseline", type=Path, help="Write the report as the new baseline")
+    parser.add_argument("--compare", type=Path, help="Baseline report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Relative change in docs/sec or p95 latency that counts as a regression")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    report: Dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {
+            "source": args.source.name,
+            "latency": args.latency,
+            "rate_429": args.rate_429,
+            "rate_5xx": args.rate_5xx,
+            "rpm": args.rpm,
+            "tpm": args.tpm,
+            "app_env": args.app_env,
+            "workers": args.workers,
+        },
+        "levels": [],
+    }
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        documents = collect_documents(args.source, Path(corpus_dir))
+        if not documents:
+            parser.error(f"No supported documents found in {args.source}")
+        with MockGroqServer(mock_from_arguments(args), port=args.mock_port) as mock_server:
+            for concurrency in levels:
+                level = run_level(args, documents, concurrency, mock_server)
+                print_level(level)
+                report["levels"].append(level)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare_to_baseline(report, json.loads(args.compare.read_text()), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
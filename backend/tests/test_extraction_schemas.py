@@ -0,0 +1,41 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.extraction_schemas import PassportAttributes, UnknownDocAttributes, dump_attributes
+from app.services.structured_output import validate_response
+
+
+def test_near_miss_keys_map_onto_listed_fields():
+    attributes = PassportAttributes.model_validate({
+        "First Name": "Jane",
+        "Middle Name": "Ann",
+        "date of birth": "01/02/1990",
+        "Passport Number": "P1234567",
+    })
+    result = dump_attributes(attributes)
+    assert result["Middle Name (if any)"] == "Ann"
+    assert result["Date of Birth (MM/DD/YYYY)"] == "01/02/1990"
+    assert "Middle Name" not in result
+
+
+def test_near_miss_keys_are_not_kept_as_extra_keys():
+    result = dump_attributes(UnknownDocAttributes.model_validate({"Date of Birth": "01/02/1990", "Employer": "ACME"}))
+    assert result["Date of Birth (MM/DD/YYYY)"] == "01/02/1990"
+    assert "Date of Birth" not in result
+    assert result["Employer"] == "ACME"
+
+
+def test_conflicting_answers_for_one_field_are_rejected():
+    with pytest.raises(ValidationError):
+        PassportAttributes.model_validate({
+            "Date of Birth": "01/02/1990",
+            "Date of Birth (MM/DD/YYYY)": "02/01/1990",
+        })
+
+
+def test_conflicting_answer_asks_for_a_repair():
+    model, problem = validate_response(
+        '{"Date of Birth": "01/02/1990", "Date of Birth (MM/DD/YYYY)": "02/01/1990"}', PassportAttributes
+    )
+    assert model is None
+    assert "Date of Birth (MM/DD/YYYY)" in problem
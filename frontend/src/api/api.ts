@@ -13,6 +13,7 @@ interface UploadResponse {
 interface DocumentResponse {
   id: string;
   status: string;
+  error_code?: string | null;
   document_type: string;
   file_type: string;
   original_filename: string;
@@ -28,6 +29,25 @@ interface RecentDocument {
   created_at: string;
 }
 
+interface RecentDocumentPage {
+  items: RecentDocument[];
+  next_cursor: string | null;
+}
+
+export interface DocumentEvent {
+  type: 'job' | 'partial' | 'deleted' | 'cleared';
+  id?: string;
+  status?: string;
+  error_code?: string | null;
+  document_type?: string | null;
+  file_type?: string;
+  original_filename?: string;
+  created_at?: string | null;
+  extracted_fields?: string | null;
+  // Fields read so far, sent in 'partial' events while the document is processed
+  fields?: Record<string, unknown>;
+}
+
 interface UpdateFieldsResponse {
   id: string;
   status: string;
@@ -81,27 +101,46 @@ export const getDocumentById = async (documentId: string): Promise<DocumentRespo
   }
 };
 
-export const getDocumentContent = async (documentId: string): Promise<string> => {
+// Document files and renditions are served with ETags and Cache-Control, so they are
+// loaded through plain URLs and repeat views are answered from the browser cache (or a 304)
+export const getDocumentContentUrl = (documentId: string): string =>
+  `${API_URL}/api/documents/${documentId}/content`;
+
+export const getDocumentPreviewUrl = (documentId: string): string =>
+  `${API_URL}/api/documents/${documentId}/preview`;
+
+export const getDocumentThumbnailUrl = (documentId: string): string =>
+  `${API_URL}/api/documents/${documentId}/thumbnail`;
+
+export const updateExtractedFields = async (documentId: string, extractedFields: any): Promise<UpdateFieldsResponse> => {
   try {
-    const response = await axios.get<Blob>(`${API_URL}/api/documents/${documentId}/content`, {
-      responseType: 'blob'
+    const response = await axios.put<UpdateFieldsResponse>(`${API_URL}/api/documents/${documentId}`, {
+      extracted_fields_json: extractedFields
     });
-    return URL.createObjectURL(response.data);
+    return response.data;
   } catch (error: any) {
     if (error?.response?.data?.detail) {
       throw new Error(error.response.data.detail);
     } else if (error?.message) {
       throw new Error(error.message);
     } else {
-      throw new Error('Failed to fetch document content');
+      throw new Error('Failed to update extracted fields');
     }
   }
 };
 
-export const updateExtractedFields = async (documentId: string, extractedFields: any): Promise<UpdateFieldsResponse> => {
+export type ReprocessMode = 'auto' | 'extract' | 'identify' | 'full';
+
+interface ReprocessResponse {
+  id: string;
+  status: string;
+  mode: ReprocessMode;
+}
+
+export const reprocessDocument = async (documentId: string, mode: ReprocessMode = 'auto'): Promise<ReprocessResponse> => {
   try {
-    const response = await axios.put<UpdateFieldsResponse>(`${API_URL}/api/documents/${documentId}`, {
-      extracted_fields_json: extractedFields
+    const response = await axios.post<ReprocessResponse>(`${API_URL}/api/documents/${documentId}/reprocess`, null, {
+      params: { mode },
     });
     return response.data;
   } catch (error: any) {
@@ -110,14 +149,16 @@ export const updateExtractedFields = async (documentId: string, extractedFields:
     } else if (error?.message) {
       throw new Error(error.message);
     } else {
-      throw new Error('Failed to update extracted fields');
+      throw new Error('Failed to reprocess document');
     }
   }
 };
 
-export const getRecentDocuments = async (): Promise<RecentDocument[]> => {
+export const getRecentDocuments = async (cursor?: string | null): Promise<RecentDocumentPage> => {
   try {
-    const response = await axios.get<RecentDocument[]>(`${API_URL}/api/documents/recent/list`);
+    const response = await axios.get<RecentDocumentPage>(`${API_URL}/api/documents/recent/list`, {
+      params: cursor ? { cursor } : undefined,
+    });
     return response.data;
   } catch (error: any) {
     if (error?.response?.data?.detail) {
@@ -142,4 +183,56 @@ export const clearAllDocuments = async (): Promise<void> => {
       throw new Error('Failed to clear recent documents');
     }
   }
-}; 
\ No newline at end of file
+};
+
+const TERMINAL_STATUSES = ['completed', 'error'];
+
+// Opens a server-sent event stream. Returns a function that closes it, or null when
+// EventSource is unavailable so callers can fall back to polling.
+const openEventStream = (
+  url: string,
+  onEvent: (event: DocumentEvent) => void,
+  onError: () => void,
+  closeWhen?: (event: DocumentEvent) => boolean
+): (() => void) | null => {
+  if (typeof EventSource === 'undefined') {
+    return null;
+  }
+  const source = new EventSource(url);
+  const handleMessage = (message: MessageEvent) => {
+    const event: DocumentEvent = JSON.parse(message.data);
+    if (closeWhen && closeWhen(event)) {
+      source.close();
+    }
+    onEvent(event);
+  };
+  source.addEventListener('job', handleMessage as EventListener);
+  source.addEventListener('partial', handleMessage as EventListener);
+  source.addEventListener('deleted', handleMessage as EventListener);
+  source.addEventListener('cleared', handleMessage as EventListener);
+  source.onerror = () => {
+    source.close();
+    onError();
+  };
+  return () => source.close();
+};
+
+export const subscribeToDocument = (
+  documentId: string,
+  onEvent: (event: DocumentEvent) => void,
+  onError: () => void
+): (() => void) | null => {
+  return openEventStream(
+    `${API_URL}/api/documents/${documentId}/events`,
+    onEvent,
+    onError,
+    (event) => event.type === 'cleared' || event.type === 'deleted' || TERMINAL_STATUSES.includes(event.status || '')
+  );
+};
+
+export const subscribeToRecentDocuments = (
+  onEvent: (event: DocumentEvent) => void,
+  onError: () => void
+): (() => void) | null => {
+  return openEventStream(`${API_URL}/api/documents/events/recent`, onEvent, onError);
+};
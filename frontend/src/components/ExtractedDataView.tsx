@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import '../styles/ExtractedDataView.css';
 import DocumentHeader from './DocumentHeader';
-import { getDocumentById, updateExtractedFields } from '../api/api';
+import { getDocumentById, updateExtractedFields, subscribeToDocument, reprocessDocument } from '../api/api';
 
 interface ExtractedFieldProps {
   fieldName: string;
@@ -85,6 +85,9 @@ const ExtractedDataView: React.FC<ExtractedDataViewProps> = ({ documentId }) =>
   const [saveLoading, setSaveLoading] = useState<boolean>(false);
   const [saveError, setSaveError] = useState<string | null>(null);
   const [originalExtractedFields, setOriginalExtractedFields] = useState<ExtractionResult | null>(null);
+  const [partialFields, setPartialFields] = useState<Record<string, unknown>>({});
+  // Failures that retaking the photo would not fix, e.g. a model error, can be retried
+  const [retryable, setRetryable] = useState<boolean>(false);
 
   useEffect(() => {
     const fetchExtractedData = async () => {
@@ -97,6 +100,8 @@ const ExtractedDataView: React.FC<ExtractedDataViewProps> = ({ documentId }) =>
 
       setLoading(true);
       setError(null);
+      setRetryable(false);
+      setPartialFields({});
 
       try {
         const response = await getDocumentById(documentId);
@@ -149,7 +154,12 @@ const ExtractedDataView: React.FC<ExtractedDataViewProps> = ({ documentId }) =>
 
           setExtractedData(fieldsArray);
         } else if (response.status === 'error') {
-          setError('Document processing failed');
+          // Rejections by the quality gate carry advice on retaking the image
+          const failure: ExtractionResult = response.error_code && response.extracted_fields
+            ? JSON.parse(response.extracted_fields)
+            : {};
+          setError(failure.error || 'Document processing failed');
+          setRetryable(!response.error_code);
         }
       } catch (err: any) {
         setError(err.message || 'Failed to fetch extracted data');
@@ -160,20 +170,58 @@ const ExtractedDataView: React.FC<ExtractedDataViewProps> = ({ documentId }) =>
 
     fetchExtractedData();
     
-    // If document is still processing, poll for updates every 5 seconds
+    // If document is still processing, wait for the server to push the status change.
+    // Poll every 5 seconds instead if the event stream is unavailable or drops.
     let intervalId: number | null = null;
+    let unsubscribe: (() => void) | null = null;
     
     if (documentId && documentStatus === 'processing') {
-      intervalId = window.setInterval(fetchExtractedData, 5000);
+      const startPolling = () => {
+        if (intervalId === null) {
+          intervalId = window.setInterval(fetchExtractedData, 5000);
+        }
+      };
+      unsubscribe = subscribeToDocument(
+        documentId,
+        (event) => {
+          if (event.type === 'partial') {
+            // Fields streamed in before the result is validated and saved
+            setPartialFields(event.fields || {});
+          } else if (event.status && event.status !== 'processing') {
+            // Changing the status re-runs this effect, which fetches the final fields
+            setDocumentStatus(event.status);
+          }
+        },
+        startPolling
+      );
+      if (unsubscribe === null) {
+        startPolling();
+      }
     }
     
     return () => {
       if (intervalId !== null) {
         clearInterval(intervalId);
       }
+      if (unsubscribe !== null) {
+        unsubscribe();
+      }
     };
   }, [documentId, documentStatus]);
 
+  const handleRetry = async () => {
+    if (!documentId) return;
+    try {
+      await reprocessDocument(documentId);
+      setError(null);
+      // Changing the status subscribes to the job's events again
+      setDocumentStatus('processing');
+    } catch (err: any) {
+      setError(err.message || 'Failed to reprocess document');
+      setRetryable(false);
+    }
+  };
+
   const handleEditToggle = (fieldName: string) => {
     setEditingField(editingField === fieldName ? null : fieldName);
   };
@@ -242,6 +290,9 @@ const ExtractedDataView: React.FC<ExtractedDataViewProps> = ({ documentId }) =>
         <DocumentHeader title="Extracted Data" />
         <div className="ExtractedDataContent">
           <p className="ErrorMessage">{error}</p>
+          {retryable && (
+            <button onClick={handleRetry} className="RetryButton">Retry extraction</button>
+          )}
         </div>
       </div>
     );
@@ -268,6 +319,14 @@ const ExtractedDataView: React.FC<ExtractedDataViewProps> = ({ documentId }) =>
         <DocumentHeader title="Extracted Data" />
         <div className="ExtractedDataContent">
           <p className="StatusMessage">Processing document... This may take a few moments.</p>
+          {Object.entries(partialFields).map(([fieldName, value]) => (
+            <div className="ExtractedField PartialField" key={fieldName}>
+              <div className="ViewMode">
+                <span className="FieldName">{fieldName}</span>
+                <span className="FieldValue">{typeof value === 'object' ? JSON.stringify(value) : String(value)}</span>
+              </div>
+            </div>
+          ))}
         </div>
       </div>
     );
@@ -1,5 +1,5 @@
 import React, { useRef, useState } from 'react';
-import { uploadFile, getDocumentContent } from '../api/api';
+import { uploadFile } from '../api/api';
 import '../styles/FileUploader.css';
 
 interface FileUploaderProps {
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { getDocumentContent, getDocumentById } from '../api/api';
+import { getDocumentById, getDocumentContentUrl, getDocumentPreviewUrl } from '../api/api';
 import '../styles/OriginalDocumentView.css';
 
 interface OriginalDocumentViewProps {
@@ -38,16 +38,17 @@ const OriginalDocumentView: React.FC<OriginalDocumentViewProps> = ({ fileUrl, fi
           if (docDetails.status === 'completed' || docDetails.status === 'processing' || docDetails.status === 'failed') { // also show if processing or failed, to provide feedback
             const backendFileType = docDetails.file_type.toLowerCase(); // Ensure lowercase
             let mimeType = 'application/octet-stream'; // Default if unknown
-            if (['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp'].includes(backendFileType)) {
-              mimeType = `image/${backendFileType === 'jpg' ? 'jpeg' : backendFileType}`;
+            if (['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'avif', 'tif', 'tiff'].includes(backendFileType)) {
+              // Images are shown through the server's downscaled preview rendition, whose
+              // format (PREVIEW_FORMAT) the server picks and sends as its Content-Type
+              mimeType = 'image/*';
             } else if (backendFileType === 'pdf') {
               mimeType = 'application/pdf';
             }
             // Use the derived MIME type
             setCurrentFileType(mimeType); 
             if (docDetails.status === 'completed' || docDetails.status === 'processing') {
-                 const url = await getDocumentContent(documentId);
-                 setDisplayUrl(url);
+                 setDisplayUrl(mimeType === 'application/pdf' ? getDocumentContentUrl(documentId) : getDocumentPreviewUrl(documentId));
             } else if (docDetails.status === 'failed') {
                 setError(`Document processing failed. Cannot display content.`);
             }
@@ -69,14 +70,6 @@ const OriginalDocumentView: React.FC<OriginalDocumentViewProps> = ({ fileUrl, fi
       setError(null);
       setLoading(false);
     }
-
-    // Cleanup function to revoke object URL if displayUrl was created by this component
-    // This is important if getDocumentContent creates a blob URL
-    return () => {
-      if (displayUrl && displayUrl.startsWith('blob:')) {
-        URL.revokeObjectURL(displayUrl);
-      }
-    };
   }, [documentId, fileUrl, fileType]); // Rerun if any of these key identifiers change
 
   if (loading) {
@@ -1,5 +1,13 @@
 import React, { useEffect, useState } from 'react';
-import { getRecentDocuments, getDocumentContent, clearAllDocuments } from '../api/api';
+import {
+  getRecentDocuments,
+  getDocumentContentUrl,
+  getDocumentPreviewUrl,
+  getDocumentThumbnailUrl,
+  clearAllDocuments,
+  subscribeToRecentDocuments,
+  DocumentEvent
+} from '../api/api';
 import '../styles/RecentDocumentList.css';
 
 interface RecentDocument {
@@ -28,13 +36,16 @@ const RecentDocumentList: React.FC<RecentDocumentListProps> = ({ onDocumentSelec
   const [documents, setDocuments] = useState<RecentDocument[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
 
   useEffect(() => {
     const fetchRecentDocuments = async () => {
       try {
         setLoading(true);
-        const recentDocs = await getRecentDocuments();
-        setDocuments(recentDocs);
+        const page = await getRecentDocuments();
+        setDocuments(page.items);
+        setNextCursor(page.next_cursor);
         setError(null);
       } catch (err: any) {
         setError(err.message || 'Failed to load recent documents');
@@ -43,43 +54,101 @@ const RecentDocumentList: React.FC<RecentDocumentListProps> = ({ onDocumentSelec
       }
     };
 
+    const applyEvent = (event: DocumentEvent) => {
+      if (event.type === 'cleared') {
+        setDocuments([]);
+        setNextCursor(null);
+        return;
+      }
+      if (!event.id) {
+        return;
+      }
+      if (event.type === 'deleted') {
+        // Removed by the server's retention policy
+        setDocuments((previous) => previous.filter((doc) => doc.id !== event.id));
+        return;
+      }
+      const updated: RecentDocument = {
+        id: event.id,
+        original_filename: event.original_filename || '',
+        document_type: event.document_type || 'Unknown',
+        status: event.status || 'processing',
+        created_at: event.created_at || new Date().toISOString(),
+      };
+      setDocuments((previous) =>
+        [updated, ...previous.filter((doc) => doc.id !== updated.id)].sort((a, b) =>
+          b.created_at.localeCompare(a.created_at)
+        )
+      );
+    };
+
     fetchRecentDocuments();
     
-    // Set up polling to refresh the list every 30 seconds
-    const intervalId = setInterval(fetchRecentDocuments, 30000);
+    // Apply job updates pushed by the server; fall back to refreshing
+    // the list every 30 seconds if the event stream is unavailable or drops
+    let intervalId: number | null = null;
+    const startPolling = () => {
+      if (intervalId === null) {
+        fetchRecentDocuments();
+        intervalId = window.setInterval(fetchRecentDocuments, 30000);
+      }
+    };
+    const unsubscribe = subscribeToRecentDocuments(applyEvent, startPolling);
+    if (unsubscribe === null) {
+      startPolling();
+    }
     
-    return () => clearInterval(intervalId);
+    return () => {
+      if (intervalId !== null) {
+        clearInterval(intervalId);
+      }
+      if (unsubscribe !== null) {
+        unsubscribe();
+      }
+    };
   }, []);
 
   const handleClearAllExtractions = async () => {
     try {
       await clearAllDocuments();
       setDocuments([]);
+      setNextCursor(null);
       setError(null);
     } catch (err: any) {
       setError(err.message || 'Failed to clear recent documents');
     }
   };
 
-  const handleDocumentClick = async (document: RecentDocument) => {
+  const handleLoadMore = async () => {
+    if (!nextCursor) {
+      return;
+    }
     try {
-      // Get the document content URL
-      const fileUrl = await getDocumentContent(document.id);
-      
-      // Determine file type from original filename
-      const fileExtension = document.original_filename.split('.').pop()?.toLowerCase() || '';
-      let fileType = 'application/octet-stream'; // Default type
-      
-      if (['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp'].includes(fileExtension)) {
-        fileType = `image/${fileExtension === 'jpg' ? 'jpeg' : fileExtension}`;
-      } else if (fileExtension === 'pdf') {
-        fileType = 'application/pdf';
-      }
-      
-      // Call the parent component's handler
-      onDocumentSelect(document.id, fileUrl, document.original_filename, fileType);
+      setLoadingMore(true);
+      const page = await getRecentDocuments(nextCursor);
+      setDocuments((previous) => {
+        const known = new Set(previous.map((doc) => doc.id));
+        return [...previous, ...page.items.filter((doc) => !known.has(doc.id))];
+      });
+      setNextCursor(page.next_cursor);
     } catch (err: any) {
-      setError(err.message || 'Failed to load document');
+      setError(err.message || 'Failed to load more documents');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const handleDocumentClick = (document: RecentDocument) => {
+    // Determine file type from original filename
+    const fileExtension = document.original_filename.split('.').pop()?.toLowerCase() || '';
+
+    // PDFs open in the browser viewer from the original file; images use the
+    // preview rendition, in whatever format the server is configured to render.
+    // Both are plain URLs the browser cache can revalidate.
+    if (fileExtension === 'pdf') {
+      onDocumentSelect(document.id, getDocumentContentUrl(document.id), document.original_filename, 'application/pdf');
+    } else {
+      onDocumentSelect(document.id, getDocumentPreviewUrl(document.id), document.original_filename, 'image/*');
     }
   };
 
@@ -123,6 +192,15 @@ const RecentDocumentList: React.FC<RecentDocumentListProps> = ({ onDocumentSelec
             className={`DocumentListItem ${doc.status}`}
             onClick={() => doc.status === 'completed' ? handleDocumentClick(doc) : null}
           >
+            {doc.status === 'completed' && (
+              <img
+                src={getDocumentThumbnailUrl(doc.id)}
+                alt=""
+                loading="lazy"
+                className="DocumentThumbnail"
+                onError={(event) => { event.currentTarget.style.display = 'none'; }}
+              />
+            )}
             <div className="DocumentTitle">{doc.original_filename}</div>
             <div className="DocumentMeta">
               <span className="DocumentType">{doc.document_type || 'Unknown'}</span>
@@ -132,6 +210,11 @@ const RecentDocumentList: React.FC<RecentDocumentListProps> = ({ onDocumentSelec
           </li>
         ))}
       </ul>
+      {nextCursor && (
+        <button onClick={handleLoadMore} className="LoadMoreButton" disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 };